@@ -5,38 +5,48 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import streamlit as st
 import pydeck as pdk
 
-from src.route_generator import generar_ruta
-import geopandas as gpd
+from src.replanning import PlanRuta
+from src.route_cache import get_route_cache, iter_ruta_cached
 import datetime as dt
 import pandas as pd
 
 from src.route_form import get_user_inputs
 from src.geocode import geocode_location
-from src.data_loader import load_monuments, load_buses, load_metro, load_fonts
+from src.data_loader import load_monuments
+from src.profiling import Profiler
+from src.map_layers import point_layer
+from src.service import RoutingClient, ServiceError
 
-# al comienzo de streamlit_app.py
-import osmnx as ox
-import networkx as nx
-import streamlit as st
-
-GRAPH_PATH = "data/walk_graph.graphml"
+from src.walk_graph import GRAPHML_PATH, CSR_DIR, is_fresh, load_walk_csr
 
 @st.cache_resource(show_spinner="Cargando red peatonal …")
-def load_walk_graph():
-    if os.path.exists(GRAPH_PATH):
-        return ox.load_graphml(GRAPH_PATH)
-    G = ox.graph_from_place("Valencia, Spain", network_type="walk", simplify=True)
-    ox.save_graphml(G, GRAPH_PATH)          # guarda para futuros arranques
-    return G
-
-G = load_walk_graph()
+def load_walk_router():
+    """Enrutador peatonal, creado la primera vez que se necesita (no al importar)."""
+    from src.route_generator import access_grid
+    from src.walk_routing import WalkRouter
+
+    if not GRAPHML_PATH.exists() and not is_fresh(CSR_DIR, GRAPHML_PATH):
+        import osmnx as ox  # solo para la descarga inicial: tarda varios segundos en importarse
+
+        G = ox.graph_from_place("Valencia, Spain", network_type="walk", simplify=True)
+        ox.save_graphml(G, GRAPHML_PATH)          # guarda para futuros arranques
+    router = WalkRouter(load_walk_csr())          # CSR binario, se regenera si cambia el GraphML
+    router.grid = access_grid()                   # el alojamiento se ajusta por celda, sin KD-tree
+    gdf = cargar_monumentos()
+    router.snap_many(list(zip(gdf["lon"], gdf["lat"])))  # monumentos ajustados una sola vez
+    return router
+
+@st.cache_resource(show_spinner="Cargando monumentos …")
+def cargar_monumentos():
+    """Monumentos con la columna "tipo"; se leen después de pintar la cabecera, una vez por proceso."""
+    return load_monuments()
+
+# Con VALENCIA_ROUTING_URL la planificación y los caminos los resuelve ``python -m src.service``
+SERVICIO = RoutingClient(os.environ["VALENCIA_ROUTING_URL"]) if os.environ.get("VALENCIA_ROUTING_URL") else None
 
 def shortest_walk_path(coord1, coord2):
     """Devuelve la lista [[lon, lat], …] que sigue la calle a pie entre dos puntos."""
-    orig = ox.nearest_nodes(G, coord1[0], coord1[1])  # lon, lat
-    dest = ox.nearest_nodes(G, coord2[0], coord2[1])
-    nodes = nx.shortest_path(G, orig, dest, weight="length")
-    return [[G.nodes[n]["x"], G.nodes[n]["y"]] for n in nodes]
+    return load_walk_router().path(coord1, coord2)
 
 
 
@@ -52,9 +62,17 @@ show_monuments = st.sidebar.checkbox("🏛️ Monumentos turísticos", value=Tru
 show_buses = st.sidebar.checkbox("🚌 Paradas EMT", value=False)
 show_metro = st.sidebar.checkbox("🚇 Estaciones Metro/FGV", value=False)
 show_fonts = st.sidebar.checkbox("💧 Fuentes de agua", value=False)
+show_progress = st.sidebar.checkbox("⏱️ Mostrar la ruta según se calcula", value=True)
+show_profile = st.sidebar.checkbox("📊 Perfil de rendimiento", value=False)
+
+# Perfil de esta ejecución (cada rerun es una petición); sin marcar no mide nada
+perfil = Profiler().start() if show_profile else None
+
+# Cargar el GeoJSON definitivo con la columna "tipo" (con la cabecera y la barra lateral ya pintadas)
+gdf_monumentos = cargar_monumentos()
 
 # Obtener inputs del usuario
-user_inputs = get_user_inputs()
+user_inputs = get_user_inputs(gdf_monumentos)
 
 # Geocodificar dirección
 location = None
@@ -64,17 +82,13 @@ if user_inputs["direccion"]:
 # Inicializar capas
 layers = []
 
-# Cargar el GeoJSON definitivo con la columna "tipo"
-gdf_monumentos = gpd.read_file("data/raw/monuments.geojson")
-
 if st.sidebar.button("✨ Generar ruta"):
     
     if not location:
         st.error("Debes introducir una dirección de alojamiento válida antes de generar la ruta.")
     else:
         start_coord = (location[0], location[1])  # lat, lon
-        itin = generar_ruta(
-            gdf_monumentos=gdf_monumentos,
+        peticion = dict(
             start_coord=start_coord,
             inicio_hora=user_inputs["hora_inicio"],
             fin_hora=user_inputs["hora_fin"],
@@ -88,7 +102,68 @@ if st.sidebar.button("✨ Generar ruta"):
         # 2) MOSTRAR ITINERARIO EN TABLA
         # ------------------------------------------------------------------
         st.subheader("📋 Itinerario propuesto")
-        st.dataframe(pd.DataFrame(itin))
+        tabla_ph = st.empty()
+        # La caché planifica desde el centro de la celda del alojamiento; el plan de la sesión
+        # también, para que sus decisiones sirvan al replanificar y coincidan con la caché
+        _, centro = get_route_cache().quantize(start_coord)
+        plan = PlanRuta(gdf_monumentos, dict(peticion, start_coord=centro), previo=st.session_state.get("plan_ruta"))
+        if SERVICIO is not None:
+            # cliente ligero: el servicio planifica y la app solo pinta
+            try:
+                itin = SERVICIO.ruta({
+                    "start": list(start_coord),
+                    "inicio": peticion["inicio_hora"].strftime("%H:%M"),
+                    "fin": peticion["fin_hora"].strftime("%H:%M"),
+                    "imprescindibles": list(peticion["imprescindibles"]),
+                    "preferencias": list(peticion["preferencias_tipo"]),
+                    "transporte": peticion["transporte"],
+                    "pausa_comida": peticion["incluir_pausa_comida"],
+                })
+            except ServiceError as e:
+                st.error(f"No se pudo calcular la ruta: {e}")
+                st.stop()
+            tabla_ph.dataframe(pd.DataFrame(itin))
+        else:
+            if plan.reutilizados:
+                # retoque de la ruta anterior de la sesión: solo se rehace lo que cambia
+                pasos = ({**p, "lat": start_coord[0], "lon": start_coord[1]}
+                         if (p["lat"], p["lon"]) == centro else p for p in plan)
+            else:
+                # ruta nueva: reruns y peticiones repetidas (de cualquier sesión) salen de la caché
+                pasos = iter_ruta_cached(gdf_monumentos, **peticion, registro=plan.decisiones)
+            if show_progress:
+                # Cada paso se añade a la tabla y su tramo al mapa en cuanto se decide
+                mapa_ph = st.empty()
+                router = load_walk_router()
+                itin, camino, previo = [], [], None
+                for paso in pasos:
+                    itin.append(paso)
+                    tabla_ph.dataframe(pd.DataFrame(itin))
+                    punto = (paso["lon"], paso["lat"])
+                    if previo is not None and punto != previo:
+                        seg = router.path(previo, punto)
+                        camino.extend(seg if not camino else seg[1:])
+                    previo = punto
+                    mapa_ph.pydeck_chart(pdk.Deck(
+                        map_style="road",
+                        initial_view_state=pdk.ViewState(latitude=start_coord[0], longitude=start_coord[1], zoom=13),
+                        layers=[
+                            pdk.Layer("PathLayer", data=[{"path": camino}], get_path="path",
+                                      get_width=6, get_color=[128, 128, 128]),
+                            pdk.Layer("ScatterplotLayer",
+                                      data=[{"lon": p["lon"], "lat": p["lat"], "tooltip": p["nombre"]} for p in itin],
+                                      get_position=["lon", "lat"], get_color=[30, 144, 255],
+                                      get_radius=45, pickable=True),
+                        ],
+                        tooltip={"text": "{tooltip}"},
+                    ))
+                mapa_ph.empty()  # el mapa completo, con el resto de capas, se pinta al final
+            else:
+                itin = list(pasos)
+                tabla_ph.dataframe(pd.DataFrame(itin))
+        plan.pasos = itin  # con la coordenada real del alojamiento, para los caminos
+        if SERVICIO is None:
+            st.session_state["plan_ruta"] = plan
         
         # ------------------------------------------------------------------
         # 3) DIBUJAR RUTA EN EL MAPA
@@ -111,16 +186,16 @@ if st.sidebar.button("✨ Generar ruta"):
             return COLOR_MAP["a"]
 
         itin_pd["color"] = itin_pd["tipo"].apply(pick_color)
-        itin_coords = [
-        (row.lon, row.lat)
-        for _, row in itin_pd.iterrows()
-        if pd.notnull(row.lat) and pd.notnull(row.lon)
-        ]
-        
         full_path = []
-        if len(itin_coords) > 1:
-            for p1, p2 in zip(itin_coords[:-1], itin_coords[1:]):
-                seg = shortest_walk_path(p1, p2)  # lista [lon, lat]
+        if len(plan.coords) > 1:
+            if SERVICIO is not None:
+                try:
+                    segs = SERVICIO.caminos(plan.coords)
+                except ServiceError:
+                    segs = [[list(a), list(b)] for a, b in zip(plan.coords[:-1], plan.coords[1:])]
+            else:
+                segs = plan.geometria(load_walk_router())  # tramos sin cambios: camino del plan anterior
+            for seg in segs:
                 full_path.extend(seg if not full_path else seg[1:])
         
             path_layer = pdk.Layer(
@@ -158,55 +233,6 @@ if location:
         pickable=True
     ))
 
-# Añadir capas según selección
-if show_monuments:
-    gdf = load_monuments()
-    gdf["tooltip"] = gdf["nombre"]
-    layers.append(pdk.Layer(
-        "ScatterplotLayer",
-        data=gdf,
-        get_position=["lon", "lat"],
-        get_color=[255, 100, 100],
-        get_radius=20,
-        pickable=True
-    ))
-
-if show_buses:
-    gdf = load_buses()
-    gdf["tooltip"] = "Parada EMT"
-    layers.append(pdk.Layer(
-        "ScatterplotLayer",
-        data=gdf,
-        get_position=["lon", "lat"],
-        get_color=[0, 100, 255],
-        get_radius=15,
-        pickable=True
-    ))
-
-if show_metro:
-    gdf = load_metro()
-    gdf["tooltip"] = gdf["nombre"]
-    layers.append(pdk.Layer(
-        "ScatterplotLayer",
-        data=gdf,
-        get_position=["lon", "lat"],
-        get_color=[160, 32, 240],
-        get_radius=20,
-        pickable=True
-    ))
-
-if show_fonts:
-    gdf = load_fonts()
-    gdf["tooltip"] = "Fuente de agua"
-    layers.append(pdk.Layer(
-        "ScatterplotLayer",
-        data=gdf,
-        get_position=["lon", "lat"],
-        get_color=[0, 255, 0],
-        get_radius=10,
-        pickable=True
-    ))
-
 # Configurar vista del mapa
 if location:
     view_lat, view_lon = location
@@ -217,6 +243,13 @@ else:
     zoom_level = 12
     if user_inputs["direccion"]:
         st.warning("No se pudo localizar la dirección proporcionada.")
+vista = (view_lat, view_lon, zoom_level)
+
+# Añadir capas según selección: registros mínimos, recortados a la vista y reutilizados entre reruns
+for capa, visible in (("monuments", show_monuments), ("buses", show_buses),
+                      ("metro", show_metro), ("fonts", show_fonts)):
+    if visible:
+        layers.append(point_layer(capa, vista))
 
 # Mostrar el mapa
 if layers:
@@ -233,3 +266,15 @@ if layers:
     ))
 else:
     st.info("Activa al menos una capa en el menú lateral para ver el mapa.")
+
+# La página ya está pintada: se prepara la red peatonal para la primera ruta
+if SERVICIO is None:
+    load_walk_router()
+
+if perfil is not None:
+    perfil.stop()
+    st.sidebar.subheader("📊 Tiempo por etapa")
+    st.sidebar.caption(f"Total de la ejecución: {perfil.wall_s * 1000:.0f} ms")
+    st.sidebar.dataframe(pd.DataFrame(perfil.summary()), hide_index=True)
+    st.sidebar.download_button("Descargar perfil (JSON)", perfil.to_json(),
+                               file_name="perfil.json", mime="application/json")
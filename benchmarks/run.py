@@ -0,0 +1,311 @@
+# benchmarks/run.py
+"""Banco de pruebas reproducible del planificador sobre datos sintéticos.
+
+Cada escenario genera (una vez, con semilla fija) su juego de GeoJSON en
+``benchmarks/.data/<escenario>/raw`` y se mide en un proceso nuevo con
+``VALENCIA_DATA_DIR`` apuntando a él, de modo que las cargas en frío, las
+cachés por proceso y la memoria máxima son las de un arranque real.
+
+Se mide:
+
+* cargadores: GeoJSON en frío (incluye escribir el Parquet), Parquet y copia en memoria;
+* ``nearest_stop`` y ``get_public_transport_time`` entre puntos aleatorios;
+* ``generar_ruta`` para cada presupuesto de horas, en frío y ya caliente;
+* visitas del motor optimizado frente al voraz con las mismas peticiones,
+  a pie y con transporte;
+* pico de memoria Python (``tracemalloc``), bloques retenidos y RSS máximo.
+
+Uso::
+
+    python -m benchmarks.run                          # escenarios por defecto
+    python -m benchmarks.run --scenarios xs m-stops   # algunos
+    python -m benchmarks.run --all                    # todos (los grandes tardan y piden varios GB)
+    python -m benchmarks.run --save-baseline          # guarda benchmarks/baseline.json
+    python -m benchmarks.run --compare                # compara con la línea base
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).parent
+ROOT_DIR = BENCH_DIR.parent
+DATA_ROOT = BENCH_DIR / ".data"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+REGRESSION_RATIO = 1.25  # más lento que la línea base por encima de este factor → aviso
+
+# nombre → (monumentos, paradas de bus, presupuestos en horas desde las 09:00)
+SCENARIOS: Dict[str, tuple] = {
+    "xs": (50, 1000, (4, 9)),
+    "s": (200, 2000, (4, 9)),
+    "m": (1000, 5000, (4, 9, 12)),
+    "m-stops": (1000, 20000, (9,)),
+    "l": (3000, 20000, (9,)),
+    "xl": (10000, 50000, (9,)),
+    "regional": (50000, 20000, (9,)),  # catálogo regional: se planifica por barrios (poi_clusters)
+}
+DEFAULT_SCENARIOS = ("xs", "s", "m", "m-stops")
+
+N_POINT_QUERIES = 300   # consultas de nearest_stop / get_public_transport_time
+N_ROUTES = 8            # rutas por presupuesto (la primera, en frío)
+
+
+def _percentiles(samples_s: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s) * 1000
+    return {"n": len(ms), "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p90_ms": round(float(np.percentile(ms, 90)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "max_ms": round(float(ms.max()), 3)}
+
+
+def _visits(itin) -> int:
+    return sum(1 for p in itin if not p["nombre"].startswith(("Tramo hacia", "Retorno", "Pausa")))
+
+
+def _timeit(fn, args_list) -> List[float]:
+    out = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+# ------------------------
+# Proceso hijo: mide un escenario
+# ------------------------
+def measure(name: str) -> Dict:
+    import resource
+    import tracemalloc
+
+    from benchmarks.synthetic import BBOX, CENTER
+    from src import data_loader
+    from src import route_generator as rg
+
+    _, _, budgets = SCENARIOS[name]
+    rng = np.random.default_rng(1)
+    result: Dict = {"scenario": name}
+
+    # --- cargadores (el import de geopandas no cuenta como carga) ---
+    import geopandas  # noqa: F401
+    loaders = {}
+    for layer in data_loader.DATASETS:
+        registry = data_loader.DatasetRegistry()
+        t0 = time.perf_counter()
+        registry.get(layer)
+        cold = time.perf_counter() - t0
+        registry.clear()
+        t0 = time.perf_counter()
+        registry.get(layer)
+        parquet = time.perf_counter() - t0
+        warm = _timeit(registry.get, [(layer,)] * 50)
+        loaders[layer] = {"geojson_ms": round(cold * 1000, 2), "parquet_ms": round(parquet * 1000, 2),
+                          "cached": _percentiles(warm)}
+    result["loaders"] = loaders
+
+    gdf = data_loader.load_monuments()
+    result["sizes"] = {"monuments": len(gdf), "bus_stops": len(rg.bus_index()),
+                       "metro_stations": len(rg.metro_index())}
+
+    # --- consultas puntuales ---
+    def random_points(n):
+        return list(zip(rng.uniform(*BBOX["lat"], n), rng.uniform(*BBOX["lon"], n)))
+
+    pts = random_points(N_POINT_QUERIES)
+    result["nearest_stop"] = _percentiles(_timeit(
+        rg.nearest_stop, [(rg.bus_index(), lon, lat) for lat, lon in pts]))
+    pairs = list(zip(random_points(N_POINT_QUERIES), random_points(N_POINT_QUERIES)))
+    result["get_public_transport_time"] = _percentiles(_timeit(
+        rg.get_public_transport_time, [(o, d, "ambos") for o, d in pairs]))
+
+    # --- rutas ---
+    starts = [(CENTER[0] + dlat, CENTER[1] + dlon)
+              for dlat, dlon in zip(rng.normal(0, 0.01, N_ROUTES), rng.normal(0, 0.012, N_ROUTES))]
+    routes = {}
+    for hours in budgets:
+        fin = dt.time(min(9 + hours, 23), 0)
+        samples, visits = [], []
+        for start in starts:
+            t0 = time.perf_counter()
+            itin = rg.generar_ruta(gdf, start, dt.time(9, 0), fin, [], [], "ambos")
+            samples.append(time.perf_counter() - t0)
+            visits.append(_visits(itin))
+        routes[f"{hours}h"] = dict(_percentiles(samples[1:]), first_ms=round(samples[0] * 1000, 2),
+                                   visits_mean=round(float(np.mean(visits)), 2))
+    result["generar_ruta"] = routes
+
+    # --- motores: mismas peticiones con el voraz y con el optimizado ---
+    engines = {}
+    for transporte in ("ninguno", "ambos"):
+        visits = {"greedy": [], "optimized": []}
+        for start in starts:
+            for engine, out in visits.items():
+                out.append(_visits(rg.generar_ruta(gdf, start, dt.time(9, 0), dt.time(18, 0), [], [],
+                                                   transporte, engine=engine)))
+        greedy, optimized = np.asarray(visits["greedy"]), np.asarray(visits["optimized"])
+        engines[transporte] = {"greedy_visits_mean": round(float(greedy.mean()), 2),
+                               "optimized_visits_mean": round(float(optimized.mean()), 2),
+                               "optimized_better": int((optimized > greedy).sum()),
+                               "optimized_worse": int((optimized < greedy).sum())}
+    result["engines"] = engines
+
+    # --- memoria: una ruta nueva (otro punto de partida) bajo tracemalloc ---
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    rg.generar_ruta(gdf, (CENTER[0] + 0.02, CENTER[1] - 0.02), dt.time(9, 0), dt.time(18, 0), [], [], "ambos")
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    result["memory"] = {
+        "route_peak_kib": round(peak / 1024, 1),
+        "route_blocks_retained": int(sum(s.count_diff for s in diff)),
+        "process_max_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    return result
+
+
+# ------------------------
+# Proceso padre: genera datos, lanza hijos, compara
+# ------------------------
+def _prepare(name: str, regenerate: bool = False) -> Path:
+    from benchmarks.synthetic import generate
+
+    n_monuments, n_stops, _ = SCENARIOS[name]
+    base = DATA_ROOT / name
+    raw = base / "raw"
+    if regenerate or not (raw / "monuments.geojson").exists():
+        shutil.rmtree(base, ignore_errors=True)
+        generate(raw, n_monuments, n_stops, seed=0)
+    shutil.rmtree(base / "processed", ignore_errors=True)  # siempre en frío
+    return raw
+
+
+def run_scenario(name: str, regenerate: bool = False) -> Dict:
+    raw = _prepare(name, regenerate)
+    env = dict(os.environ, VALENCIA_DATA_DIR=str(raw), PYTHONPATH=str(ROOT_DIR))
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.run", "--child", name],
+                          cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"scenario": name, "error": (proc.stderr.strip().splitlines() or ["sin salida"])[-1]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["wall_s"] = round(time.perf_counter() - t0, 2)
+    return result
+
+
+def _metrics(result: Dict) -> Dict[str, float]:
+    """Métricas comparables (ms) de un escenario."""
+    out = {}
+    for layer, m in result.get("loaders", {}).items():
+        out[f"loaders.{layer}.parquet_ms"] = m["parquet_ms"]
+    for key in ("nearest_stop", "get_public_transport_time"):
+        if key in result:
+            out[f"{key}.p50_ms"] = result[key]["p50_ms"]
+            out[f"{key}.p90_ms"] = result[key]["p90_ms"]
+    for budget, m in result.get("generar_ruta", {}).items():
+        out[f"generar_ruta.{budget}.first_ms"] = m["first_ms"]
+        out[f"generar_ruta.{budget}.p50_ms"] = m["p50_ms"]
+    if "memory" in result:
+        out["memory.route_peak_kib"] = result["memory"]["route_peak_kib"]
+    return out
+
+
+def compare(results: List[Dict], baseline: Dict) -> List[str]:
+    """Líneas con las métricas que empeoran más de ``REGRESSION_RATIO``."""
+    base = {r["scenario"]: r for r in baseline.get("results", [])}
+    lines = []
+    for result in results:
+        old = base.get(result["scenario"])
+        if old is None or "error" in result:
+            continue
+        before, now = _metrics(old), _metrics(result)
+        for key, value in now.items():
+            ref = before.get(key)
+            if ref and value > ref * REGRESSION_RATIO:
+                lines.append(f"{result['scenario']}: {key} {ref:.2f} → {value:.2f} (×{value / ref:.2f})")
+    return lines
+
+
+def _print(result: Dict) -> None:
+    name = result["scenario"]
+    if "error" in result:
+        print(f"[{name}] ERROR: {result['error']}")
+        return
+    sizes = result["sizes"]
+    print(f"[{name}] {sizes['monuments']} monumentos, {sizes['bus_stops']} paradas, "
+          f"{sizes['metro_stations']} estaciones ({result['wall_s']} s)")
+    loads = ", ".join(f"{k} {v['geojson_ms']:.0f}/{v['parquet_ms']:.0f} ms" for k, v in result["loaders"].items())
+    print(f"  carga GeoJSON/Parquet: {loads}")
+    for key in ("nearest_stop", "get_public_transport_time"):
+        m = result[key]
+        print(f"  {key}: p50 {m['p50_ms']} ms, p90 {m['p90_ms']} ms, p99 {m['p99_ms']} ms")
+    for budget, m in result["generar_ruta"].items():
+        print(f"  generar_ruta {budget}: primera {m['first_ms']} ms, p50 {m['p50_ms']} ms, "
+              f"p90 {m['p90_ms']} ms, {m['visits_mean']} visitas")
+    for transporte, m in result.get("engines", {}).items():
+        print(f"  motores ({transporte}, 9 h): voraz {m['greedy_visits_mean']} visitas, "
+              f"optimizado {m['optimized_visits_mean']} (mejor en {m['optimized_better']}, "
+              f"peor en {m['optimized_worse']} de {N_ROUTES})")
+    mem = result["memory"]
+    print(f"  memoria: pico ruta {mem['route_peak_kib']} KiB, {mem['route_blocks_retained']} bloques retenidos, "
+          f"RSS máx {mem['process_max_rss_mib']} MiB")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=None)
+    parser.add_argument("--all", action="store_true", help="todos los escenarios, incluidos los grandes")
+    parser.add_argument("--regenerate", action="store_true", help="vuelve a generar los datos sintéticos")
+    parser.add_argument("--output", type=Path, default=None, help="guarda los resultados en JSON")
+    parser.add_argument("--save-baseline", action="store_true", help=f"escribe {BASELINE_PATH.name}")
+    parser.add_argument("--compare", action="store_true", help=f"compara con {BASELINE_PATH.name}")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.child)))
+        return 0
+
+    names = list(SCENARIOS) if args.all else (args.scenarios or list(DEFAULT_SCENARIOS))
+    results = []
+    for name in names:
+        result = run_scenario(name, args.regenerate)
+        _print(result)
+        results.append(result)
+
+    report = {"created": dt.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(), "machine": platform.machine(),
+              "cpus": os.cpu_count(), "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.save_baseline:
+        BASELINE_PATH.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"Línea base guardada en {BASELINE_PATH}")
+    if args.compare:
+        if not BASELINE_PATH.exists():
+            print("No hay línea base: ejecuta antes con --save-baseline")
+            return 1
+        regressions = compare(results, json.loads(BASELINE_PATH.read_text()))
+        for line in regressions:
+            print(f"REGRESIÓN {line}")
+        if regressions:
+            return 1
+        print("Sin regresiones respecto a la línea base")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
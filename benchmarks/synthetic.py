@@ -0,0 +1,126 @@
+# benchmarks/synthetic.py
+"""Datos sintéticos con la forma de los de ``data/raw`` en la caja de València.
+
+Los monumentos se concentran alrededor de varios núcleos (como Ciutat Vella y
+los barrios), las paradas de bus se colocan a lo largo de líneas que avanzan
+por la ciudad con una separación de unos 300 m, y el metro sigue el mismo
+esquema con menos líneas y estaciones más separadas. Todo depende de una
+semilla: dos ejecuciones generan exactamente los mismos ficheros.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Caja aproximada del término municipal de València
+BBOX = {"lon": (-0.432, -0.325), "lat": (39.425, 39.505)}
+CENTER = (39.4745, -0.3768)  # lat, lon
+TIPOS = ("Edificios históricos", "Iglesias", "Museos", "Jardines", "Plazas", "Arte urbano")
+
+_M_PER_DEG_LAT = 111320.0
+_M_PER_DEG_LON = _M_PER_DEG_LAT * np.cos(np.radians(CENTER[0]))
+
+
+def _clip(lat, lon):
+    return (np.clip(lat, *BBOX["lat"]), np.clip(lon, *BBOX["lon"]))
+
+
+def _feature(lon: float, lat: float, props: dict) -> dict:
+    props = dict(props, geo_point_2d={"lon": lon, "lat": lat})
+    return {"type": "Feature", "properties": props,
+            "geometry": {"type": "Point", "coordinates": [lon, lat]}}
+
+
+def _write(path: Path, features) -> None:
+    data = {"type": "FeatureCollection",
+            "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"}},
+            "features": features}
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False)
+
+
+def monuments(n: int, rng: np.random.Generator) -> list:
+    """``n`` monumentos repartidos en núcleos gaussianos (el mayor, en el centro)."""
+    n_hubs = max(3, n // 150)
+    hubs_lat = np.concatenate([[CENTER[0]], rng.uniform(*BBOX["lat"], n_hubs - 1)])
+    hubs_lon = np.concatenate([[CENTER[1]], rng.uniform(*BBOX["lon"], n_hubs - 1)])
+    weights = np.concatenate([[0.4], np.full(n_hubs - 1, 0.6 / (n_hubs - 1))])
+    hub = rng.choice(n_hubs, size=n, p=weights)
+    sigma_m = np.where(hub == 0, 700.0, 400.0)
+    lat, lon = _clip(hubs_lat[hub] + rng.normal(0, 1, n) * sigma_m / _M_PER_DEG_LAT,
+                     hubs_lon[hub] + rng.normal(0, 1, n) * sigma_m / _M_PER_DEG_LON)
+    tipo = rng.choice(len(TIPOS), size=n)
+    return [_feature(float(lon[i]), float(lat[i]),
+                     {"gid": i + 1, "nombre": f"MONUMENTO {i + 1:05d}", "tipo": TIPOS[tipo[i]]})
+            for i in range(n)]
+
+
+def _lines(n_stops: int, stops_per_line: int, spacing_m: float, rng: np.random.Generator):
+    """Paradas a lo largo de líneas con rumbo que cambia poco a poco: (lat, lon, línea)."""
+    n_lines = max(1, int(np.ceil(n_stops / stops_per_line)))
+    out = []
+    for line in range(n_lines):
+        lat, lon = rng.uniform(*BBOX["lat"]), rng.uniform(*BBOX["lon"])
+        heading = rng.uniform(0, 2 * np.pi)
+        for _ in range(stops_per_line):
+            if len(out) >= n_stops:
+                break
+            out.append((lat, lon, line + 1))
+            heading += rng.normal(0, 0.35)
+            step = spacing_m * rng.uniform(0.7, 1.3)
+            lat += np.sin(heading) * step / _M_PER_DEG_LAT
+            lon += np.cos(heading) * step / _M_PER_DEG_LON
+            if not (BBOX["lat"][0] <= lat <= BBOX["lat"][1] and BBOX["lon"][0] <= lon <= BBOX["lon"][1]):
+                heading += np.pi  # rebota en el borde de la caja
+                lat, lon = (float(v) for v in _clip(lat, lon))
+    return out
+
+
+def _share_lines(points, radius_m: float):
+    """Líneas de cada parada, más las de paradas de otras líneas a menos de ``radius_m``."""
+    from scipy.spatial import cKDTree
+
+    xy = np.column_stack([[p[0] * _M_PER_DEG_LAT for p in points], [p[1] * _M_PER_DEG_LON for p in points]])
+    lines = [{p[2]} for p in points]
+    for i, j in cKDTree(xy).query_pairs(radius_m):
+        lines[i].add(points[j][2])
+        lines[j].add(points[i][2])
+    return [",".join(str(l) for l in sorted(ls)) for ls in lines]
+
+
+def buses(n: int, rng: np.random.Generator) -> list:
+    points = _lines(n, stops_per_line=30, spacing_m=300.0, rng=rng)
+    lineas = _share_lines(points, 30.0)
+    return [_feature(float(lon), float(lat),
+                     {"id_parada": float(k + 1), "denominacion": f"Parada {k + 1}", "lineas": lineas[k]})
+            for k, (lat, lon, _) in enumerate(points)]
+
+
+def metro(n: int, rng: np.random.Generator) -> list:
+    points = _lines(n, stops_per_line=20, spacing_m=800.0, rng=rng)
+    lineas = _share_lines(points, 80.0)
+    return [_feature(float(lon), float(lat),
+                     {"gid": k + 1, "codigo": str(k + 1), "nombre": f"Estación {k + 1}", "tipo": 1,
+                      "linea": lineas[k]})
+            for k, (lat, lon, _) in enumerate(points)]
+
+
+def fonts(n: int, rng: np.random.Generator) -> list:
+    lat = rng.uniform(*BBOX["lat"], n)
+    lon = rng.uniform(*BBOX["lon"], n)
+    return [_feature(float(lon[k]), float(lat[k]), {"gid": k + 1}) for k in range(n)]
+
+
+def generate(directory, n_monuments: int, n_stops: int, seed: int = 0) -> Path:
+    """Escribe los cuatro GeoJSON en ``directory`` (el equivalente de ``data/raw``)."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    _write(directory / "monuments.geojson", monuments(n_monuments, rng))
+    _write(directory / "buses.geojson", buses(n_stops, rng))
+    _write(directory / "metro.geojson", metro(max(40, n_stops // 20), rng))
+    _write(directory / "fonts.geojson", fonts(max(100, n_stops // 2), rng))
+    return directory
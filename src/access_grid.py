@@ -0,0 +1,196 @@
+# src/access_grid.py
+"""Rejilla precalculada de accesibilidad para los tramos desde y hasta el alojamiento.
+
+El alojamiento es una coordenada cualquiera, así que el primer y el último
+tramo de cada ruta necesitaban buscar paradas cercanas y estimar los minutos
+a pie desde cero. La rejilla cubre la caja de las paradas de la ciudad (las
+de bus; el metro llega a municipios lejanos) más el radio de acceso, con
+celdas de ``CELL_M`` metros, y guarda para el centro de cada celda:
+
+* ``stops``    int32[R, C, K·m]   las ``K`` paradas más cercanas de cada capa a menos de
+  ``ACCESS_RADIUS_M`` (índices de ``TransitNetwork``, -1 si faltan), un bloque por capa
+* ``minutes``  float32[R, C, K·m] minutos a pie en línea recta hasta cada una
+* ``node``     int32[R, C]        nodo más cercano del grafo peatonal CSR (-1 sin grafo)
+
+Cualquier punto se resuelve con una división y una lectura de array; los
+minutos se miden desde el centro de la celda (como mucho ~35 m de error).
+Fuera de la rejilla se sigue usando el índice espacial de cada capa. Se
+guarda en ``data/processed/access_grid`` con la huella de paradas, parámetros
+y grafo, se abre con ``mmap_mode="r"`` y se regenera sola si cambia algo.
+
+Uso offline::
+
+    python -m src.access_grid
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.data_loader import PROCESSED_DIR
+from src.shared_data import build_lock, save_arrays
+from src.transit_network import ACCESS_K, ACCESS_RADIUS_M, MODES
+
+GRID_DIR = PROCESSED_DIR / "access_grid"
+CELL_M = 50.0
+FORMAT_VERSION = 1
+
+_M_PER_DEG = 111320.0
+ARRAYS = ("stops", "minutes", "node")
+
+
+class AccessGrid:
+    """Rejilla regular lat/lon de paradas candidatas y nodo peatonal por celda."""
+
+    def __init__(self, origin: Tuple[float, float], step: Tuple[float, float], k: int,
+                 stops: np.ndarray, minutes: np.ndarray, node: np.ndarray, fingerprint: str = ""):
+        self.lat0, self.lon0 = float(origin[0]), float(origin[1])
+        self.dlat, self.dlon = float(step[0]), float(step[1])
+        self.k = int(k)
+        self.stops = stops
+        self.minutes = minutes
+        self.node = node
+        self.fingerprint = fingerprint
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.node.shape
+
+    def cell(self, lat: float, lon: float) -> Optional[Tuple[int, int]]:
+        """(fila, columna) de la celda que contiene el punto; None fuera de la rejilla."""
+        r = int(math.floor((lat - self.lat0) / self.dlat))
+        c = int(math.floor((lon - self.lon0) / self.dlon))
+        rows, cols = self.shape
+        if 0 <= r < rows and 0 <= c < cols:
+            return r, c
+        return None
+
+    def candidates(self, lat: float, lon: float,
+                   modes: Sequence[str]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(paradas, minutos a pie) candidatas de las capas ``modes``; None fuera de la rejilla."""
+        cell = self.cell(lat, lon)
+        if cell is None:
+            return None
+        blocks = [slice(MODES.index(m) * self.k, (MODES.index(m) + 1) * self.k) for m in modes if m in MODES]
+        stops = np.concatenate([self.stops[cell][b] for b in blocks]) if blocks else np.empty(0, dtype=np.int32)
+        minutes = np.concatenate([self.minutes[cell][b] for b in blocks]) if blocks else np.empty(0)
+        ok = stops >= 0
+        return stops[ok].astype(np.intp), minutes[ok].astype(np.float64)
+
+    def node_at(self, lat: float, lon: float) -> int:
+        """Nodo peatonal más cercano al centro de la celda (-1 fuera o sin grafo)."""
+        cell = self.cell(lat, lon)
+        return -1 if cell is None else int(self.node[cell])
+
+    # ------------------------
+    # Construcción y persistencia
+    # ------------------------
+    @classmethod
+    def build(cls, network, graph=None, cell_m: float = CELL_M, k: int = ACCESS_K,
+              radius_m: float = ACCESS_RADIUS_M, fingerprint: str = "") -> "AccessGrid":
+        """Calcula la rejilla para ``network`` (``TransitNetwork``) y, si se da, el grafo CSR."""
+        margin = radius_m + cell_m
+        city = network.stop_mode == MODES.index("bus")
+        if not city.any():
+            city = np.ones(network.n_stops, dtype=bool)
+        lat_c, lon_c = network.lat[city], network.lon[city]
+        lat_mid = float(np.mean(lat_c)) if len(lat_c) else 39.47
+        dlat = cell_m / _M_PER_DEG
+        dlon = cell_m / (_M_PER_DEG * math.cos(math.radians(lat_mid)))
+        if len(lat_c):
+            lat0 = float(lat_c.min()) - margin / _M_PER_DEG
+            lon0 = float(lon_c.min()) - margin / (_M_PER_DEG * math.cos(math.radians(lat_mid)))
+            rows = int(math.ceil((float(lat_c.max()) - lat0) / dlat + margin / cell_m)) + 1
+            cols = int(math.ceil((float(lon_c.max()) - lon0) / dlon + margin / cell_m)) + 1
+        else:
+            lat0, lon0, rows, cols = lat_mid, 0.0, 0, 0
+
+        c_lat = lat0 + (np.arange(rows) + 0.5) * dlat
+        c_lon = lon0 + (np.arange(cols) + 0.5) * dlon
+        lats = np.repeat(c_lat, cols)
+        lons = np.tile(c_lon, rows)
+
+        stops = np.full((rows * cols, k * len(MODES)), -1, dtype=np.int32)
+        minutes = np.full((rows * cols, k * len(MODES)), np.inf, dtype=np.float32)
+        for m, mode in enumerate(MODES):
+            index = network.indexes.get(mode)
+            if index is None or not len(lats):
+                continue
+            idx, dist = index.query_nearest_many(lats, lons, k=k)
+            ok = dist <= radius_m
+            block = slice(m * k, m * k + idx.shape[1])
+            stops[:, block] = np.where(ok, idx + network.offsets[mode], -1)
+            minutes[:, block] = np.where(ok, dist / 1000 / network.walk_speed_kmh * 60, np.inf)
+
+        node = np.full(rows * cols, -1, dtype=np.int32)
+        if graph is not None and graph.n_nodes and len(lats):
+            from scipy.spatial import cKDTree
+
+            lat_ref = np.radians(lat_mid)
+
+            def project(lon, lat):
+                return np.column_stack([np.radians(lon) * np.cos(lat_ref), np.radians(lat)])
+
+            _, nearest = cKDTree(project(np.asarray(graph.x), np.asarray(graph.y))).query(project(lons, lats))
+            node[:] = nearest
+
+        return cls((lat0, lon0), (dlat, dlon), k, stops.reshape(rows, cols, -1),
+                   minutes.reshape(rows, cols, -1), node.reshape(rows, cols), fingerprint)
+
+    def save(self, directory=GRID_DIR) -> None:
+        meta = {"version": FORMAT_VERSION, "fingerprint": self.fingerprint, "k": self.k,
+                "origin": [self.lat0, self.lon0], "step": [self.dlat, self.dlon]}
+        save_arrays(directory, {name: getattr(self, name) for name in ARRAYS}, meta)
+
+    @classmethod
+    def load(cls, directory=GRID_DIR, fingerprint: Optional[str] = None) -> Optional["AccessGrid"]:
+        """Rejilla guardada (proyectada en memoria), o None si falta o no coincide la huella."""
+        directory = Path(directory)
+        try:
+            with open(directory / "meta.json") as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != FORMAT_VERSION:
+            return None
+        if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+            return None
+        arrays = [np.load(directory / f"{name}.npy", mmap_mode="r") for name in ARRAYS]
+        return cls(meta["origin"], meta["step"], meta["k"], *arrays, fingerprint=meta["fingerprint"])
+
+
+def get_access_grid(network, fingerprint: str, directory=GRID_DIR) -> AccessGrid:
+    """Rejilla de ``network`` con esa huella: la guardada o una nueva (que se guarda)."""
+    grid = AccessGrid.load(directory, fingerprint)
+    if grid is not None:
+        return grid
+    with build_lock(Path(directory)):
+        # quien esperaba el cerrojo abre la rejilla que acaba de guardar otro proceso
+        grid = AccessGrid.load(directory, fingerprint)
+        if grid is None:
+            from src.walk_graph import CSR_DIR, CSRGraph
+
+            graph = CSRGraph.load(CSR_DIR) if (CSR_DIR / "meta.json").exists() else None
+            grid = AccessGrid.build(network, graph, fingerprint=fingerprint)
+            try:
+                grid.save(directory)
+            except OSError:
+                pass  # sin permisos de escritura: se usa en memoria
+    return grid
+
+
+def main() -> None:
+    from src.route_generator import access_grid
+
+    grid = access_grid()
+    rows, cols = grid.shape
+    print(f"{rows}×{cols} celdas de {CELL_M:.0f} m, {grid.k} paradas por capa → {GRID_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# src/batch.py
+"""Generación de itinerarios por lotes en varios procesos.
+
+Cada petición es un objeto JSON por línea (JSON Lines)::
+
+    {"id": "hab-101", "start": [39.4699, -0.3763], "inicio": "09:00", "fin": "18:00",
+     "imprescindibles": ["CATEDRAL"], "preferencias": ["Museos"], "transporte": "ambos"}
+
+En lugar de ``start`` se puede dar ``direccion`` (se geocodifica en el
+trabajador, con la caché de ``geocode``). Campos opcionales: ``pausa_comida``
+(True), ``engine`` ("greedy") y ``walk_metric`` ("haversine").
+
+Cada proceso del pool carga una sola vez, en su inicializador, los monumentos,
+el almacén columnar, los índices de paradas y las tablas de tramos; después
+solo recibe peticiones pequeñas y devuelve itinerarios. Los resultados salen
+en el mismo orden que las peticiones y se escriben según van llegando; la
+entrada se lee a medida que avanza el pool (como mucho ``BATCH_PENDING``
+envíos por proceso en vuelo), así que un lote enorme o un ``stdin`` que no
+termina no se cargan enteros en memoria.
+
+Uso::
+
+    python -m src.batch peticiones.jsonl -o itinerarios.jsonl -w 8
+    cat peticiones.jsonl | python -m src.batch - > itinerarios.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional, TextIO
+
+from src.transit_matrix import TRANSPORT_OPTIONS
+
+BATCH_CHUNKSIZE = 4  # peticiones por envío al trabajador (amortiza el coste de IPC)
+BATCH_PENDING = 2    # envíos en vuelo por proceso: uno en cálculo y otro esperando
+
+_GDF = None  # monumentos del trabajador, cargados en _init_worker
+
+
+def _init_worker(walk_metric: str = "haversine") -> None:
+    """Precarga en el proceso todo lo que comparten las peticiones."""
+    global _GDF
+    from src import route_generator as rg
+    from src.data_loader import load_monuments
+    from src.gtfs import get_timetables
+    from src.poi_clusters import CLUSTERED_MIN_POIS, get_clusters
+    from src.poi_store import get_poi_store
+
+    _GDF = load_monuments()
+    store = get_poi_store(_GDF)
+    if len(store) >= CLUSTERED_MIN_POIS:
+        get_clusters(store)  # barrios del catálogo grande, antes de la primera petición
+    rg.bus_index(), rg.metro_index(), rg.bus_lines(), rg.metro_lines(), rg.transit_network()
+    for option in TRANSPORT_OPTIONS:
+        rg.get_transit_matrix(_GDF, option, walk_metric)
+    get_timetables()
+
+
+def _parse_time(value) -> dt.time:
+    return dt.time.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _start_coord(request: Dict):
+    if request.get("start") is not None:
+        lat, lon = request["start"]
+        return float(lat), float(lon)
+    from src.geocode import geocode_location
+
+    location = geocode_location(request.get("direccion", ""))
+    if location is None:
+        raise ValueError(f"No se pudo geocodificar {request.get('direccion')!r}")
+    return location
+
+
+def run_request(request: Dict) -> Dict:
+    """Resuelve una petición; los errores se devuelven en el resultado, no se lanzan."""
+    from src.route_cache import generar_ruta_cached
+
+    global _GDF
+    rid = request.get("id") if isinstance(request, dict) else None
+    t0 = time.perf_counter()
+    try:
+        if _GDF is None:
+            _init_worker(request.get("walk_metric", "haversine"))
+        itinerario = generar_ruta_cached(
+            _GDF,
+            _start_coord(request),
+            _parse_time(request.get("inicio", "09:00")),
+            _parse_time(request.get("fin", "18:00")),
+            list(request.get("imprescindibles") or []),
+            list(request.get("preferencias") or []),
+            transporte=request.get("transporte", "ambos").lower(),
+            incluir_pausa_comida=request.get("pausa_comida", True),
+            engine=request.get("engine", "greedy"),
+            walk_metric=request.get("walk_metric", "haversine"),
+        )
+    except Exception as e:  # una petición mala no detiene el lote
+        return {"id": rid, "error": f"{type(e).__name__}: {e}"}
+    return {"id": rid, "itinerario": itinerario,
+            "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+def generar_rutas_batch(
+    requests: Iterable[Dict],
+    workers: Optional[int] = None,
+    chunksize: int = BATCH_CHUNKSIZE,
+    walk_metric: str = "haversine",
+) -> Iterator[Dict]:
+    """Genera los itinerarios de ``requests`` en un pool de ``workers`` procesos.
+
+    Devuelve un iterador perezoso con un resultado por petición, en el mismo
+    orden: ``{"id", "itinerario", "ms"}`` o ``{"id", "error"}``. Con
+    ``workers=1`` todo se ejecuta en el proceso actual.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(walk_metric)
+        for request in requests:
+            yield run_request(request)
+        return
+    # Envíos en ventana acotada: Pool.imap leería toda la entrada de golpe
+    requests = iter(requests)
+    with mp.Pool(workers, initializer=_init_worker, initargs=(walk_metric,)) as pool:
+        pending: deque = deque()
+        while True:
+            while len(pending) < workers * BATCH_PENDING:
+                chunk = list(islice(requests, chunksize))
+                if not chunk:
+                    break
+                pending.append(pool.map_async(run_request, chunk, chunksize=len(chunk)))
+            if not pending:
+                return
+            yield from pending.popleft().get()
+
+
+def _read_jsonl(fh: TextIO) -> Iterator[Dict]:
+    for n, line in enumerate(fh, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            print(f"Línea {n} ignorada: {e}", file=sys.stderr)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.batch", description=__doc__.split("\n")[0])
+    parser.add_argument("entrada", help="fichero JSON Lines con las peticiones ('-' para stdin)")
+    parser.add_argument("-o", "--salida", default="-", help="fichero JSON Lines de resultados ('-' para stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--chunksize", type=int, default=BATCH_CHUNKSIZE)
+    parser.add_argument("--walk-metric", default="haversine", choices=("haversine", "network"))
+    args = parser.parse_args(argv)
+
+    fin = sys.stdin if args.entrada == "-" else open(args.entrada, encoding="utf-8")
+    fout = sys.stdout if args.salida == "-" else open(args.salida, "w", encoding="utf-8")
+    t0 = time.perf_counter()
+    n = errors = 0
+    try:
+        for result in generar_rutas_batch(_read_jsonl(fin), args.workers, args.chunksize, args.walk_metric):
+            fout.write(json.dumps(result, ensure_ascii=False, default=float) + "\n")
+            fout.flush()
+            n += 1
+            errors += "error" in result
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+    elapsed = time.perf_counter() - t0
+    print(f"{n} peticiones ({errors} con error) en {elapsed:.1f} s → "
+          f"{n / elapsed if elapsed else 0:.1f} itinerarios/s con {args.workers or os.cpu_count()} procesos",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
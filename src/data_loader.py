@@ -1,27 +1,201 @@
-import geopandas as gpd
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import TYPE_CHECKING
+
+import numpy as np
 from pathlib import Path
 
-DATA_DIR = Path(__file__).parent.parent / "data" / "raw"
+from src.geo import PairDistances, haversine_matrix
+from src.profiling import stage
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+# VALENCIA_DATA_DIR permite apuntar a otro juego de datos (p. ej. los sintéticos de benchmarks/)
+DATA_DIR = Path(os.environ.get("VALENCIA_DATA_DIR", Path(__file__).parent.parent / "data" / "raw"))
+PROCESSED_DIR = DATA_DIR.parent / "processed"  # tablas derivadas (regenerables)
+DATASETS_DIR = PROCESSED_DIR / "datasets"      # copias columnares de data/raw
+
+# Capas disponibles: nombre → GeoJSON de origen en DATA_DIR
+DATASETS = {
+    "monuments": "monuments.geojson",
+    "buses": "buses.geojson",
+    "metro": "metro.geojson",
+    "fonts": "fonts.geojson",
+}
+FORMAT_VERSION = 1
+
+# Por encima de estos monumentos las matrices POI×POI no se guardan enteras
+# (4000² float64 ≈ 128 MB): se calculan por celdas y se planifica por barrios
+MAX_DENSE_POIS = 4000
+
+# Matrices de distancias entre monumentos, indexadas por huella de coordenadas
+_DIST_MATRICES: dict = {}
+
+
+class DatasetRegistry:
+    """Capas de datos cargadas una sola vez por proceso.
+
+    La primera vez que se pide una capa se lee su GeoJSON y se guarda una copia
+    GeoParquet en ``DATASETS_DIR`` junto a un ``.json`` con el tamaño, la fecha
+    y el SHA-1 del original; los arranques siguientes leen el Parquet (mucho
+    más rápido) mientras el GeoJSON no cambie. Sin ``pyarrow`` se lee siempre
+    el GeoJSON, pero igualmente una sola vez por proceso.
+
+    ``get`` devuelve una copia superficial del GeoDataFrame compartido: añadir
+    columnas (p. ej. ``tooltip`` en la app) no altera la capa en caché, y con el
+    copy-on-write de pandas tampoco modificar valores.
+    """
+
+    def __init__(self, raw_dir=DATA_DIR, cache_dir=DATASETS_DIR):
+        self.raw_dir = Path(raw_dir)
+        self.cache_dir = Path(cache_dir)
+        self._frames: dict = {}
+        self._lock = threading.Lock()
+
+    def source(self, name: str) -> Path:
+        if name not in DATASETS:
+            raise KeyError(f"Capa de datos desconocida: {name!r}")
+        return self.raw_dir / DATASETS[name]
+
+    def get(self, name: str) -> gpd.GeoDataFrame:
+        gdf = self._frames.get(name)
+        if gdf is None:
+            with self._lock:
+                gdf = self._frames.get(name)
+                if gdf is None:
+                    with stage(f"datos.{name}"):
+                        gdf = self._load(name)
+                    self._frames[name] = gdf
+        return gdf.copy(deep=False)
+
+    def clear(self) -> None:
+        """Olvida las capas cargadas (se releerán en la próxima petición)."""
+        with self._lock:
+            self._frames.clear()
+
+    def _load(self, name: str) -> gpd.GeoDataFrame:
+        import geopandas as gpd  # diferido: solo lo paga quien lee datos
+
+        source = self.source(name)
+        parquet = self.cache_dir / f"{name}.parquet"
+        stamp = self._stamp(source)
+        if self._is_fresh(name, source, stamp):
+            try:
+                return _ensure_latlon(gpd.read_parquet(parquet))
+            except (ImportError, OSError, ValueError):
+                pass
+        gdf = _ensure_latlon(gpd.read_file(source))
+        self._save(name, gdf, stamp)
+        return gdf
+
+    @staticmethod
+    def _stamp(source: Path) -> dict:
+        stat = source.stat()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _is_fresh(self, name: str, source: Path, stamp: dict) -> bool:
+        """True si el Parquet corresponde al GeoJSON actual.
+
+        Basta con que coincidan tamaño y fecha; si solo cambió la fecha (un
+        ``git checkout``, una copia) se compara el SHA-1 y se actualiza la marca.
+        """
+        meta_path = self.cache_dir / f"{name}.json"
+        try:
+            with open(meta_path) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return False
+        if meta.get("version") != FORMAT_VERSION or not (self.cache_dir / f"{name}.parquet").exists():
+            return False
+        src = meta.get("source", {})
+        if src.get("size") != stamp["size"]:
+            return False
+        if src.get("mtime_ns") == stamp["mtime_ns"]:
+            return True
+        if src.get("sha1") != _sha1(source):
+            return False
+        meta["source"] = dict(src, mtime_ns=stamp["mtime_ns"])
+        self._write_json(meta_path, meta)
+        return True
+
+    def _save(self, name: str, gdf: gpd.GeoDataFrame, stamp: dict) -> None:
+        tmp = self.cache_dir / f"{name}.{os.getpid()}.tmp.parquet"
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            gdf.to_parquet(tmp)
+            os.replace(tmp, self.cache_dir / f"{name}.parquet")
+        except (ImportError, OSError, ValueError, TypeError):
+            # sin pyarrow, sin permisos o columnas que Arrow no sabe escribir
+            # (ArrowInvalid/ArrowTypeError heredan de ValueError/TypeError):
+            # se seguirá leyendo el GeoJSON
+            try:
+                tmp.unlink(missing_ok=True)
+            except OSError:
+                pass
+            return
+        source = self.source(name)
+        meta = {"version": FORMAT_VERSION, "source": dict(stamp, path=source.name, sha1=_sha1(source))}
+        self._write_json(self.cache_dir / f"{name}.json", meta)
+
+    @staticmethod
+    def _write_json(path: Path, data: dict) -> None:
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, path)
+
+
+REGISTRY = DatasetRegistry()
+
+
+def _sha1(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 def load_monuments():
-    gdf = gpd.read_file(DATA_DIR / "monuments.geojson")
-    gdf = _ensure_latlon(gdf)
+    gdf = REGISTRY.get("monuments")
+    monument_distance_matrix(gdf)  # se precalcula una vez por conjunto de monumentos
     return gdf
 
 def load_buses():
-    gdf = gpd.read_file(DATA_DIR / "buses.geojson")
-    gdf = _ensure_latlon(gdf)
-    return gdf
+    return REGISTRY.get("buses")
 
 def load_metro():
-    gdf = gpd.read_file(DATA_DIR / "metro.geojson")
-    gdf = _ensure_latlon(gdf)
-    return gdf
+    return REGISTRY.get("metro")
 
 def load_fonts():
-    gdf = gpd.read_file(DATA_DIR / "fonts.geojson")
-    gdf = _ensure_latlon(gdf)
-    return gdf
+    return REGISTRY.get("fonts")
+
+def monument_distance_matrix(gdf):
+    """Matriz (n, n) de distancias haversine en metros entre las filas de ``gdf``.
+
+    La fila i corresponde a la posición i del GeoDataFrame. Se calcula una sola
+    vez por conjunto de coordenadas y se devuelve como array de solo lectura,
+    publicado en ``shared_data`` para que los demás procesos no la repitan.
+    Con más de ``MAX_DENSE_POIS`` filas se devuelve una ``PairDistances``
+    que calcula solo las celdas que se piden.
+    """
+    from src.shared_data import get_shared
+
+    lat = gdf.geometry.y.to_numpy(dtype=np.float64)
+    lon = gdf.geometry.x.to_numpy(dtype=np.float64)
+    key = hashlib.sha1(lat.tobytes() + lon.tobytes()).hexdigest()
+    matrix = _DIST_MATRICES.get(key)
+    if matrix is None:
+        if len(lat) > MAX_DENSE_POIS:
+            matrix = PairDistances(lat, lon)
+        else:
+            matrix = get_shared("monument_dist", key, lambda: ({"dist": haversine_matrix(lat, lon)}, {}))["dist"]
+        _DIST_MATRICES[key] = matrix
+    return matrix
 
 def _ensure_latlon(gdf):
     if gdf.crs is None:
@@ -29,4 +203,3 @@ def _ensure_latlon(gdf):
     gdf["lon"] = gdf.geometry.x
     gdf["lat"] = gdf.geometry.y
     return gdf
-
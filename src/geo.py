@@ -0,0 +1,90 @@
+# src/geo.py
+"""Núcleos vectorizados de distancia haversine con NumPy.
+
+Complementan a ``route_generator.haversine_distance`` (escalar, con ``math``)
+para los casos uno-a-muchos y muchos-a-muchos, donde una sola llamada sobre
+arrays sustituye a miles de llamadas Python fila a fila.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_many(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Distancias en metros desde (lat, lon) a cada punto de (lats, lons)."""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    d_phi = lat2 - lat1
+    d_lambda = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    a = np.sin(d_phi / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_pairwise(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """Distancias en metros entre los puntos i-ésimos de dos arrays de igual longitud."""
+    phi1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    phi2 = np.radians(np.asarray(lats2, dtype=np.float64))
+    d_lambda = np.radians(np.asarray(lons2, dtype=np.float64) - np.asarray(lons1, dtype=np.float64))
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(
+    lats1,
+    lons1,
+    lats2: Optional[np.ndarray] = None,
+    lons2: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Matriz (n, m) de distancias en metros entre dos conjuntos de puntos.
+
+    Si no se pasa el segundo conjunto se calcula la matriz cuadrada del
+    primero consigo mismo.
+    """
+    if lats2 is None:
+        lats2, lons2 = lats1, lons1
+    phi1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    phi2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lam1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+    lam2 = np.radians(np.asarray(lons2, dtype=np.float64))[None, :]
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lam2 - lam1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class PairDistances:
+    """Matriz (n, n) perezosa: solo calcula las celdas que se indexan.
+
+    Sustituye a ``haversine_matrix`` en catálogos demasiado grandes para
+    guardar todos los pares (ver ``data_loader.MAX_DENSE_POIS``). Admite los
+    accesos que hace el planificador: ``d[i, filas]``, ``d[filas, j]`` y
+    ``d[np.ix_(a, b)]``; ``cells(i, j)`` recibe arrays de filas ya
+    difundibles entre sí y devuelve los metros de cada par.
+    """
+
+    def __init__(self, lat, lon, cells=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self._cells = cells or self._haversine
+
+    @property
+    def shape(self):
+        return (len(self.lat), len(self.lat))
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def __getitem__(self, key) -> np.ndarray:
+        i, j = key
+        return self._cells(np.asarray(i), np.asarray(j))
+
+    def _haversine(self, i, j) -> np.ndarray:
+        return haversine_pairwise(self.lat[i], self.lon[i], self.lat[j], self.lon[j])
+
+    def take(self, rows) -> "PairDistances":
+        """Las mismas distancias restringidas a ``rows`` (renumeradas 0..k-1)."""
+        rows = np.asarray(rows, dtype=np.intp)
+        return PairDistances(self.lat[rows], self.lon[rows], lambda i, j: self._cells(rows[i], rows[j]))
@@ -1,10 +1,199 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
 import requests
 
-def geocode_location(address: str):
-    """Convierte una dirección en lat/lon usando Nominatim y la restringe a València."""
-    if not address:
-        return None
+from src.profiling import timed
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(__file__).parent.parent / "cache" / "geocode"
+GAZETTEER_PATH = Path(os.environ.get(
+    "VALENCIA_GAZETTEER", Path(__file__).parent.parent / "data" / "raw" / "gazetteer.csv"))
+
+CACHE_TTL_S = 30 * 24 * 3600        # direcciones encontradas: 30 días
+NEGATIVE_TTL_S = 24 * 3600          # direcciones no encontradas: 1 día
+CACHE_MAX_ENTRIES = 5000            # ficheros en disco antes de expulsar los menos usados
+MEMO_MAX_ENTRIES = 1024             # entradas en memoria del proceso
+
+
+def normalize_address(address: str) -> str:
+    """Clave canónica de una dirección: minúsculas, sin tildes ni puntuación sobrante."""
+    text = unicodedata.normalize("NFKD", address)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^\w,]+", " ", text)
+    text = re.sub(r"\s*,\s*", ", ", text)
+    return re.sub(r"\s+", " ", text).strip(" ,")
+
+
+class GeocodeCache:
+    """Caché de geocodificación en disco (un JSON por clave SHA-1) con TTL y LRU.
+
+    Cada entrada guarda la dirección normalizada, el resultado (``None`` si
+    Nominatim no la encontró) y la fecha de alta. La fecha de modificación del
+    fichero se actualiza en cada acierto y sirve de reloj LRU para expulsar las
+    entradas menos usadas cuando se supera ``max_entries``.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl_s=CACHE_TTL_S, negative_ttl_s=NEGATIVE_TTL_S,
+                 max_entries=CACHE_MAX_ENTRIES):
+        self.directory = Path(directory)
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.max_entries = max_entries
+        self._count = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, key: str):
+        """Devuelve ``(encontrado, resultado)``; resultado es (lat, lon) o None."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return False, None
+        result = tuple(entry["result"]) if entry.get("result") else None
+        ttl = self.ttl_s if result else self.negative_ttl_s
+        if entry.get("key") != key or time.time() - entry.get("ts", 0) > ttl:
+            return False, None
+        try:
+            os.utime(path)  # marca de uso para la expulsión LRU
+        except OSError:
+            pass
+        return True, result
+
+    def put(self, key: str, result) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"key": key, "result": list(result) if result else None, "ts": time.time()}, fh)
+        existed = path.exists()
+        os.replace(tmp, path)
+        with self._lock:
+            if self._count is None:
+                self._count = len(list(self.directory.glob("*.json")))
+            elif not existed:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        files = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        drop = len(files) - int(self.max_entries * 0.9)  # deja margen para no expulsar en cada alta
+        for path in files[:max(drop, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        self._count = len(files) - max(drop, 0)
+
+
+class Gazetteer:
+    """Callejero local de València para geocodificar sin red.
+
+    Se construye a partir de un CSV con columnas ``calle``, ``numero``, ``lat`` y
+    ``lon`` (un portal por fila). Si no existe el número exacto se usa el portal
+    más cercano de la misma acera (misma paridad) o, si no hay, de la calle.
+    """
+
+    _STREET_TYPES = r"(calle|c|carrer|cl|avenida|avda|av|avinguda|plaza|pl|placa|pza|paseo|passeig|pg|camino|cami|gran via)"
+
+    def __init__(self, portals: dict):
+        self._portals = portals  # calle normalizada → lista ordenada de (número, lat, lon)
+
+    @classmethod
+    def from_csv(cls, path) -> "Gazetteer":
+        portals: dict = {}
+        with open(path, newline="", encoding="utf-8") as fh:
+            for row in csv.DictReader(fh):
+                try:
+                    numero = int(re.match(r"\d+", str(row["numero"])).group())
+                    lat, lon = float(row["lat"]), float(row["lon"])
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    continue
+                portals.setdefault(cls._street_key(row["calle"]), []).append((numero, lat, lon))
+        for entries in portals.values():
+            entries.sort()
+        return cls(portals)
+
+    @classmethod
+    def _street_key(cls, street: str) -> str:
+        key = normalize_address(street).replace(",", " ")
+        key = re.sub(rf"^{cls._STREET_TYPES}\b\s*", "", key)
+        key = re.sub(r"\b(de|del|la|el|les|los|las|dels|d|l)\b", " ", key)
+        return re.sub(r"\s+", " ", key).strip()
 
+    def lookup(self, address: str):
+        """(lat, lon) de la dirección o None si la calle no está en el callejero."""
+        parts = normalize_address(address).split(", ")
+        match = re.match(r"(.*?)\s*(\d+)?\s*$", parts[0])
+        street, number = match.group(1), match.group(2)
+        if number is None and len(parts) > 1:
+            # "Calle Colón, 5, Valencia": el número va en la segunda parte
+            match = re.match(r"(?:n|no|num|numero)?\s*(\d{1,4})\b", parts[1])  # no un código postal
+            number = match.group(1) if match else None
+        entries = self._portals.get(self._street_key(street))
+        if not entries:
+            return None
+        if number is None:
+            _, lat, lon = entries[len(entries) // 2]
+            return lat, lon
+        number = int(number)
+        same_side = [e for e in entries if e[0] % 2 == number % 2] or entries
+        _, lat, lon = min(same_side, key=lambda e: abs(e[0] - number))
+        return lat, lon
+
+
+_memo: "OrderedDict[str, object]" = OrderedDict()
+_memo_lock = threading.Lock()
+_disk_cache = GeocodeCache()
+_gazetteer = None
+_gazetteer_loaded = False
+
+
+def get_gazetteer():
+    """Callejero offline, cargado una vez por proceso (None si no hay fichero)."""
+    global _gazetteer, _gazetteer_loaded
+    if not _gazetteer_loaded:
+        _gazetteer = Gazetteer.from_csv(GAZETTEER_PATH) if GAZETTEER_PATH.exists() else None
+        _gazetteer_loaded = True
+    return _gazetteer
+
+
+def _memo_get(key):
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return True, _memo[key]
+    return False, None
+
+
+def _memo_put(key, result):
+    with _memo_lock:
+        _memo[key] = result
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_MAX_ENTRIES:
+            _memo.popitem(last=False)
+
+
+class RateLimited(Exception):
+    """Nominatim ha rechazado la petición por exceso de uso (HTTP 429/503)."""
+
+
+def _nominatim(address: str):
     url = "https://nominatim.openstreetmap.org/search"
     params = {
         "q": address,
@@ -17,15 +206,57 @@ def geocode_location(address: str):
 
     headers = {"User-Agent": "valencia-smart-routes/1.0"}
 
-    try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if data:
-            lat = float(data[0]["lat"])
-            lon = float(data[0]["lon"])
-            return lat, lon
-    except Exception as e:
-        print(f"Error al geocodificar: {e}")
+    response = requests.get(url, params=params, headers=headers, timeout=10)
+    if response.status_code in (429, 503):
+        raise RateLimited(f"HTTP {response.status_code}")
+    response.raise_for_status()
+    data = response.json()
+    if data:
+        return float(data[0]["lat"]), float(data[0]["lon"])
+    return None
+
+
+@timed("geocode")
+def geocode_location(address: str, offline: bool = None):
+    """Convierte una dirección en lat/lon usando Nominatim y la restringe a València.
+
+    Consulta primero la memoria del proceso y la caché en disco; si hay que ir
+    a la red y Nominatim falla o limita peticiones (o ``offline`` es True, o
+    ``VALENCIA_GEOCODE_OFFLINE=1``), recurre al callejero local si existe.
+    """
+    if not address:
+        return None
+    if offline is None:
+        offline = os.environ.get("VALENCIA_GEOCODE_OFFLINE") == "1"
+
+    key = normalize_address(address)
+    hit, result = _memo_get(key)
+    if hit:
+        return result
+    hit, result = _disk_cache.get(key)
+    if hit and result is not None:
+        _memo_put(key, result)
+        return result
+
+    if not offline and not hit:  # un "no encontrado" reciente no se repite en red
+        try:
+            result = _nominatim(address)
+        except Exception as e:
+            logger.warning("Error al geocodificar %r: %s", address, e)
+        else:
+            try:
+                _disk_cache.put(key, result)
+            except OSError as e:  # caché de solo lectura o disco lleno: la respuesta sirve igual
+                logger.warning("No se pudo guardar la geocodificación en %s: %s", _disk_cache.directory, e)
+            if result is not None:
+                _memo_put(key, result)
+                return result
+
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        result = gazetteer.lookup(address)
+        if result is not None:
+            _memo_put(key, result)  # solo en memoria: en disco se guarda lo de Nominatim
+            return result
 
     return None
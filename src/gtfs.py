@@ -0,0 +1,484 @@
+# src/gtfs.py
+"""Horarios GTFS de EMT y Metrovalencia compilados en arrays proyectables en memoria.
+
+Cada feed (``data/gtfs/emt.zip``, ``data/gtfs/metrovalencia.zip``, o el
+directorio de ``VALENCIA_GTFS_DIR``) se compila una sola vez en un directorio
+de ``.npy`` bajo ``data/processed/gtfs/<feed>/`` que se abre con
+``mmap_mode="r"``, igual que el grafo peatonal CSR:
+
+* paradas: ``stop_ids``, ``stop_lat``, ``stop_lon``
+* rutas: ``route_names`` (nombre corto normalizado), ``route_mode`` (0 bus, 1 metro/tranvía)
+* viajes: ``trip_route``, ``trip_service``, ``trip_ptr`` (paradas del viaje t en
+  ``st_*[trip_ptr[t]:trip_ptr[t+1]]``, en orden de paso)
+* paradas de viaje: ``st_trip``, ``st_stop``, ``st_arr``, ``st_dep`` (segundos desde
+  la medianoche del día de servicio)
+* salidas por parada: ``ev_ptr``, ``ev_dep``, ``ev_st``, ordenadas por parada y hora
+  para buscarlas con ``searchsorted``
+* frecuencias: ``freq_trip``, ``freq_start``, ``freq_end``, ``freq_headway`` (viajes
+  plantilla de ``frequencies.txt``, que no entran en las salidas por parada)
+* calendario: ``svc_days`` (bit 0 = lunes), ``svc_start``, ``svc_end`` (AAAAMMDD) y las
+  excepciones ``exc_service``, ``exc_date``, ``exc_type``
+
+``Timetables.refine`` recalcula un ``Journey`` de ``transit_network`` con la
+siguiente salida real de cada vehículo a partir de una hora dada: espera más
+trayecto a bordo según el horario. Los tramos sin horario (línea que no está
+en ningún feed) conservan la estimación estática; si una línea con horario no
+pasa en ``MAX_WAIT_S`` (de noche, por ejemplo) el trayecto no es viable.
+
+Uso offline::
+
+    python -m src.gtfs            # compila todos los feeds presentes
+"""
+
+from __future__ import annotations
+
+import csv
+import datetime as dt
+import io
+import json
+import os
+import sys
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.data_loader import DATA_DIR, PROCESSED_DIR
+from src.geo import haversine_many
+from src.shared_data import build_lock, save_arrays
+
+GTFS_DIR = Path(os.environ.get("VALENCIA_GTFS_DIR", DATA_DIR.parent / "gtfs"))
+COMPILED_DIR = PROCESSED_DIR / "gtfs"
+FEEDS = {"emt": "emt.zip", "metrovalencia": "metrovalencia.zip"}
+FORMAT_VERSION = 1
+
+ROUTE_MODES = ("bus", "metro")
+MATCH_RADIUS_M = 150.0     # parada de la red ↔ paradas GTFS a esta distancia
+DEPARTURE_WINDOW = 256     # salidas siguientes que se examinan en cada parada
+MAX_WAIT_S = 2 * 3600      # más espera que esto cuenta como "sin servicio"
+NO_SERVICE = (-1, -1)      # Timetables.ride: la línea tiene horario pero no pasa a tiempo
+_DAY_S = 24 * 3600
+
+ARRAYS = (
+    "stop_ids", "stop_lat", "stop_lon", "route_names", "route_mode",
+    "trip_route", "trip_service", "trip_ptr", "st_trip", "st_stop", "st_arr", "st_dep",
+    "ev_ptr", "ev_dep", "ev_st", "freq_trip", "freq_start", "freq_end", "freq_headway",
+    "svc_days", "svc_start", "svc_end", "exc_service", "exc_date", "exc_type",
+)
+
+
+def normalize_line(name: str) -> str:
+    """Nombre de línea comparable entre GTFS y GeoJSON ("L3" y "3" son la misma)."""
+    name = str(name).strip().upper()
+    if len(name) > 1 and name[0] == "L" and name[1:].isdigit():
+        name = name[1:]
+    return name
+
+
+def _seconds(text: str) -> int:
+    """"HH:MM:SS" (las horas pueden pasar de 24) → segundos; -1 si está vacío."""
+    text = text.strip()
+    if not text:
+        return -1
+    h, m, s = text.split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def _rows(zf: zipfile.ZipFile, name: str):
+    """Filas de un fichero del feed como diccionarios (vacío si no existe)."""
+    members = {Path(n).name: n for n in zf.namelist()}
+    if name not in members:
+        return
+    with zf.open(members[name]) as raw:
+        yield from csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig"))
+
+
+# ------------------------
+# Compilación
+# ------------------------
+def compile_feed(source, directory) -> Dict[str, np.ndarray]:
+    """Lee un GTFS en zip y escribe sus arrays (y un ``meta.json``) en ``directory``."""
+    source, directory = Path(source), Path(directory)
+    with zipfile.ZipFile(source) as zf:
+        stop_pos: Dict[str, int] = {}
+        stop_lat, stop_lon = [], []
+        for row in _rows(zf, "stops.txt"):
+            stop_pos[row["stop_id"]] = len(stop_pos)
+            stop_lat.append(float(row["stop_lat"]))
+            stop_lon.append(float(row["stop_lon"]))
+
+        route_pos: Dict[str, int] = {}
+        route_names, route_mode = [], []
+        for row in _rows(zf, "routes.txt"):
+            route_pos[row["route_id"]] = len(route_pos)
+            route_names.append(normalize_line(row.get("route_short_name") or row.get("route_long_name", "")))
+            route_mode.append(0 if int(row.get("route_type") or 3) == 3 else 1)
+
+        svc_pos: Dict[str, int] = {}
+        svc_days, svc_start, svc_end = [], [], []
+        for row in _rows(zf, "calendar.txt"):
+            svc_pos[row["service_id"]] = len(svc_pos)
+            days = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+            svc_days.append(sum(1 << k for k, d in enumerate(days) if row.get(d, "0").strip() == "1"))
+            svc_start.append(int(row["start_date"]))
+            svc_end.append(int(row["end_date"]))
+        exc = []
+        for row in _rows(zf, "calendar_dates.txt"):
+            if row["service_id"] not in svc_pos:  # servicio definido solo por excepciones
+                svc_pos[row["service_id"]] = len(svc_pos)
+                svc_days.append(0)
+                svc_start.append(0)
+                svc_end.append(0)
+            exc.append((svc_pos[row["service_id"]], int(row["date"]), int(row["exception_type"])))
+
+        trip_pos: Dict[str, int] = {}
+        trip_route, trip_service = [], []
+        for row in _rows(zf, "trips.txt"):
+            if row["route_id"] not in route_pos:
+                continue
+            trip_pos[row["trip_id"]] = len(trip_pos)
+            trip_route.append(route_pos[row["route_id"]])
+            trip_service.append(svc_pos.setdefault(row["service_id"], len(svc_pos)))
+        while len(svc_days) < len(svc_pos):  # servicios sin calendario: nunca activos
+            svc_days.append(0)
+            svc_start.append(0)
+            svc_end.append(0)
+
+        st_trip, st_seq, st_stop, st_arr, st_dep = [], [], [], [], []
+        for row in _rows(zf, "stop_times.txt"):
+            trip = trip_pos.get(row["trip_id"])
+            stop = stop_pos.get(row["stop_id"])
+            if trip is None or stop is None:
+                continue
+            arr, dep = _seconds(row.get("arrival_time", "")), _seconds(row.get("departure_time", ""))
+            st_trip.append(trip)
+            st_seq.append(int(row["stop_sequence"]))
+            st_stop.append(stop)
+            st_arr.append(arr if arr >= 0 else dep)
+            st_dep.append(dep if dep >= 0 else arr)
+
+        freq = []
+        for row in _rows(zf, "frequencies.txt"):
+            trip = trip_pos.get(row["trip_id"])
+            if trip is not None:
+                freq.append((trip, _seconds(row["start_time"]), _seconds(row["end_time"]),
+                             int(row["headway_secs"])))
+
+    st_trip = np.asarray(st_trip, dtype=np.int32)
+    order = np.lexsort((np.asarray(st_seq, dtype=np.int32), st_trip))
+    st_trip = st_trip[order]
+    st_stop = np.asarray(st_stop, dtype=np.int32)[order]
+    st_arr = np.asarray(st_arr, dtype=np.int32)[order]
+    st_dep = np.asarray(st_dep, dtype=np.int32)[order]
+    st_arr, st_dep = _fill_missing_times(st_trip, st_arr, st_dep)
+    trip_ptr = np.zeros(len(trip_pos) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(st_trip, minlength=len(trip_pos)), out=trip_ptr[1:])
+
+    freq = np.asarray(sorted(freq), dtype=np.int32).reshape(-1, 4)
+    is_freq = np.zeros(len(trip_pos), dtype=bool)
+    is_freq[freq[:, 0]] = True
+
+    # salidas programadas por parada (los viajes por frecuencia se tratan aparte)
+    ev = np.flatnonzero(~is_freq[st_trip])
+    ev = ev[np.lexsort((st_dep[ev], st_stop[ev]))]
+    ev_ptr = np.zeros(len(stop_pos) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(st_stop[ev], minlength=len(stop_pos)), out=ev_ptr[1:])
+
+    exc = np.asarray(sorted(exc, key=lambda e: (e[1], e[0])), dtype=np.int64).reshape(-1, 3)
+    arrays = {
+        "stop_ids": np.asarray(list(stop_pos), dtype=str),
+        "stop_lat": np.asarray(stop_lat, dtype=np.float64),
+        "stop_lon": np.asarray(stop_lon, dtype=np.float64),
+        "route_names": np.asarray(route_names, dtype=str),
+        "route_mode": np.asarray(route_mode, dtype=np.int8),
+        "trip_route": np.asarray(trip_route, dtype=np.int32),
+        "trip_service": np.asarray(trip_service, dtype=np.int32),
+        "trip_ptr": trip_ptr,
+        "st_trip": st_trip,
+        "st_stop": st_stop,
+        "st_arr": st_arr,
+        "st_dep": st_dep,
+        "ev_ptr": ev_ptr,
+        "ev_dep": st_dep[ev],
+        "ev_st": ev.astype(np.int64),
+        "freq_trip": freq[:, 0].copy(),
+        "freq_start": freq[:, 1].copy(),
+        "freq_end": freq[:, 2].copy(),
+        "freq_headway": freq[:, 3].copy(),
+        "svc_days": np.asarray(svc_days, dtype=np.uint8),
+        "svc_start": np.asarray(svc_start, dtype=np.int32),
+        "svc_end": np.asarray(svc_end, dtype=np.int32),
+        "exc_service": exc[:, 0].astype(np.int32),
+        "exc_date": exc[:, 1].astype(np.int32),
+        "exc_type": exc[:, 2].astype(np.int8),
+    }
+
+    stat = source.stat()
+    meta = {"version": FORMAT_VERSION, "source": {"path": source.name, "size": stat.st_size,
+                                                  "mtime_ns": stat.st_mtime_ns},
+            "stops": len(stop_pos), "trips": len(trip_pos), "stop_times": int(len(st_trip))}
+    save_arrays(directory, {name: arrays[name] for name in ARRAYS}, meta)
+    return arrays
+
+
+def _fill_missing_times(st_trip, st_arr, st_dep) -> Tuple[np.ndarray, np.ndarray]:
+    """Horas vacías (paradas sin hora en el GTFS) → la última hora conocida del viaje."""
+    missing = st_dep < 0
+    if not missing.any():
+        return st_arr, st_dep
+    idx = np.where(missing, 0, np.arange(len(st_dep)))
+    np.maximum.accumulate(idx, out=idx)
+    same_trip = st_trip[idx] == st_trip
+    fill = np.where(same_trip, st_dep[idx], -1)
+    return np.where(missing, fill, st_arr).astype(np.int32), np.where(missing, fill, st_dep).astype(np.int32)
+
+
+def is_fresh(source, directory) -> bool:
+    """True si ``directory`` tiene la compilación del zip actual."""
+    try:
+        with open(Path(directory) / "meta.json") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return False
+    stat = Path(source).stat()
+    src = meta.get("source", {})
+    return (meta.get("version") == FORMAT_VERSION and src.get("size") == stat.st_size
+            and src.get("mtime_ns") == stat.st_mtime_ns)
+
+
+# ------------------------
+# Consultas
+# ------------------------
+class Feed:
+    """Arrays de un feed compilado (proyectados en memoria) y sus consultas."""
+
+    def __init__(self, name: str, arrays: Dict[str, np.ndarray], version: str = ""):
+        self.name = name
+        self.version = version
+        for key in ARRAYS:
+            setattr(self, key, arrays[key])
+        routes: Dict[Tuple[int, str], List[int]] = {}
+        for r, (mode, line) in enumerate(zip(self.route_mode.tolist(), self.route_names.tolist())):
+            routes.setdefault((mode, line), []).append(r)
+        self._routes = {k: np.asarray(v, dtype=np.int32) for k, v in routes.items()}
+        self._active: Dict[dt.date, np.ndarray] = {}
+        self._tree = None
+
+    @classmethod
+    def load(cls, name: str, directory, mmap: bool = True) -> "Feed":
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        arrays = {key: np.load(directory / f"{key}.npy", mmap_mode=mode) for key in ARRAYS}
+        stat = (directory / "meta.json").stat()
+        return cls(name, arrays, version=f"{name}:{stat.st_size}-{stat.st_mtime_ns}")
+
+    def routes(self, mode: str, line: str) -> np.ndarray:
+        return self._routes.get((ROUTE_MODES.index(mode), normalize_line(line)), np.empty(0, dtype=np.int32))
+
+    def stops_near(self, lat: float, lon: float, radius_m: float = MATCH_RADIUS_M) -> np.ndarray:
+        """Paradas GTFS a menos de ``radius_m`` de (lat, lon)."""
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+
+            self._lat0 = float(np.radians(np.mean(self.stop_lat))) if len(self.stop_lat) else 0.0
+            self._tree = cKDTree(self._project(np.asarray(self.stop_lat), np.asarray(self.stop_lon)))
+        return np.asarray(self._tree.query_ball_point(self._project(lat, lon)[0], radius_m), dtype=np.intp)
+
+    def _project(self, lat, lon) -> np.ndarray:
+        from src.geo import EARTH_RADIUS_M
+
+        lat, lon = np.radians(np.atleast_1d(lat)), np.radians(np.atleast_1d(lon))
+        return np.column_stack([lon * np.cos(self._lat0), lat]) * EARTH_RADIUS_M
+
+    def active_services(self, day: dt.date) -> np.ndarray:
+        """Máscara de servicios que circulan el día ``day`` (memorizada por fecha)."""
+        mask = self._active.get(day)
+        if mask is None:
+            ymd = day.year * 10000 + day.month * 100 + day.day
+            mask = ((self.svc_days >> day.weekday()) & 1).astype(bool)
+            mask &= (self.svc_start <= ymd) & (ymd <= self.svc_end)
+            lo, hi = np.searchsorted(self.exc_date, [ymd, ymd + 1])
+            for svc, kind in zip(self.exc_service[lo:hi].tolist(), self.exc_type[lo:hi].tolist()):
+                mask[svc] = kind == 1
+            self._active[day] = mask
+        return mask
+
+    def next_ride(self, routes: np.ndarray, board: np.ndarray, alight: np.ndarray,
+                  t: int, day: dt.date) -> Optional[Tuple[int, int]]:
+        """(salida, llegada) en segundos del primer viaje de ``routes`` que sale de
+        alguna parada de ``board`` a partir de ``t`` y para después en ``alight``.
+
+        Los horarios GTFS pasan de las 24:00 en los viajes nocturnos: además del
+        día de servicio ``day`` se busca en el anterior (``t + 24 h``) y, si la
+        espera puede cruzar la medianoche, en el siguiente (``t - 24 h``). Los
+        segundos devueltos son relativos a ``day``.
+        """
+        best: Optional[Tuple[int, int]] = None
+        shifts = [(0, day), (_DAY_S, day - dt.timedelta(days=1))]
+        if t + MAX_WAIT_S >= _DAY_S:
+            shifts.append((-_DAY_S, day + dt.timedelta(days=1)))
+        for shift, service_day in shifts:
+            hit = self._next_ride_on(routes, board, alight, t + shift, service_day)
+            if hit is not None and (best is None or hit[1] - shift < best[1]):
+                best = (hit[0] - shift, hit[1] - shift)
+        if best is not None and best[0] - t > MAX_WAIT_S:
+            return None
+        return best
+
+    def _next_ride_on(self, routes: np.ndarray, board: np.ndarray, alight: np.ndarray,
+                      t: int, day: dt.date) -> Optional[Tuple[int, int]]:
+        """``next_ride`` dentro de un único día de servicio (``t`` en su reloj)."""
+        active = self.active_services(day)
+        on_route = np.zeros(len(self.route_names), dtype=bool)
+        on_route[routes] = True
+        alight_set = np.zeros(len(self.stop_ids), dtype=bool)
+        alight_set[alight] = True
+        best: Optional[Tuple[int, int]] = None
+
+        for s in board.tolist():
+            a, b = int(self.ev_ptr[s]), int(self.ev_ptr[s + 1])
+            lo = a + int(np.searchsorted(self.ev_dep[a:b], t))
+            window = self.ev_st[lo:min(b, lo + DEPARTURE_WINDOW)]
+            trips = self.st_trip[window]
+            ok = on_route[self.trip_route[trips]] & active[self.trip_service[trips]]
+            for st in window[ok].tolist():
+                dep = int(self.st_dep[st])
+                if best is not None and dep >= best[1]:
+                    break
+                end = int(self.trip_ptr[int(self.st_trip[st]) + 1])
+                hits = np.flatnonzero(alight_set[self.st_stop[st + 1:end]])
+                if len(hits):
+                    arr = int(self.st_arr[st + 1 + hits[0]])
+                    if best is None or arr < best[1]:
+                        best = (dep, arr)
+                    break
+
+        # viajes por frecuencia: salida = inicio + k·intervalo + desfase de la parada
+        for row in np.flatnonzero(np.isin(self.trip_route[self.freq_trip], routes)).tolist():
+            trip = int(self.freq_trip[row])
+            if not active[self.trip_service[trip]]:
+                continue
+            a, b = int(self.trip_ptr[trip]), int(self.trip_ptr[trip + 1])
+            stops = self.st_stop[a:b]
+            i_board = np.flatnonzero(np.isin(stops, board))
+            if not len(i_board):
+                continue
+            i = int(i_board[0])
+            later = np.flatnonzero(alight_set[stops[i + 1:]])
+            if not len(later):
+                continue
+            j = i + 1 + int(later[0])
+            base = int(self.st_dep[a])
+            offset, ride = int(self.st_dep[a + i]) - base, int(self.st_arr[a + j]) - int(self.st_dep[a + i])
+            start, end, headway = (int(self.freq_start[row]), int(self.freq_end[row]),
+                                   int(self.freq_headway[row]))
+            k = max(0, -(-(t - start - offset) // headway))
+            if start + k * headway < end:
+                dep = start + k * headway + offset
+                if best is None or dep + ride < best[1]:
+                    best = (dep, dep + ride)
+        return best
+
+
+class Timetables:
+    """Conjunto de feeds cargados; vacío si no hay ningún GTFS."""
+
+    def __init__(self, feeds: List[Feed]):
+        self.feeds = feeds
+        self.version = "|".join(f.version for f in feeds)
+
+    def __bool__(self) -> bool:
+        return bool(self.feeds)
+
+    def ride(self, mode: str, line: str, board: Tuple[float, float], alight: Tuple[float, float],
+             t: int, day: dt.date) -> Optional[Tuple[int, int]]:
+        """(salida, llegada) en segundos del siguiente vehículo de ``line`` entre dos puntos.
+
+        None si ningún feed tiene horario para ese tramo y ``NO_SERVICE`` si lo
+        tiene pero no sale ningún vehículo en ``MAX_WAIT_S``.
+        """
+        best, covered = None, False
+        for feed in self.feeds:
+            routes = feed.routes(mode, line)
+            if not len(routes):
+                continue
+            b_stops, a_stops = feed.stops_near(*board), feed.stops_near(*alight)
+            if not len(b_stops) or not len(a_stops):
+                continue
+            covered = True
+            hit = feed.next_ride(routes, b_stops, a_stops, t, day)
+            if hit is not None and (best is None or hit[1] < best[1]):
+                best = hit
+        if best is None and covered:
+            return NO_SERVICE
+        return best
+
+    def refine(self, network, journey, salida: dt.datetime) -> Optional[float]:
+        """Minutos del ``journey`` saliendo a la hora ``salida`` según los horarios.
+
+        Cada vehículo se toma en su siguiente salida tras llegar a la parada; los
+        tramos sin horario usan los minutos estáticos del trayecto (y la
+        penalización de transbordo de la red). None si algún vehículo con
+        horario ya no pasa (``NO_SERVICE``).
+        """
+        from src.transit_network import TRANSFER_PENALTY_MIN
+
+        t = salida.hour * 3600 + salida.minute * 60 + salida.second + journey.access_min * 60
+        prev = None
+        for k, leg in enumerate(journey.legs):
+            if prev is not None and prev != leg.board:
+                walk_m = haversine_many(network.lat[prev], network.lon[prev],
+                                        [network.lat[leg.board]], [network.lon[leg.board]])[0]
+                t += walk_m / 1000 / network.walk_speed_kmh * 3600
+            board = (float(network.lat[leg.board]), float(network.lon[leg.board]))
+            alight = (float(network.lat[leg.alight]), float(network.lon[leg.alight]))
+            hit = self.ride(leg.mode, leg.line, board, alight, int(t), salida.date())
+            if hit == NO_SERVICE:
+                return None
+            if hit is None:
+                t += (leg.minutes + (TRANSFER_PENALTY_MIN if k else 0.0)) * 60
+            else:
+                t = hit[1]
+            prev = leg.alight
+        t += journey.egress_min * 60
+        return (t - (salida.hour * 3600 + salida.minute * 60 + salida.second)) / 60
+
+
+_TIMETABLES: Optional[Timetables] = None
+
+
+def get_timetables() -> Timetables:
+    """Feeds presentes en ``GTFS_DIR``, compilados si hace falta y cargados una vez por proceso."""
+    global _TIMETABLES
+    if _TIMETABLES is None:
+        feeds = []
+        for name, filename in FEEDS.items():
+            source = GTFS_DIR / filename
+            directory = COMPILED_DIR / name
+            if source.exists() and not is_fresh(source, directory):
+                # con varios trabajadores arrancando a la vez solo uno compila
+                with build_lock(directory):
+                    if not is_fresh(source, directory):
+                        compile_feed(source, directory)
+            if (directory / "meta.json").exists():
+                feeds.append(Feed.load(name, directory))
+        _TIMETABLES = Timetables(feeds)
+    return _TIMETABLES
+
+
+def main(argv=None) -> None:
+    argv = argv if argv is not None else sys.argv[1:]
+    names = argv or list(FEEDS)
+    for name in names:
+        source = GTFS_DIR / FEEDS[name]
+        if not source.exists():
+            print(f"{name}: no existe {source}", file=sys.stderr)
+            continue
+        arrays = compile_feed(source, COMPILED_DIR / name)
+        print(f"{name}: {len(arrays['stop_ids'])} paradas, {len(arrays['trip_route'])} viajes, "
+              f"{len(arrays['st_trip'])} paradas de viaje → {COMPILED_DIR / name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# src/map_layers.py
+"""Capas de puntos del mapa con los datos mínimos, preparadas una vez por proceso.
+
+Pasar el GeoDataFrame entero a ``pdk.Layer`` obliga a convertir en cada rerun
+todas sus columnas (geometría incluida) a JSON, y añadir ``tooltip`` creaba
+una columna nueva cada vez. Aquí cada capa se reduce una sola vez a
+``lon``/``lat`` redondeados a ~1 m y el texto del tooltip, y la lista de
+registros ya filtrada se guarda por vista:
+
+* **recorte**: solo se envían los puntos dentro de la vista inicial del mapa
+  más ``VIEW_MARGIN`` vistas de margen por cada lado (Streamlit no devuelve la
+  vista del navegador, así que se recorta respecto a la que fija la app);
+* **agrupación**: si aun así quedan más de ``MAX_POINTS`` puntos, se agrupan en
+  una rejilla de ``CLUSTER_PX`` píxeles al zoom de la vista (doblando la celda
+  hasta caber); cada grupo se pinta en su centroide, con radio creciente y un
+  tooltip con el número de puntos.
+
+Así el JSON de cada capa tiene un tamaño acotado aunque se activen todas o
+se cargue un catálogo regional. Con los datos actuales de València ninguna
+capa llega al límite y se envían todos los puntos tal cual.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from src.profiling import stage
+
+# Estilo de cada capa: color, radio en metros, columna del tooltip (o texto fijo) y nombre en plural
+LAYER_STYLES = {
+    "monuments": {"color": [255, 100, 100], "radius": 20, "column": "nombre", "units": "monumentos"},
+    "buses": {"color": [0, 100, 255], "radius": 15, "text": "Parada EMT", "units": "paradas EMT"},
+    "metro": {"color": [160, 32, 240], "radius": 20, "column": "nombre", "units": "estaciones"},
+    "fonts": {"color": [0, 255, 0], "radius": 10, "text": "Fuente de agua", "units": "fuentes de agua"},
+}
+
+MAX_POINTS = 2000          # puntos por capa antes de agrupar
+VIEW_PX = (1200, 700)      # tamaño de referencia del mapa en pantalla
+VIEW_MARGIN = 1.0          # vistas de margen a cada lado al recortar
+CLUSTER_PX = 24            # lado mínimo de la celda de agrupación, en píxeles
+MAX_CACHED = 64            # listas de registros guardadas (capa × vista)
+
+_M_PER_DEG = 111320.0
+_M_PER_PX_Z0 = 156543.03   # metros por píxel a zoom 0 en el ecuador (Web Mercator)
+
+_POINTS: Dict[str, "LayerPoints"] = {}
+_PAYLOADS: "OrderedDict[tuple, list]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+class LayerPoints(NamedTuple):
+    """Coordenadas y tooltips de una capa, sin geometría ni columnas extra."""
+
+    key: str
+    lon: np.ndarray
+    lat: np.ndarray
+    tooltip: np.ndarray
+
+
+def layer_points(name: str, gdf=None) -> LayerPoints:
+    """Puntos de la capa ``name`` (de ``gdf`` o del registro de datos), extraídos una vez por conjunto."""
+    if gdf is None:
+        from src.data_loader import REGISTRY
+
+        gdf = REGISTRY.get(name)
+    lon = np.round(gdf["lon"].to_numpy(dtype=np.float64), 5)
+    lat = np.round(gdf["lat"].to_numpy(dtype=np.float64), 5)
+    key = hashlib.sha1(lat.tobytes() + lon.tobytes()).hexdigest()
+    points = _POINTS.get(name)
+    if points is None or points.key != key:
+        style = LAYER_STYLES[name]
+        if "column" in style:
+            tooltip = gdf[style["column"]].fillna("").astype(str).to_numpy()
+        else:
+            tooltip = np.full(len(gdf), style["text"], dtype=object)
+        points = LayerPoints(key, lon, lat, tooltip)
+        _POINTS[name] = points
+    return points
+
+
+def viewport_bounds(lat: float, lon: float, zoom: float, size_px: Tuple[int, int] = VIEW_PX,
+                    margin: float = VIEW_MARGIN) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lon_min, lon_max) de la vista centrada en (lat, lon) más ``margin`` vistas por lado."""
+    m_per_px = _m_per_px(lat, zoom)
+    half_w = size_px[0] * m_per_px * (0.5 + margin)
+    half_h = size_px[1] * m_per_px * (0.5 + margin)
+    dlat = half_h / _M_PER_DEG
+    dlon = half_w / (_M_PER_DEG * math.cos(math.radians(lat)))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def layer_records(name: str, view: Optional[Tuple[float, float, float]] = None, gdf=None) -> List[dict]:
+    """Registros ``{lon, lat, tooltip[, r]}`` de la capa para la vista ``(lat, lon, zoom)``.
+
+    Sin vista se envía la capa completa (agrupada si supera ``MAX_POINTS``).
+    La lista se reutiliza entre reruns mientras no cambien los datos ni la vista.
+    """
+    points = layer_points(name, gdf)
+    key = (name, points.key, _view_key(view))
+    with _LOCK:
+        records = _PAYLOADS.get(key)
+        if records is not None:
+            _PAYLOADS.move_to_end(key)
+            return records
+    with stage(f"mapa.{name}"):
+        records = _build_records(name, points, view)
+    with _LOCK:
+        _PAYLOADS[key] = records
+        while len(_PAYLOADS) > MAX_CACHED:
+            _PAYLOADS.popitem(last=False)
+    return records
+
+
+def point_layer(name: str, view: Optional[Tuple[float, float, float]] = None, gdf=None):
+    """``pdk.Layer`` de puntos con los registros mínimos de la capa ``name``."""
+    import pydeck as pdk
+
+    style = LAYER_STYLES[name]
+    records = layer_records(name, view, gdf)
+    clustered = bool(records) and "r" in records[0]
+    return pdk.Layer(
+        "ScatterplotLayer",
+        data=records,
+        get_position=["lon", "lat"],
+        get_color=style["color"],
+        get_radius="r" if clustered else style["radius"],
+        pickable=True,
+    )
+
+
+def clear() -> None:
+    """Olvida los puntos y registros preparados (p. ej. tras recargar los datos)."""
+    with _LOCK:
+        _POINTS.clear()
+        _PAYLOADS.clear()
+
+
+# ------------------------
+# Auxiliares
+# ------------------------
+def _m_per_px(lat: float, zoom: float) -> float:
+    return _M_PER_PX_Z0 * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def _view_key(view) -> Optional[tuple]:
+    """Vista discretizada: zoom entero y centro en celdas de un cuarto de vista."""
+    if view is None:
+        return None
+    lat, lon, zoom = view
+    zoom = int(round(zoom))
+    step_m = min(VIEW_PX) * _m_per_px(lat, zoom) / 4
+    return (zoom,
+            round(lat * _M_PER_DEG / step_m),
+            round(lon * _M_PER_DEG * math.cos(math.radians(lat)) / step_m))
+
+
+def _build_records(name: str, points: LayerPoints, view) -> List[dict]:
+    lon, lat, tooltip = points.lon, points.lat, points.tooltip
+    if view is not None:
+        lat_min, lat_max, lon_min, lon_max = viewport_bounds(*view)
+        inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+        lon, lat, tooltip = lon[inside], lat[inside], tooltip[inside]
+    if len(lon) <= MAX_POINTS:
+        return [{"lon": x, "lat": y, "tooltip": t}
+                for x, y, t in zip(lon.tolist(), lat.tolist(), tooltip.tolist())]
+    return _cluster_records(name, lon, lat, tooltip, view)
+
+
+def _cluster_records(name: str, lon, lat, tooltip, view) -> List[dict]:
+    """Agrupa los puntos en celdas cada vez mayores hasta que quedan ``MAX_POINTS`` o menos."""
+    style = LAYER_STYLES[name]
+    lat_mid = float(view[0]) if view is not None else float(np.mean(lat))
+    zoom = float(view[2]) if view is not None else 12.0
+    cos_lat = math.cos(math.radians(lat_mid))
+    cell_m = CLUSTER_PX * _m_per_px(lat_mid, zoom)
+    while True:
+        rows = np.floor(lat * _M_PER_DEG / cell_m).astype(np.int64)
+        cols = np.floor(lon * _M_PER_DEG * cos_lat / cell_m).astype(np.int64)
+        _, group, counts = np.unique(rows * (1 << 32) + cols, return_inverse=True, return_counts=True)
+        if len(counts) <= MAX_POINTS:
+            break
+        cell_m *= 2
+    group = group.ravel()
+    c_lon = np.round(np.bincount(group, weights=lon) / counts, 5)
+    c_lat = np.round(np.bincount(group, weights=lat) / counts, 5)
+    first = np.zeros(len(counts), dtype=np.intp)
+    first[group[::-1]] = np.arange(len(group))[::-1]  # primer punto de cada grupo
+    radius = style["radius"] * np.sqrt(counts)
+    units = style["units"]
+    return [
+        {"lon": x, "lat": y, "tooltip": tooltip[i] if n == 1 else f"{n} {units}", "r": r}
+        for x, y, i, n, r in zip(c_lon.tolist(), c_lat.tolist(), first.tolist(), counts.tolist(),
+                                 radius.round(1).tolist())
+    ]
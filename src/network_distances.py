@@ -0,0 +1,223 @@
+# src/network_distances.py
+"""Distancias a pie por la red de calles entre monumentos y paradas.
+
+La tabla se construye offline a partir del grafo CSR: cada monumento (sin
+coordenadas repetidas) y cada parada de bus y metro se ajusta a su nodo, y un
+Dijkstra multi-origen acotado a ``LIMIT_M`` rellena la matriz de metros entre
+todos ellos (más lo que separa cada punto de su nodo). El planificador la
+consulta por coordenadas, sin lanzar ningún Dijkstra durante la selección.
+
+Para puntos que no están en la tabla (el alojamiento) o pares más lejanos que
+el límite se usa la distancia en línea recta multiplicada por el factor de
+rodeo medio de la propia tabla.
+
+Uso offline::
+
+    python -m src.network_distances
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from src.data_loader import MAX_DENSE_POIS, PROCESSED_DIR
+from src.geo import PairDistances, haversine_many, haversine_matrix, haversine_pairwise
+
+TABLE_PATH = PROCESSED_DIR / "network_distances.npz"
+LIMIT_M = 6000.0          # más allá, nadie va a pie: se usa la estimación
+DEFAULT_DETOUR = 1.3      # factor de rodeo si no hay tabla con la que calibrarlo
+BATCH_SOURCES = 64        # orígenes por llamada a Dijkstra (acota la memoria)
+
+
+def _key(lat: float, lon: float) -> Tuple[float, float]:
+    return round(float(lat), 7), round(float(lon), 7)
+
+
+class NetworkDistanceTable:
+    """Matriz de metros a pie entre puntos conocidos, con estimación para el resto."""
+
+    def __init__(self, lat, lon, meters, detour: float = DEFAULT_DETOUR, version: str = ""):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.meters = meters  # float32 (n, n); NaN = fuera del límite
+        self.detour = float(detour)
+        self.version = version
+        self._index: Dict[Tuple[float, float], int] = {
+            _key(a, b): k for k, (a, b) in enumerate(zip(self.lat, self.lon))}
+        self._matrices: Dict[bytes, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def index_of(self, lats, lons) -> np.ndarray:
+        """Fila de la tabla para cada punto (-1 si no está)."""
+        return np.fromiter((self._index.get(_key(a, b), -1) for a, b in zip(lats, lons)),
+                           dtype=np.intp, count=len(lats))
+
+    def distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        """Metros a pie entre dos puntos."""
+        i = self._index.get(_key(lat1, lon1), -1)
+        j = self._index.get(_key(lat2, lon2), -1)
+        if i >= 0 and j >= 0 and not np.isnan(self.meters[i, j]):
+            return float(self.meters[i, j])
+        return float(haversine_many(lat1, lon1, [lat2], [lon2])[0]) * self.detour
+
+    def from_point(self, lat: float, lon: float, lats, lons) -> np.ndarray:
+        """Metros a pie desde un punto a muchos."""
+        est = haversine_many(lat, lon, lats, lons) * self.detour
+        i = self._index.get(_key(lat, lon), -1)
+        if i < 0:
+            return est
+        idx = self.index_of(lats, lons)
+        known = idx >= 0
+        row = np.full(len(idx), np.nan)
+        row[known] = self.meters[i, idx[known]]
+        return np.where(np.isnan(row), est, row)
+
+    def matrix_for(self, lats, lons) -> np.ndarray:
+        """Matriz (n, n) de metros a pie entre los puntos dados (memorizada, solo lectura).
+
+        Con más de ``MAX_DENSE_POIS`` puntos es una ``PairDistances`` que
+        consulta la tabla solo en las celdas que se piden.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        key = lats.tobytes() + lons.tobytes()
+        matrix = self._matrices.get(key)
+        if matrix is None and len(lats) > MAX_DENSE_POIS:
+            matrix = self._matrices[key] = PairDistances(lats, lons, self._cells(lats, lons))
+        if matrix is None:
+            from src.shared_data import get_shared
+
+            def build():
+                matrix = haversine_matrix(lats, lons) * self.detour
+                idx = self.index_of(lats, lons)
+                known = np.flatnonzero(idx >= 0)
+                sub = self.meters[np.ix_(idx[known], idx[known])]
+                block = matrix[np.ix_(known, known)]
+                matrix[np.ix_(known, known)] = np.where(np.isnan(sub), block, sub)
+                np.fill_diagonal(matrix, 0.0)
+                return {"meters": matrix}, {}
+
+            fp = hashlib.sha1(key + f"{self.version}:{self.detour}".encode()).hexdigest()
+            matrix = get_shared("network_matrix", fp, build)["meters"]
+            self._matrices[key] = matrix
+        return matrix
+
+    def _cells(self, lats, lons):
+        """Función de celdas para ``PairDistances``: tabla si ambos puntos están, estimación si no."""
+        idx = self.index_of(lats, lons)
+
+        def cells(i, j):
+            a, b = np.broadcast_arrays(idx[i], idx[j])
+            est = haversine_pairwise(lats[i], lons[i], lats[j], lons[j]) * self.detour
+            out = np.array(np.broadcast_to(est, a.shape))
+            known = (a >= 0) & (b >= 0)
+            table = self.meters[a[known], b[known]]
+            out[known] = np.where(np.isnan(table), out[known], table)
+            out[np.broadcast_to(i, a.shape) == np.broadcast_to(j, a.shape)] = 0.0
+            return out
+
+        return cells
+
+    # ------------------------
+    # Construcción y persistencia
+    # ------------------------
+    @classmethod
+    def build(cls, router, lat, lon, limit_m: float = LIMIT_M) -> "NetworkDistanceTable":
+        """Calcula la tabla sobre la red de ``router`` (un ``WalkRouter``)."""
+        from scipy.sparse.csgraph import dijkstra
+
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        nodes = router.snap_many(list(zip(lon, lat)))
+        g = router.graph
+        snap_m = haversine_pairwise(lat, lon, g.y[nodes], g.x[nodes])  # punto → su nodo
+
+        uniq, inverse = np.unique(nodes, return_inverse=True)
+        node_m = np.full((len(uniq), len(uniq)), np.inf, dtype=np.float32)
+        for start in range(0, len(uniq), BATCH_SOURCES):
+            batch = uniq[start:start + BATCH_SOURCES]
+            dist = dijkstra(router._matrix, indices=batch, limit=limit_m)
+            node_m[start:start + len(batch)] = dist[:, uniq]
+
+        meters = node_m[np.ix_(inverse, inverse)] + snap_m[:, None] + snap_m[None, :]
+        meters[meters > limit_m] = np.nan
+        np.fill_diagonal(meters, 0.0)
+
+        straight = haversine_matrix(lat, lon)
+        ok = ~np.isnan(meters) & (straight > 200) & (straight < 3000)
+        detour = float(np.median(meters[ok] / straight[ok])) if ok.any() else DEFAULT_DETOUR
+        return cls(lat, lon, meters.astype(np.float32), detour=detour)
+
+    def save(self, path: Path = TABLE_PATH) -> None:
+        from src.shared_data import share_permissions
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".npz")
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, lat=self.lat, lon=self.lon, meters=self.meters, detour=self.detour)
+        share_permissions(tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path = TABLE_PATH) -> "NetworkDistanceTable":
+        """Tabla guardada; la matriz se publica en ``shared_data`` y se abre sin copia."""
+        from src.shared_data import get_shared
+
+        stat = path.stat()
+        version = f"{stat.st_size}-{stat.st_mtime_ns}"
+
+        def build():
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {k: data[k] for k in ("lat", "lon", "meters")}
+                return arrays, {"detour": float(data["detour"])}
+
+        fp = hashlib.sha1(f"{path.resolve()}:{version}".encode()).hexdigest()
+        table = get_shared("network_distances", fp, build)
+        return cls(table["lat"], table["lon"], table["meters"], table.meta["detour"], version=version)
+
+
+_TABLE: Optional[NetworkDistanceTable] = None
+
+
+def get_network_table() -> NetworkDistanceTable:
+    """Tabla persistida, cargada una vez por proceso.
+
+    Si todavía no se ha construido se devuelve una tabla vacía: todas las
+    distancias salen de la estimación en línea recta × ``DEFAULT_DETOUR``.
+    """
+    global _TABLE
+    if _TABLE is None:
+        if TABLE_PATH.exists():
+            _TABLE = NetworkDistanceTable.load(TABLE_PATH)
+        else:
+            _TABLE = NetworkDistanceTable([], [], np.empty((0, 0), dtype=np.float32))
+    return _TABLE
+
+
+def main() -> None:
+    from src.data_loader import load_buses, load_metro, load_monuments
+    from src.walk_graph import load_walk_csr
+    from src.walk_routing import WalkRouter
+
+    router = WalkRouter(load_walk_csr())
+    mon = load_monuments()
+    coords = {}
+    for gdf in (mon, load_buses(), load_metro()):
+        for a, b in zip(gdf.geometry.y, gdf.geometry.x):
+            coords.setdefault(_key(a, b), (a, b))
+    lat, lon = np.asarray(list(coords.values())).T
+    table = NetworkDistanceTable.build(router, lat, lon)
+    table.save()
+    print(f"{len(table)} puntos, factor de rodeo {table.detour:.2f} → {TABLE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# src/poi_clusters.py
+"""Planificación jerárquica por barrios: catálogos grandes y rutas de varios días.
+
+El voraz de ``route_generator`` vuelve a ordenar todos los candidatos en cada
+paso, así que su coste crece con el tamaño del catálogo aunque el día solo dé
+para una docena de visitas. Con el catálogo regional (decenas de miles de
+fuentes, museos, miradores…) casi todo ese trabajo se hace sobre puntos a
+kilómetros de la ruta. Aquí el catálogo se descompone en dos niveles:
+
+* **barrios**: k-means (``MiniBatchKMeans`` de scikit-learn) sobre
+  coordenadas métricas, con unos ``CLUSTER_SIZE`` monumentos por grupo; se
+  calcula una vez por conjunto de monumentos;
+* **selección**: para una petición se eligen barrios a partir del
+  alojamiento, creciendo siempre hacia el más cercano a lo ya elegido, hasta
+  reunir ``CLUSTER_SLACK`` candidatos por cada visita que cabe en el horario;
+  los barrios de los imprescindibles entran siempre.
+
+El voraz planifica después solo dentro de los barrios elegidos, de modo que
+cada paso cuesta lo mismo con mil monumentos que con cincuenta mil; lo único
+que recorre el catálogo entero son operaciones vectorizadas (filtro de
+candidatos y recuento por barrio). Como el voraz, al elegir el más cercano,
+apenas se aleja del alojamiento más de lo que el horario permite, restringirlo
+a los barrios que lo rodean cambia poco la ruta: la pérdida queda acotada por
+la holgura ``CLUSTER_SLACK``.
+
+``generar_ruta`` lo aplica solo a partir de ``CLUSTERED_MIN_POIS`` monumentos
+(con los de València planifica sobre todo el catálogo, igual que antes).
+
+``planificar_dias`` reparte además una estancia de varios días: elige barrios
+para todos los días, divide sus candidatos en sectores angulares alrededor
+del alojamiento (barrido) con el mismo número de candidatos cada uno, y
+planifica cada día dentro de su sector sin repetir monumentos. Los
+imprescindibles que no caben en su día pasan al siguiente.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import math
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from src.geo import haversine_many
+from src.poi_store import POIStore, get_poi_store
+from src.profiling import count, stage
+from src.route_generator import (OPTIMIZED_TIME_LIMIT_S, VISIT_DURATION_MIN, WALK_SPEED_KMH, DecisionPaso,
+                                 iter_ruta)
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+CLUSTER_SIZE = 40            # monumentos por barrio, de media
+CLUSTERED_MIN_POIS = 2000    # a partir de aquí generar_ruta planifica por barrios
+CLUSTER_SLACK = 3.0          # candidatos reunidos por cada visita que cabe en el horario
+
+_M_PER_DEG = 111320.0
+
+_CLUSTERS: Dict[Tuple[str, int], "POIClusters"] = {}
+
+
+class POIClusters:
+    """Barrios de un almacén de monumentos: etiqueta por fila, centros y miembros."""
+
+    def __init__(self, store: POIStore, size: int = CLUSTER_SIZE):
+        n = len(store)
+        k = max(1, min(n, round(n / size)))
+        cos_lat = math.cos(math.radians(float(np.mean(store.lat)))) if n else 1.0
+        xy = np.column_stack([store.lon * _M_PER_DEG * cos_lat, store.lat * _M_PER_DEG])
+        if k > 1:
+            from sklearn.cluster import MiniBatchKMeans  # diferido: importar sklearn cuesta ~1 s
+
+            with stage("barrios.kmeans"):
+                km = MiniBatchKMeans(n_clusters=k, random_state=0, n_init=3, batch_size=4096)
+                labels = km.fit_predict(xy)
+        else:
+            labels = np.zeros(n, dtype=np.intp)
+        # k-means puede dejar grupos vacíos: etiquetas consecutivas 0..k-1
+        _, labels = np.unique(labels, return_inverse=True)
+        self.labels = labels.ravel().astype(np.intp)
+        self.k = int(self.labels.max()) + 1 if n else 0
+
+        sizes = np.bincount(self.labels, minlength=self.k)
+        self.order = np.argsort(self.labels, kind="stable")  # filas agrupadas por barrio
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)])
+        self.lat = np.bincount(self.labels, weights=store.lat, minlength=self.k) / np.maximum(sizes, 1)
+        self.lon = np.bincount(self.labels, weights=store.lon, minlength=self.k) / np.maximum(sizes, 1)
+        # salto típico entre dos monumentos del mismo barrio: distancia media al centro
+        to_center = np.hypot(*(xy - np.column_stack([self.lon * _M_PER_DEG * cos_lat,
+                                                     self.lat * _M_PER_DEG])[self.labels]).T)
+        radius = np.bincount(self.labels, weights=to_center, minlength=self.k) / np.maximum(sizes, 1)
+        self.hop_m = float(np.median(radius)) if self.k else 0.0
+
+    def __len__(self) -> int:
+        return self.k
+
+    def members(self, cluster: int) -> np.ndarray:
+        """Filas del almacén del barrio ``cluster``."""
+        return self.order[self.offsets[cluster]:self.offsets[cluster + 1]]
+
+    def visits_for(self, minutos: float) -> float:
+        """Visitas que caben en ``minutos`` saltando entre monumentos de un barrio."""
+        hop_min = self.hop_m / 1000 / WALK_SPEED_KMH * 60
+        return max(0.0, minutos) / (VISIT_DURATION_MIN + hop_min)
+
+
+def get_clusters(store: POIStore, size: int = CLUSTER_SIZE) -> POIClusters:
+    """Barrios de ``store``, calculados una vez por conjunto de monumentos."""
+    key = (store.fingerprint, size)
+    clusters = _CLUSTERS.get(key)
+    if clusters is None:
+        clusters = _CLUSTERS[key] = POIClusters(store, size)
+    return clusters
+
+
+def elegir_barrios(clusters: POIClusters, cuenta: np.ndarray, start_coord: Tuple[float, float],
+                   objetivo: float, obligatorios: Sequence[int] = ()) -> np.ndarray:
+    """Barrios (en orden de elección) que reúnen ``objetivo`` candidatos alrededor del alojamiento.
+
+    ``cuenta`` son los candidatos de cada barrio. Se parte de los barrios
+    ``obligatorios`` y se añade cada vez el barrio con candidatos más cercano
+    al alojamiento o a cualquiera de los ya elegidos.
+    """
+    elegidos = list(dict.fromkeys(int(c) for c in obligatorios))
+    libre = cuenta > 0
+    libre[elegidos] = False
+    cerca = haversine_many(start_coord[0], start_coord[1], clusters.lat, clusters.lon)
+    for c in elegidos:
+        np.minimum(cerca, haversine_many(clusters.lat[c], clusters.lon[c], clusters.lat, clusters.lon), out=cerca)
+    total = int(cuenta[elegidos].sum())
+    while total < objetivo and libre.any():
+        c = int(np.flatnonzero(libre)[np.argmin(cerca[libre])])
+        elegidos.append(c)
+        libre[c] = False
+        total += int(cuenta[c])
+        np.minimum(cerca, haversine_many(clusters.lat[c], clusters.lon[c], clusters.lat, clusters.lon), out=cerca)
+    return np.asarray(elegidos, dtype=np.intp)
+
+
+def restringir(store: POIStore, cand: np.ndarray, start_coord: Tuple[float, float], minutos: float,
+               imprescindibles: Sequence[str]) -> np.ndarray:
+    """Candidatos de ``cand`` (en el mismo orden) que caen en los barrios elegidos para la petición."""
+    with stage("ruta.barrios"):
+        clusters = get_clusters(store)
+        labels = clusters.labels[cand]
+        cuenta = np.bincount(labels, minlength=len(clusters))
+        obligatorios = labels[store.name_mask(imprescindibles)[cand]]
+        elegidos = elegir_barrios(clusters, cuenta, start_coord,
+                                  clusters.visits_for(minutos) * CLUSTER_SLACK, obligatorios)
+        count("barrios.elegidos", len(elegidos))
+        return cand[np.isin(labels, elegidos)]
+
+
+# ------------------------
+# Varios días
+# ------------------------
+def repartir_dias(store: POIStore, filas: np.ndarray, start_coord: Tuple[float, float],
+                  dias: int) -> List[np.ndarray]:
+    """Reparte ``filas`` en ``dias`` sectores alrededor del alojamiento (barrido).
+
+    Los monumentos se ordenan por ángulo visto desde el alojamiento,
+    empezando tras el mayor hueco angular para no partir un grupo compacto, y
+    se cortan en tramos consecutivos del mismo tamaño. Se reparten
+    monumentos y no barrios enteros: un barrio denso del centro puede dar
+    para más de un día.
+    """
+    if dias <= 1 or len(filas) == 0:
+        return [filas] + [filas[:0]] * (max(dias, 1) - 1)
+    lat0, lon0 = start_coord
+    ang = np.arctan2((store.lat[filas] - lat0) * _M_PER_DEG,
+                     (store.lon[filas] - lon0) * _M_PER_DEG * math.cos(math.radians(lat0)))
+    orden = np.argsort(ang, kind="stable")
+    gaps = np.diff(np.append(ang[orden], ang[orden[0]] + 2 * math.pi))
+    orden = np.roll(orden, -(int(np.argmax(gaps)) + 1))
+    return [np.sort(filas[parte]) for parte in np.array_split(orden, dias)]
+
+
+def planificar_dias(
+    gdf_monumentos: gpd.GeoDataFrame,
+    start_coord: Tuple[float, float],
+    dias: int,
+    inicio_hora: dt.time,
+    fin_hora: dt.time,
+    imprescindibles: List[str],
+    preferencias_tipo: List[str],
+    transporte: str = "ambos",
+    incluir_pausa_comida: bool = True,
+    engine: str = "greedy",
+    time_limit_s: float = OPTIMIZED_TIME_LIMIT_S,
+    walk_metric: str = "haversine",
+) -> List[List[Dict]]:
+    """Itinerario de cada día (mismo horario todos los días), sin repetir monumentos.
+
+    Devuelve una lista con los pasos de cada día, como ``generar_ruta``; un
+    día sin monumentos asignados queda vacío.
+    """
+    if dias < 1:
+        raise ValueError(f"Número de días no válido: {dias}")
+    store = get_poi_store(gdf_monumentos)
+    imprescindibles = [n for n in imprescindibles if n in store.name_index]
+    with stage("dias.reparto"):
+        clusters = get_clusters(store)
+        cand = store.candidates(preferencias_tipo, imprescindibles)
+        labels = clusters.labels[cand]
+        cuenta = np.bincount(labels, minlength=len(clusters))
+        minutos = (dt.datetime.combine(dt.date.today(), fin_hora)
+                   - dt.datetime.combine(dt.date.today(), inicio_hora)).total_seconds() / 60
+        obligatorios = labels[store.name_mask(imprescindibles)[cand]]
+        elegidos = elegir_barrios(clusters, cuenta, start_coord,
+                                  clusters.visits_for(minutos) * CLUSTER_SLACK * dias, obligatorios)
+        sectores = repartir_dias(store, cand[np.isin(labels, elegidos)], start_coord, dias)
+
+    visitados = store.new_visited()
+    pendientes: List[str] = []  # imprescindibles que no cupieron en su día
+    itinerarios = []
+    for sector in sectores:
+        filas = sector[~visitados[store.name_code[sector]]]
+        en_sector = set(store.nombres[filas].tolist())
+        imp_dia = pendientes + [n for n in imprescindibles if n in en_sector and n not in pendientes]
+        filas = np.union1d(filas, [store.row_of(n) for n in pendientes]).astype(np.intp)
+        if not len(filas):
+            itinerarios.append([])
+            continue
+        decisiones: List[DecisionPaso] = []
+        itinerarios.append(list(iter_ruta(
+            gdf_monumentos, start_coord, inicio_hora, fin_hora, imp_dia, preferencias_tipo, transporte,
+            incluir_pausa_comida, engine, time_limit_s, walk_metric, registro=decisiones, filas=filas,
+        )))
+        for d in decisiones:
+            visitados[store.name_code[d.elegido]] = True
+        pendientes = [n for n in imp_dia if not visitados[store.name_index[n]]]
+    return itinerarios
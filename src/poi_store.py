@@ -0,0 +1,125 @@
+# src/poi_store.py
+"""Almacén columnar de monumentos para el bucle de planificación.
+
+Se construye una vez a partir del GeoDataFrame de ``load_monuments()`` y guarda
+arrays paralelos (lat/lon en float64, ``tipo`` codificado como entero, nombre
+codificado como entero) más la posición de cada fila en el GeoDataFrame de
+origen, que es la que usan la matriz de distancias y la tabla de transporte.
+Las filas repetidas del GeoJSON (mismo nombre, tipo y coordenadas) se
+guardan una sola vez.
+
+El planificador trabaja con índices enteros sobre este almacén y un array
+booleano de visitados por nombre; los GeoDataFrames solo aparecen al entrar
+y salir de ``generar_ruta``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING, Dict, Iterable, List
+
+import numpy as np
+
+from src.data_loader import monument_distance_matrix
+from src.geo import PairDistances
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+_STORES: Dict[str, "POIStore"] = {}
+
+
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    arr.setflags(write=False)
+    return arr
+
+
+class POIStore:
+    """Arrays paralelos de monumentos, indexados por fila del almacén."""
+
+    def __init__(self, gdf: gpd.GeoDataFrame):
+        lat = gdf.geometry.y.to_numpy(dtype=np.float64)
+        lon = gdf.geometry.x.to_numpy(dtype=np.float64)
+        nombres = gdf["nombre"].astype(str).to_numpy(dtype=object)
+        tipos = gdf["tipo"].astype(str).to_numpy(dtype=object)
+
+        seen = set()
+        keep = []
+        for pos, key in enumerate(zip(nombres, tipos, lat, lon)):
+            if key not in seen:
+                seen.add(key)
+                keep.append(pos)
+        keep = np.asarray(keep, dtype=np.intp)
+
+        self.fingerprint = ""       # huella del GeoDataFrame (la asigna get_poi_store)
+        self.pos = _readonly(keep)  # fila → posición en el GeoDataFrame de origen
+        self.lat = _readonly(lat[keep])
+        self.lon = _readonly(lon[keep])
+        self.nombres = _readonly(nombres[keep])
+        self.tipos = tuple(dict.fromkeys(tipos[keep]))
+        tipo_codes = {t: k for k, t in enumerate(self.tipos)}
+        self.tipo = _readonly(np.asarray([tipo_codes[t] for t in tipos[keep]], dtype=np.int8))
+
+        # Nombre ↔ código: el planificador identifica los monumentos por nombre
+        self.names = tuple(dict.fromkeys(self.nombres))
+        self.name_index = {n: k for k, n in enumerate(self.names)}
+        self.name_code = _readonly(np.asarray([self.name_index[n] for n in self.nombres], dtype=np.intp))
+        first_row = np.full(len(self.names), -1, dtype=np.intp)
+        for row in range(len(keep) - 1, -1, -1):
+            first_row[self.name_code[row]] = row
+        self.first_row = _readonly(first_row)  # código de nombre → primera fila
+
+        full = monument_distance_matrix(gdf)
+        # sin filas repetidas se usa la matriz compartida tal cual, sin copiarla
+        if len(keep) == len(full):
+            self.dist = full
+        elif isinstance(full, PairDistances):
+            self.dist = full.take(keep)  # catálogo grande: celdas bajo demanda
+        else:
+            self.dist = _readonly(full[np.ix_(keep, keep)])
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def row_of(self, nombre: str) -> int:
+        """Primera fila del almacén con ese nombre (``KeyError`` si no existe)."""
+        return int(self.first_row[self.name_index[nombre]])
+
+    def tipo_mask(self, tipos: Iterable[str]) -> np.ndarray:
+        codes = [k for k, t in enumerate(self.tipos) if t in set(tipos)]
+        return np.isin(self.tipo, codes)
+
+    def name_mask(self, nombres: Iterable[str]) -> np.ndarray:
+        codes = [self.name_index[n] for n in nombres if n in self.name_index]
+        return np.isin(self.name_code, codes)
+
+    def candidates(self, preferencias_tipo: List[str], imprescindibles: List[str]) -> np.ndarray:
+        """Filas candidatas: tipos preferidos (o todos) más imprescindibles, una por nombre.
+
+        Si un nombre aparece con varios tipos se queda la primera fila que pase el
+        filtro, igual que el ``drop_duplicates("nombre")`` original.
+        """
+        mask = self.tipo_mask(preferencias_tipo) if preferencias_tipo else np.ones(len(self), dtype=bool)
+        imp = self.name_mask(imprescindibles)
+        rows = np.concatenate([np.flatnonzero(imp), np.flatnonzero(mask & ~imp)])
+        _, first = np.unique(self.name_code[rows], return_index=True)
+        return rows[np.sort(first)]
+
+    def new_visited(self) -> np.ndarray:
+        """Máscara de visitados indexada por código de nombre."""
+        return np.zeros(len(self.names), dtype=bool)
+
+
+def get_poi_store(gdf: gpd.GeoDataFrame) -> POIStore:
+    """Almacén para ``gdf``, construido una vez por conjunto de monumentos."""
+    h = hashlib.sha1()
+    h.update(gdf.geometry.y.to_numpy(dtype=np.float64).tobytes())
+    h.update(gdf.geometry.x.to_numpy(dtype=np.float64).tobytes())
+    h.update("\x1f".join(gdf["nombre"].astype(str)).encode())
+    h.update("\x1f".join(gdf["tipo"].astype(str)).encode())
+    key = h.hexdigest()
+    store = _STORES.get(key)
+    if store is None:
+        store = _STORES[key] = POIStore(gdf)
+        store.fingerprint = key
+    return store
@@ -0,0 +1,149 @@
+# src/profiling.py
+"""Temporizadores y contadores por etapa para localizar peticiones lentas.
+
+Las etapas se marcan en el código con ``stage("nombre")`` (bloque) o
+``@timed("nombre")`` (función). Solo se mide algo mientras hay un
+``Profiler`` activo en el contexto actual::
+
+    with Profiler() as perfil:
+        generar_ruta(...)
+    perfil.to_json("perfil.json")
+
+Sin perfilador activo, ``stage`` devuelve un contexto vacío compartido y
+``timed`` llama directamente a la función: el coste es una consulta a una
+``ContextVar`` por llamada. Cada hilo (cada sesión de Streamlit) tiene su
+propio perfilador.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import time
+from typing import Dict, List, Optional
+
+_ACTIVE: contextvars.ContextVar = contextvars.ContextVar("perfilador", default=None)
+
+
+class _Timer:
+    __slots__ = ("profiler", "name", "t0")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """Acumula por etapa llamadas, tiempo total y máximo (segundos)."""
+
+    def __init__(self):
+        self.stats: Dict[str, List[float]] = {}  # etapa → [llamadas, total, máximo]
+        self.wall_s = 0.0
+        self._t0 = None
+        self._token = None
+
+    def record(self, name: str, seconds: float, calls: int = 1) -> None:
+        entry = self.stats.get(name)
+        if entry is None:
+            self.stats[name] = [calls, seconds, seconds]
+        else:
+            entry[0] += calls
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+    def start(self) -> "Profiler":
+        self._token = _ACTIVE.set(self)
+        self._t0 = time.perf_counter()
+        return self
+
+    def stop(self) -> "Profiler":
+        if self._token is not None:
+            self.wall_s += time.perf_counter() - self._t0
+            _ACTIVE.reset(self._token)
+            self._token = None
+        return self
+
+    def __enter__(self) -> "Profiler":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def summary(self) -> List[Dict]:
+        """Filas por etapa ordenadas por tiempo total, en milisegundos."""
+        rows = [{"etapa": name, "llamadas": int(calls), "total_ms": round(total * 1000, 2),
+                 "media_ms": round(total / calls * 1000, 3) if calls else 0.0,
+                 "max_ms": round(peak * 1000, 2)}
+                for name, (calls, total, peak) in self.stats.items()]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def as_dict(self) -> Dict:
+        return {"wall_ms": round(self.wall_s * 1000, 2), "etapas": self.summary()}
+
+    def to_json(self, path=None, **kwargs) -> str:
+        """Serializa el perfil; si se da ``path`` también lo escribe en disco."""
+        text = json.dumps(self.as_dict(), ensure_ascii=False, indent=2, **kwargs)
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(text)
+        return text
+
+
+def active() -> Optional[Profiler]:
+    return _ACTIVE.get()
+
+
+def stage(name: str):
+    """Contexto que mide el bloque como etapa ``name`` (vacío sin perfilador)."""
+    profiler = _ACTIVE.get()
+    if profiler is None:
+        return _NULL_STAGE
+    return _Timer(profiler, name)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Suma ``n`` llamadas a la etapa ``name`` sin medir tiempo."""
+    profiler = _ACTIVE.get()
+    if profiler is not None:
+        profiler.record(name, 0.0, calls=n)
+
+
+def timed(name: str):
+    """Decorador: cada llamada a la función cuenta como etapa ``name``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = _ACTIVE.get()
+            if profiler is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.record(name, time.perf_counter() - t0)
+        return wrapper
+    return decorator
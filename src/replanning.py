@@ -0,0 +1,259 @@
+# src/replanning.py
+"""Replanificación incremental: al retocar una petición solo se rehace lo que cambia.
+
+El usuario ajusta la ruta de una en una (añade un imprescindible, retrasa la
+hora de fin media hora…) y cada ajuste volvía a ejecutar ``generar_ruta``
+entera y a calcular otra vez todos los caminos a pie. ``PlanRuta`` guarda,
+junto al itinerario, la decisión de cada paso del voraz
+(``route_generator.DecisionPaso``) y la geometría de cada tramo. Al
+replanificar se calcula cuántos pasos del plan anterior seguirían siendo
+idénticos con la petición nueva; esos se repiten sin evaluar candidatos ni
+transporte, el voraz continúa desde ahí, y los tramos cuyo origen y destino
+no cambian reutilizan su camino.
+
+Qué cambios conservan pasos (con el motor voraz):
+
+* **hora de fin**: un paso se repite igual mientras el tiempo restante siga
+  en ``[necesita, rechazo)`` (ver ``DecisionPaso``); el primero que se sale
+  marca dónde se rehace el resto;
+* **imprescindibles**: el voraz se orienta hacia el primer imprescindible
+  pendiente, así que los pasos se conservan mientras ese primero coincida
+  y ningún candidato nuevo (un imprescindible fuera de las preferencias)
+  quede por delante del elegido.
+
+Cualquier otro cambio (alojamiento, preferencias, transporte, hora de inicio,
+motor optimizado) replanifica desde el principio; solo se reutilizan caminos.
+En catálogos grandes (``poi_clusters``) además la petición nueva tiene que
+elegir los mismos barrios alrededor del alojamiento.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.geo import haversine_many
+from src.network_distances import get_network_table
+from src.poi_store import get_poi_store
+from src.poi_clusters import CLUSTERED_MIN_POIS
+from src.profiling import count
+from src.route_cache import _clean
+from src.route_generator import OPTIMIZED_TIME_LIMIT_S, DecisionPaso, candidatos_por_barrios, iter_ruta
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+    from src.walk_routing import WalkRouter
+
+# Campos de la petición (los argumentos de ``generar_ruta`` salvo los monumentos) y sus valores por defecto
+CAMPOS = {
+    "start_coord": None,
+    "inicio_hora": None,
+    "fin_hora": None,
+    "imprescindibles": (),
+    "preferencias_tipo": (),
+    "transporte": "ambos",
+    "incluir_pausa_comida": True,
+    "engine": "greedy",
+    "time_limit_s": OPTIMIZED_TIME_LIMIT_S,
+    "walk_metric": "haversine",
+}
+
+Coord = Tuple[float, float]  # (lon, lat), como los segmentos de pydeck
+
+
+class PlanRuta:
+    """Itinerario de una petición con las decisiones y caminos que lo produjeron.
+
+    Iterar el plan entrega los pasos según se fijan (como ``iter_ruta``) y los
+    va guardando en ``pasos``; ``planificar`` y ``replanificar`` lo devuelven
+    ya completo. Con ``previo`` se reutiliza todo lo que siga siendo válido
+    de ese plan (``reutilizados`` dice cuántas decisiones).
+    """
+
+    def __init__(self, gdf_monumentos: gpd.GeoDataFrame, peticion: Dict,
+                 previo: Optional["PlanRuta"] = None):
+        unknown = set(peticion) - set(CAMPOS)
+        if unknown:
+            raise TypeError(f"Campos de petición desconocidos: {sorted(unknown)}")
+        self.gdf = gdf_monumentos
+        self.peticion = _normalizar(dict(CAMPOS, **peticion))
+        self.fecha = dt.date.today()  # con horarios GTFS las decisiones dependen del día
+        self.reutilizados = pasos_validos(previo, gdf_monumentos, self.peticion) if previo else 0
+        self._prefijo: Sequence[DecisionPaso] = previo.decisiones[:self.reutilizados] if previo else ()
+        self.caminos: Dict[Tuple[Coord, Coord], list] = dict(previo.caminos) if previo else {}
+        self.pasos: List[Dict] = []
+        self.decisiones: List[DecisionPaso] = []
+
+    def __iter__(self) -> Iterator[Dict]:
+        self.pasos, self.decisiones = [], []
+        count("ruta.pasos_reutilizados", self.reutilizados)
+        for paso in iter_ruta(self.gdf, **self.peticion, prefijo=self._prefijo, registro=self.decisiones):
+            self.pasos.append(paso)
+            yield paso
+
+    def completo(self) -> "PlanRuta":
+        for _ in self:
+            pass
+        return self
+
+    @property
+    def coords(self) -> List[Coord]:
+        """(lon, lat) de cada paso del itinerario, en orden."""
+        return [(p["lon"], p["lat"]) for p in self.pasos
+                if p.get("lat") is not None and p.get("lon") is not None]
+
+    def geometria(self, router: WalkRouter) -> List[list]:
+        """Camino [[lon, lat], …] de cada par de pasos consecutivos.
+
+        Solo se calculan (con ``router.route_legs``, por tramos seguidos) los
+        pares que no estaban ya en este plan o en el plan del que procede.
+        """
+        coords = self.coords
+        pares = list(zip(coords[:-1], coords[1:]))
+        faltan = [i for i, par in enumerate(pares) if par not in self.caminos]
+        count("caminos.reutilizados", len(pares) - len(faltan))
+        k = 0
+        while k < len(faltan):
+            fin = k
+            while fin + 1 < len(faltan) and faltan[fin + 1] == faltan[fin] + 1:
+                fin += 1
+            tramo = coords[faltan[k]:faltan[fin] + 2]
+            for par, camino in zip(pares[faltan[k]:faltan[fin] + 1], router.route_legs(tramo)):
+                self.caminos[par] = camino
+            k = fin + 1
+        self.caminos = {par: self.caminos[par] for par in pares}  # olvida los de pasos que ya no están
+        return [self.caminos[par] for par in pares]
+
+
+def planificar(gdf_monumentos: gpd.GeoDataFrame, **peticion) -> PlanRuta:
+    """Planifica desde cero y devuelve el plan completo (mismos argumentos que ``generar_ruta``)."""
+    return PlanRuta(gdf_monumentos, peticion).completo()
+
+
+def replanificar(previo: PlanRuta, gdf_monumentos: Optional[gpd.GeoDataFrame] = None, **cambios) -> PlanRuta:
+    """Plan de la petición de ``previo`` con ``cambios``, reutilizando lo que no se ve afectado."""
+    gdf = previo.gdf if gdf_monumentos is None else gdf_monumentos
+    return PlanRuta(gdf, dict(previo.peticion, **cambios), previo).completo()
+
+
+def pasos_validos(previo: PlanRuta, gdf_monumentos: gpd.GeoDataFrame, peticion: Dict) -> int:
+    """Cuántas decisiones de ``previo`` se repetirían igual con ``peticion``."""
+    decisiones = previo.decisiones
+    if previo.fecha != dt.date.today():
+        return 0
+    store = get_poi_store(gdf_monumentos)
+    if store.fingerprint != get_poi_store(previo.gdf).fingerprint:
+        return 0  # otros monumentos: las filas del almacén ya no significan lo mismo
+    anterior = previo.peticion
+    cambios = {k for k in CAMPOS if peticion[k] != anterior[k]}
+    if not cambios:
+        return len(decisiones)
+    if anterior["engine"] != "greedy" or cambios - {"fin_hora", "imprescindibles"}:
+        return 0
+    if not _mismos_barrios(store, anterior, peticion):
+        return 0  # catálogo grande: otros barrios alrededor del alojamiento
+    n = len(decisiones)
+    if "fin_hora" in cambios:
+        n = min(n, _validos_por_horario(decisiones, anterior["fin_hora"], peticion["fin_hora"]))
+    if "imprescindibles" in cambios:
+        n = min(n, _validos_por_imprescindibles(store, decisiones[:n], anterior, peticion))
+    return n
+
+
+# ------------------------
+# Auxiliares
+# ------------------------
+def _normalizar(peticion: Dict) -> Dict:
+    """Misma forma canónica que la caché de rutas: listas limpias, transporte en minúsculas."""
+    peticion["start_coord"] = (float(peticion["start_coord"][0]), float(peticion["start_coord"][1]))
+    peticion["imprescindibles"] = _clean(peticion["imprescindibles"])
+    peticion["preferencias_tipo"] = sorted(_clean(peticion["preferencias_tipo"]))
+    peticion["transporte"] = str(peticion["transporte"]).lower()
+    for campo in ("inicio_hora", "fin_hora"):
+        if isinstance(peticion[campo], str):
+            peticion[campo] = dt.time.fromisoformat(peticion[campo])
+    return peticion
+
+
+def _mismos_barrios(store, anterior: Dict, peticion: Dict) -> bool:
+    """Si la restricción por barrios de los catálogos grandes deja los mismos candidatos.
+
+    Se comparan como conjuntos y sin los imprescindibles de ninguna de las dos
+    peticiones: ``candidates`` los pone delante y un imprescindible nuevo o
+    quitado ya lo trata ``_validos_por_imprescindibles``.
+    """
+    if len(store) < CLUSTERED_MIN_POIS:
+        return True  # sin restricción: los candidatos solo dependen de preferencias e imprescindibles
+    imprescindibles = set(anterior["imprescindibles"]) | set(peticion["imprescindibles"])
+    filas = []
+    for p in (anterior, peticion):
+        cand = store.candidates(p["preferencias_tipo"], p["imprescindibles"])
+        cand = candidatos_por_barrios(store, cand, p["start_coord"], p["inicio_hora"], p["fin_hora"],
+                                      p["imprescindibles"])
+        filas.append(np.sort(cand[~store.name_mask(imprescindibles)[cand]]))
+    return np.array_equal(*filas)
+
+
+def _minutos(t: dt.time) -> float:
+    return t.hour * 60 + t.minute + t.second / 60
+
+
+def _validos_por_horario(decisiones: Sequence[DecisionPaso], fin_antes: dt.time, fin_ahora: dt.time) -> int:
+    """Primer paso cuyo tiempo restante, con la nueva hora de fin, cambiaría la elección."""
+    delta = _minutos(fin_ahora) - _minutos(fin_antes)
+    for k, d in enumerate(decisiones):
+        restante = d.restante + delta
+        if restante <= 0 or not (d.necesita <= restante < d.rechazo):
+            return k
+    return len(decisiones)
+
+
+def _validos_por_imprescindibles(store, decisiones: Sequence[DecisionPaso], anterior: Dict, peticion: Dict) -> int:
+    """Primer paso en que el voraz se orientaría distinto con la nueva lista de imprescindibles.
+
+    La comprobación de candidatos nuevos es conservadora: basta con que uno
+    quede por delante del elegido en alguno de los dos criterios de orden
+    (cercanía al primer imprescindible pendiente o a la posición actual),
+    quepa o no en el tiempo.
+    """
+    viejos, nuevos = anterior["imprescindibles"], peticion["imprescindibles"]
+    prefs = peticion["preferencias_tipo"]
+    cand_antes = set(store.candidates(prefs, viejos).tolist())
+    cand_ahora = store.candidates(prefs, nuevos)
+    quitados = cand_antes - set(cand_ahora.tolist())
+    nuevos_cand = np.asarray([r for r in cand_ahora.tolist() if r not in cand_antes], dtype=np.intp)
+
+    red = get_network_table() if peticion["walk_metric"] == "network" else None
+    walk_m = red.matrix_for(store.lat, store.lon) if red is not None else store.dist
+
+    def desde_inicio(rows):
+        # misma medida que ``dist_start`` en el planificador
+        lat, lon = peticion["start_coord"]
+        if red is not None:
+            return red.from_point(lat, lon, store.lat[rows], store.lon[rows])
+        return haversine_many(lat, lon, store.lat[rows], store.lon[rows])
+
+    visitados: set = set()
+    current = None
+    for k, d in enumerate(decisiones):
+        primero_antes = next((n for n in viejos if n not in visitados), None)
+        primero_ahora = next((n for n in nuevos if n not in visitados), None)
+        if primero_antes != primero_ahora or d.elegido in quitados:
+            return k
+        pendientes = nuevos_cand[[store.nombres[r] not in visitados for r in nuevos_cand]] \
+            if len(nuevos_cand) else nuevos_cand
+        if len(pendientes):
+            rows = np.append(pendientes, d.elegido)
+            dist_now = desde_inicio(rows) if current is None else walk_m[current, rows]
+            delante = dist_now[:-1] <= dist_now[-1]
+            if primero_ahora is not None:
+                hacia = walk_m[store.row_of(primero_ahora), rows]
+                delante |= hacia[:-1] <= hacia[-1]
+            if delante.any():
+                return k
+        visitados.add(store.nombres[d.elegido])
+        current = d.elegido
+    return len(decisiones)
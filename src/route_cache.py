@@ -0,0 +1,267 @@
+# src/route_cache.py
+"""Caché de itinerarios de ``generar_ruta`` por petición normalizada.
+
+La clave de una petición es canónica:
+
+* el alojamiento se ajusta a una rejilla de ``grid_m`` metros y la ruta se
+  calcula desde el centro de su celda (después se restituye la coordenada
+  real en los pasos que parten o vuelven al alojamiento);
+* las horas se reducen a ``HH:MM``;
+* las preferencias se ordenan y deduplican; los imprescindibles conservan su
+  orden (el voraz persigue primero al primero) pero sin vacíos ni repetidos;
+* se añade la huella de monumentos, paradas y tablas de tramos, así que si
+  cambian los datos las entradas antiguas dejan de coincidir solas.
+
+Cada entrada guarda los pasos del itinerario y las decisiones del voraz
+(``DecisionPaso``) que los produjeron, para que un acierto sirva también de
+punto de partida a ``replanning``. Las entradas viven en una LRU en memoria
+y, si se indica un directorio (o ``VALENCIA_ROUTE_CACHE_DIR``), también en
+disco como un JSON por clave.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.profiling import count
+
+ROUTE_CACHE_GRID_M = 25.0        # lado de la celda del alojamiento
+ROUTE_CACHE_MAX_ENTRIES = 512    # itinerarios en memoria
+ROUTE_CACHE_DIR = os.environ.get("VALENCIA_ROUTE_CACHE_DIR")  # sin definir: solo memoria
+ENTRY_FORMAT = 2                 # 2: pasos y decisiones (las entradas de otro formato no coinciden)
+
+_M_PER_DEG = 111320.0
+_REF_LAT = 39.47                 # latitud de referencia fija: la rejilla no depende del punto
+
+
+def _hhmm(value) -> str:
+    if isinstance(value, str):
+        value = dt.time.fromisoformat(value)
+    return value.strftime("%H:%M")
+
+
+def _clean(names) -> List[str]:
+    return [n for n in dict.fromkeys(str(n).strip() for n in (names or [])) if n]
+
+
+class RouteCache:
+    """LRU de itinerarios con persistencia opcional y contadores de aciertos."""
+
+    def __init__(self, max_entries: int = ROUTE_CACHE_MAX_ENTRIES, directory=ROUTE_CACHE_DIR,
+                 grid_m: float = ROUTE_CACHE_GRID_M):
+        self.max_entries = max_entries
+        self.directory = Path(directory) if directory else None
+        self.grid_m = grid_m
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------
+    # Clave canónica
+    # ------------------------
+    def quantize(self, start_coord: Tuple[float, float]) -> Tuple[Tuple[int, int], Tuple[float, float]]:
+        """(celda, centro de la celda) del alojamiento; sin rejilla, la coordenada tal cual."""
+        lat, lon = float(start_coord[0]), float(start_coord[1])
+        if not self.grid_m:
+            return (lat, lon), (lat, lon)
+        d_lat = self.grid_m / _M_PER_DEG
+        d_lon = self.grid_m / (_M_PER_DEG * math.cos(math.radians(_REF_LAT)))
+        cell = (math.floor(lat / d_lat), math.floor(lon / d_lon))
+        return cell, ((cell[0] + 0.5) * d_lat, (cell[1] + 0.5) * d_lon)
+
+    def key(self, cell, inicio_hora, fin_hora, imprescindibles, preferencias_tipo, transporte,
+            incluir_pausa_comida, engine, time_limit_s, walk_metric, datasets: str) -> str:
+        payload = {
+            "cell": list(cell),
+            "inicio": _hhmm(inicio_hora),
+            "fin": _hhmm(fin_hora),
+            "imprescindibles": _clean(imprescindibles),
+            "preferencias": sorted(_clean(preferencias_tipo)),
+            "transporte": str(transporte).lower(),
+            "pausa": bool(incluir_pausa_comida),
+            "engine": engine,
+            "time_limit_s": float(time_limit_s) if engine == "optimized" else None,
+            "walk_metric": walk_metric,
+            "grid_m": self.grid_m,
+            "datasets": datasets,
+            "formato": ENTRY_FORMAT,
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    # ------------------------
+    # Almacenamiento
+    # ------------------------
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Entrada ``{"pasos": [...], "decisiones": [...]}`` de la clave, o None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        if self.directory is not None:
+            try:
+                with open(self._path(key), encoding="utf-8") as fh:
+                    entry = json.load(fh)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, itinerary: List[Dict], decisiones: Sequence = ()) -> None:
+        entry = {"pasos": itinerary, "decisiones": [list(d) for d in decisiones]}
+        self._remember(key, entry)
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self._path(key).with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(entry, fh, ensure_ascii=False, default=float)
+            os.replace(tmp, self._path(key))
+
+    def _remember(self, key: str, entry: Dict) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Vacía la memoria (los ficheros en disco se conservan) y los contadores."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "entries": len(self._entries), "hit_rate": self.hits / total if total else 0.0}
+
+
+_CACHE = RouteCache()
+
+
+def get_route_cache() -> RouteCache:
+    return _CACHE
+
+
+def _datasets_fingerprint(gdf_monumentos, transporte, walk_metric) -> str:
+    from src.gtfs import get_timetables
+    from src.poi_store import get_poi_store
+    from src.route_generator import VISIT_DURATION_MIN, get_transit_matrix
+
+    store = get_poi_store(gdf_monumentos)
+    tabla = get_transit_matrix(gdf_monumentos, transporte, walk_metric)  # monumentos, paradas, líneas, velocidades
+    key = f"{store.fingerprint}:{tabla.fingerprint}:{VISIT_DURATION_MIN}"
+    horarios = get_timetables() if transporte != "ninguno" else None
+    if horarios:
+        # con horarios GTFS el itinerario depende también del día (calendario de servicio)
+        key += f":{horarios.version}:{dt.date.today().isoformat()}"
+    return key
+
+
+def generar_ruta_cached(
+    gdf_monumentos,
+    start_coord: Tuple[float, float],
+    inicio_hora: dt.time,
+    fin_hora: dt.time,
+    imprescindibles: List[str],
+    preferencias_tipo: List[str],
+    transporte: str = "ambos",
+    incluir_pausa_comida: bool = True,
+    engine: str = "greedy",
+    time_limit_s: Optional[float] = None,
+    walk_metric: str = "haversine",
+    cache: Optional[RouteCache] = None,
+) -> List[Dict]:
+    """``generar_ruta`` con memoización; mismos argumentos y mismo resultado.
+
+    Devuelve siempre listas y diccionarios nuevos: el llamador puede
+    modificarlos sin alterar la caché.
+    """
+    return list(iter_ruta_cached(
+        gdf_monumentos, start_coord, inicio_hora, fin_hora, imprescindibles, preferencias_tipo,
+        transporte, incluir_pausa_comida, engine, time_limit_s, walk_metric, cache,
+    ))
+
+
+def iter_ruta_cached(
+    gdf_monumentos,
+    start_coord: Tuple[float, float],
+    inicio_hora: dt.time,
+    fin_hora: dt.time,
+    imprescindibles: List[str],
+    preferencias_tipo: List[str],
+    transporte: str = "ambos",
+    incluir_pausa_comida: bool = True,
+    engine: str = "greedy",
+    time_limit_s: Optional[float] = None,
+    walk_metric: str = "haversine",
+    cache: Optional[RouteCache] = None,
+    registro: Optional[list] = None,
+) -> Iterator[Dict]:
+    """``iter_ruta`` con memoización.
+
+    Un acierto entrega los pasos guardados de golpe; un fallo los entrega según
+    los produce ``iter_ruta`` y guarda el itinerario solo si se consume entero.
+    ``registro`` recibe las decisiones del voraz (como en ``iter_ruta``),
+    tomadas desde el centro de la celda del alojamiento: en un fallo según se
+    deciden y en un acierto, las guardadas con la entrada.
+    """
+    from src.route_generator import OPTIMIZED_TIME_LIMIT_S, DecisionPaso, iter_ruta
+
+    cache = cache or _CACHE
+    if time_limit_s is None:
+        time_limit_s = OPTIMIZED_TIME_LIMIT_S
+    transporte = str(transporte).lower()
+    cell, center = cache.quantize(start_coord)
+    key = cache.key(cell, inicio_hora, fin_hora, imprescindibles, preferencias_tipo, transporte,
+                    incluir_pausa_comida, engine, time_limit_s, walk_metric,
+                    _datasets_fingerprint(gdf_monumentos, transporte, walk_metric))
+
+    entry = cache.get(key)
+    count("ruta.cache_fallo" if entry is None else "ruta.cache_acierto")
+    if entry is None:
+        decisiones = registro if registro is not None else []
+        pasos = iter_ruta(
+            gdf_monumentos, center, inicio_hora, fin_hora, _clean(imprescindibles),
+            sorted(_clean(preferencias_tipo)), transporte, incluir_pausa_comida,
+            engine=engine, time_limit_s=time_limit_s, walk_metric=walk_metric, registro=decisiones,
+        )
+    else:
+        pasos = entry["pasos"]
+        if registro is not None:
+            registro.extend(DecisionPaso(*d) for d in entry["decisiones"])
+
+    # Los pasos que salen o vuelven al alojamiento recuperan la coordenada real
+    real = (float(start_coord[0]), float(start_coord[1]))
+    nuevos = []
+    for step in pasos:
+        if entry is None:
+            nuevos.append(step)
+        step = dict(step)
+        if (step["lat"], step["lon"]) == center:
+            step["lat"], step["lon"] = real
+        yield step
+    if entry is None:
+        cache.put(key, nuevos, decisiones)
@@ -0,0 +1,245 @@
+# src/route_engine.py
+"""Motor optimizado de rutas: orienteering con ventanas de tiempo.
+
+Trabaja solo con arrays de enteros. El nodo 0 es el alojamiento y los nodos
+1..n son los monumentos candidatos; ``cost[i, j]`` son los minutos del tramo
+i→j. Se busca el recorrido que visita más monumentos dentro del horario, con
+los imprescindibles por delante de cualquier otro y respetando la pausa de
+comida. Con ``return_to_start=False`` (lo que hace ``generar_ruta``) la vuelta
+al alojamiento no tiene que caber en el horario, igual que en el voraz, pero a
+igual número de visitas se prefiere el recorrido que termina antes en casa.
+
+La búsqueda parte de la inserción más barata y del recorrido del voraz (el
+vecino más cercano que quepa), los mejora localmente (2-opt y or-opt) y
+perturba la mejor solución al azar. Se detiene al agotar ``time_limit_s``,
+cuando el recorrido ya visita todos los candidatos o tras
+``MAX_STALE_ROUNDS`` perturbaciones seguidas sin mejora, devolviendo la
+mejor solución encontrada hasta ese momento.
+
+El motor no sabe nada de transporte público: recibe los costes ya
+calculados. ``route_generator._orden_optimizado`` solo usa tiempos en
+transporte para los tramos que conoce (los de la tabla y los de los
+imprescindibles); el resto se costean a pie.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+MANDATORY_SCORE = 1000  # un imprescindible vale más que cualquier número de opcionales
+LUNCH_WINDOW = (13 * 60 + 30, 14 * 60 + 30, 60)  # (inicio, fin, duración) en minutos
+MAX_INSERTION_CHECKS = 25
+MAX_STALE_ROUNDS = 50   # perturbaciones seguidas sin mejora antes de parar
+
+
+class OrienteeringProblem:
+    """Datos de una instancia y simulación exacta del horario de un recorrido."""
+
+    def __init__(
+        self,
+        cost: np.ndarray,
+        mandatory: np.ndarray,
+        start_min: int,
+        end_min: int,
+        visit_min: int,
+        lunch: Optional[Tuple[int, int, int]] = LUNCH_WINDOW,
+        return_to_start: bool = True,
+    ):
+        self.cost = np.asarray(cost, dtype=np.int64)
+        self.return_to_start = return_to_start
+        # costes usados al insertar: sin vuelta si no tiene que caber
+        self.insert_cost = self.cost.copy()
+        if not return_to_start:
+            self.insert_cost[:, 0] = 0
+        self.mandatory = np.asarray(mandatory, dtype=bool)
+        self.score = np.where(self.mandatory, MANDATORY_SCORE, 1)
+        self.n = self.cost.shape[0] - 1
+        self.start_min = int(start_min)
+        self.end_min = int(end_min)
+        self.visit_min = int(visit_min)
+        self.lunch = lunch
+        self._cost_rows = self.cost.tolist()  # acceso escalar rápido en la simulación
+
+    def finish_time(self, route: List[int]) -> int:
+        """Minuto en que termina ``route`` (nodos 1..n) a efectos del horario."""
+        end, back = self._schedule(route)
+        return end + back if self.return_to_start else end
+
+    def _schedule(self, route: List[int]) -> Tuple[int, int]:
+        """(fin de la última visita, minutos de vuelta al alojamiento)."""
+        c = self._cost_rows
+        t = self.start_min
+        lunch = self.lunch
+        prev = 0
+        for node in route:
+            t += c[prev][node]
+            # Igual que el ejecutor de ``route_generator``: pausa al llegar
+            # dentro de la ventana; si se llega después ya no se hace
+            if lunch is not None and lunch[0] <= t <= lunch[1]:
+                t += lunch[2]
+                lunch = None
+            t += self.visit_min
+            prev = node
+        return t, c[prev][0]
+
+    def total_time(self, route: List[int]) -> int:
+        """Minuto de llegada al alojamiento, vuelta incluida."""
+        return sum(self._schedule(route))
+
+    def feasible(self, route: List[int]) -> bool:
+        return self.finish_time(route) <= self.end_min
+
+    def value(self, route: List[int]) -> Tuple[int, int]:
+        """Clave a maximizar: (puntuación, -minuto de llegada al alojamiento)."""
+        score = int(self.score[[n - 1 for n in route]].sum()) if route else 0
+        return score, -self.total_time(route)
+
+
+def _insert_best(problem: OrienteeringProblem, route: List[int], allowed: np.ndarray) -> bool:
+    """Inserta el candidato con mejor puntuación por minuto añadido que siga siendo factible."""
+    in_route = np.zeros(problem.n + 1, dtype=bool)
+    in_route[route] = True
+    cand = np.flatnonzero(allowed & ~in_route[1:]) + 1
+    if not len(cand):
+        return False
+
+    nodes = np.asarray([0] + route + [0])
+    a, b = nodes[:-1], nodes[1:]
+    cost = problem.insert_cost
+    delta = cost[np.ix_(a, cand)] + cost[np.ix_(cand, b)].T - cost[a, b][:, None] + problem.visit_min
+    best_pos = delta.argmin(axis=0)
+    best_delta = delta[best_pos, np.arange(len(cand))]
+
+    slack = problem.end_min - problem.finish_time(route)
+    ok = best_delta <= slack
+    if not ok.any():
+        return False
+    cand, best_pos, best_delta = cand[ok], best_pos[ok], best_delta[ok]
+    ratio = problem.score[cand - 1] / np.maximum(best_delta, 1)
+    for k in np.argsort(-ratio, kind="stable")[:MAX_INSERTION_CHECKS]:
+        trial = route[:best_pos[k]] + [int(cand[k])] + route[best_pos[k]:]
+        if problem.feasible(trial):
+            route[:] = trial
+            return True
+    return False
+
+
+def _fill(problem: OrienteeringProblem, route: List[int], deadline: float) -> None:
+    """Inserta imprescindibles primero y después opcionales mientras quepan.
+
+    Los imprescindibles (pocos) se insertan siempre; los opcionales, solo
+    mientras no venza ``deadline``.
+    """
+    while _insert_best(problem, route, problem.mandatory):
+        pass
+    everyone = np.ones(problem.n, dtype=bool)
+    while time.perf_counter() < deadline and _insert_best(problem, route, everyone):
+        pass
+
+
+def _nearest_neighbour(problem: OrienteeringProblem, deadline: float) -> List[int]:
+    """Recorrido del voraz: el candidato más cercano que aún quepa, imprescindibles primero."""
+    route: List[int] = []
+    pending = np.ones(problem.n, dtype=bool)
+    while time.perf_counter() < deadline:
+        prev = route[-1] if route else 0
+        added = False
+        for allowed in (pending & problem.mandatory, pending):
+            cand = np.flatnonzero(allowed) + 1
+            for node in cand[np.argsort(problem.cost[prev, cand], kind="stable")].tolist():
+                if problem.feasible(route + [node]):
+                    route.append(node)
+                    pending[node - 1] = False
+                    added = True
+                    break
+            if added:
+                break
+        if not added:
+            break
+    return route
+
+
+def _two_opt(problem: OrienteeringProblem, route: List[int], deadline: float) -> bool:
+    best = problem.total_time(route)
+    improved = False
+    for i in range(len(route) - 1):
+        for j in range(i + 1, len(route)):
+            trial = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+            t = problem.total_time(trial)
+            if t < best and problem.feasible(trial):
+                route[:], best, improved = trial, t, True
+        if time.perf_counter() > deadline:
+            break
+    return improved
+
+
+def _or_opt(problem: OrienteeringProblem, route: List[int], deadline: float) -> bool:
+    best = problem.total_time(route)
+    improved = False
+    for seg_len in (1, 2, 3):
+        for i in range(len(route) - seg_len + 1):
+            seg = route[i:i + seg_len]
+            rest = route[:i] + route[i + seg_len:]
+            for j in range(len(rest) + 1):
+                if j == i:
+                    continue
+                trial = rest[:j] + seg + rest[j:]
+                t = problem.total_time(trial)
+                if t < best and problem.feasible(trial):
+                    route[:], best, improved = trial, t, True
+                    break
+            if time.perf_counter() > deadline:
+                return improved
+    return improved
+
+
+def _local_search(problem: OrienteeringProblem, route: List[int], deadline: float) -> None:
+    while time.perf_counter() < deadline:
+        changed = _two_opt(problem, route, deadline)
+        changed |= _or_opt(problem, route, deadline)
+        changed |= _insert_best(problem, route, np.ones(problem.n, dtype=bool))
+        if not changed:
+            break
+
+
+def solve(
+    problem: OrienteeringProblem,
+    time_limit_s: float = 0.2,
+    seed: int = 0,
+) -> List[int]:
+    """Devuelve la mejor secuencia de nodos (1..n) encontrada antes del límite de tiempo."""
+    deadline = time.perf_counter() + time_limit_s
+    rng = np.random.default_rng(seed)
+
+    route: List[int] = []
+    _fill(problem, route, deadline)
+    _local_search(problem, route, deadline)
+    best, best_value = list(route), problem.value(route)
+
+    # El recorrido del voraz como segunda semilla: la búsqueda nunca acaba por debajo de él
+    route = _nearest_neighbour(problem, deadline)
+    _local_search(problem, route, deadline)
+    if problem.value(route) > best_value and problem.feasible(route):
+        best, best_value = list(route), problem.value(route)
+
+    # Búsqueda local iterada: quita algunos nodos opcionales y vuelve a rellenar.
+    # Con todos los candidatos dentro ya no hay visitas que ganar
+    stale = 0
+    while time.perf_counter() < deadline and best and len(best) < problem.n and stale < MAX_STALE_ROUNDS:
+        stale += 1
+        route = list(best)
+        optional = [k for k, node in enumerate(route) if not problem.mandatory[node - 1]]
+        if not optional:
+            break
+        drop = rng.choice(optional, size=min(len(optional), int(rng.integers(1, 4))), replace=False)
+        route = [node for k, node in enumerate(route) if k not in set(drop.tolist())]
+        _local_search(problem, route, deadline)
+        _fill(problem, route, deadline)
+        value = problem.value(route)
+        if value > best_value and problem.feasible(route):
+            best, best_value, stale = list(route), value, 0
+
+    return best
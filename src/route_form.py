@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 from src.data_loader import load_monuments
 
-def get_user_inputs():
+def get_user_inputs(monuments_gdf=None):
     st.sidebar.header("📝 Datos para tu ruta personalizada")
 
     # 1. Horario
@@ -20,7 +20,8 @@ def get_user_inputs():
     transporte = st.sidebar.radio("🚊 Transporte público permitido", ["Ninguno", "Bus", "Metro", "Ambos"], index=3)
 
     # 4. Monumentos imprescindibles (máx 3)
-    monuments_gdf = load_monuments()
+    if monuments_gdf is None:
+        monuments_gdf = load_monuments()
     monument_names = sorted(monuments_gdf["nombre"].dropna().unique())
     monumentos_imprescindibles = st.sidebar.multiselect("🏛️ Monumentos imprescindibles (máx 3)", 
                                                         options=monument_names, max_selections=3)
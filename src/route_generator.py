@@ -13,18 +13,29 @@ from __future__ import annotations
 
 import math
 import datetime as dt
-from typing import List, Dict, Tuple, Literal
+from functools import partial
+from typing import TYPE_CHECKING, Iterator, List, Dict, NamedTuple, Optional, Sequence, Tuple, Literal
+
+import numpy as np
+
+from src.poi_store import POIStore, get_poi_store
+from src.geo import haversine_many
+from src.transit_matrix import TransitMatrix, fingerprint, transit_matrix
+from src.network_distances import get_network_table
+from src.gtfs import get_timetables
+from src import route_engine
+from src.profiling import stage, timed
+from src.spatial_index import StopIndex, LineIndex
+from src import transit_network as tn
+from src.transit_network import TransitNetwork
+from src import access_grid as ag
+from src.access_grid import AccessGrid, get_access_grid
+from src.shared_data import get_shared
+from src.data_loader import load_buses, load_metro
+
+if TYPE_CHECKING:
+    import geopandas as gpd
 
-import pandas as pd  # <–– añadido para concat y dataframe
-import geopandas as gpd
-from shapely.geometry import Point
-import streamlit as st
-
-
-
-best_dist = None
-best_line = None
-best_mode = None
 
 # ------------------------
 # Constantes de configuración
@@ -57,30 +68,41 @@ def tp_time_minutes(distance_m: float) -> int:
     return int(km / TP_SPEED_KMH * 60)
 
 
-def should_use_public_transport(origen, destino, modo_pt) -> Tuple[bool, str, float]:
+WalkMetric = Literal["haversine", "network"]
+
+
+def walk_distance(origen, destino, walk_metric: WalkMetric = "haversine") -> float:
+    """Metros a pie entre dos (lat, lon): en línea recta o por la red de calles.
+
+    Con ``"network"`` se consulta la tabla precalculada de ``network_distances``
+    (sin Dijkstra); los puntos que no están en ella se estiman con la línea
+    recta por el factor de rodeo medio de la red.
+    """
+    if walk_metric == "network":
+        return get_network_table().distance(*origen, *destino)
+    return haversine_distance(*origen, *destino)
+
+
+@timed("transporte.evaluar")
+def should_use_public_transport(origen, destino, modo_pt,
+                                walk_metric: WalkMetric = "haversine",
+                                salida: Optional[dt.datetime] = None) -> Tuple[bool, str, float]:
     """
-    Devuelve (usar_tp, modo_str, dist_tp) evaluando si el ahorro supera 900 m.
+    Devuelve (usar_tp, modo_str, minutos): el transporte se usa si ahorra más
+    de 5 minutos frente a ir a pie.
+      * modo_pt = "bus", "metro" o "ambos" (se pasa tal cual a
+        ``get_public_transport_time``; "ambos" permite combinar bus y metro
+        con transbordos)
+    Con ``salida`` y horarios GTFS cargados, el transporte incluye la espera real.
     """
-    dist_walk = haversine_distance(*origen, *destino)
+    dist_walk = walk_distance(origen, destino, walk_metric)
     time_walk_min = walking_time_minutes(dist_walk)
-    mejores = []
-
-    modos = []
-    if modo_pt == "ambos":
-        modos = ["bus", "metro"]
-    elif modo_pt in ("bus", "metro"):
-        modos = [modo_pt]
-
-    for m in modos:
-        time_tp, linea, modo = get_public_transport_time(origen, destino, m, return_line=True)
-        if time_tp is not None:
-            ahorro = time_walk_min - time_tp
-            mejores.append((ahorro, time_tp, linea, m))
-
-    if mejores:
-        ahorro, time_tp, linea, m = max(mejores, key=lambda x: x[0])
+    time_tp, linea, modo = get_public_transport_time(origen, destino, modo_pt, return_line=True,
+                                                     walk_metric=walk_metric, salida=salida)
+    if time_tp is not None:
+        ahorro = time_walk_min - time_tp
         if ahorro > 5:  # o el umbral que decidas
-            return True, f"{m} línea {linea}", time_tp
+            return True, f"{modo.lower()} línea {linea}", time_tp
 
     return False, "A pie", time_walk_min
 
@@ -90,85 +112,293 @@ def should_use_public_transport(origen, destino, modo_pt) -> Tuple[bool, str, fl
 # Función principal
 # ------------------------
 TransportOption = Literal["ninguno", "bus", "metro", "ambos"]
+RouteEngine = Literal["greedy", "optimized"]
+OPTIMIZED_TIME_LIMIT_S = 0.2  # tope de reloj del motor optimizado
+TIMETABLE_SLACK_MIN = 10      # lo que un horario real puede mejorar el tramo estimado de la tabla
+
+
+class DecisionPaso(NamedTuple):
+    """Monumento elegido en un paso del bucle principal y por qué.
+
+    ``necesita`` son los minutos de tramo más visita del elegido y ``rechazo``
+    el mínimo de los candidatos descartados antes que él por no caber (inf si
+    no hubo ninguno): el paso se repetiría igual con cualquier tiempo
+    ``restante`` en ``[necesita, rechazo)``. ``replanning`` lo usa para
+    reutilizar pasos.
+    """
+
+    elegido: int
+    tramo: float
+    modo: str
+    necesita: float
+    rechazo: float
+    restante: float
+
+
 # ------------------------------------------------------------
 # Rutas básicas de BUS y METRO con los GeoJSON cargados
 # ------------------------------------------------------------
-import geopandas as gpd
-from shapely.ops import nearest_points
-
-# Carga global (hazlo solo una vez)
-GDF_BUS = gpd.read_file("data/raw/buses.geojson")     # columnas: lon, lat, lineas (ej. "2,19,99")
-GDF_METRO = gpd.read_file("data/raw/metro.geojson")   # columnas: lon, lat, linea  (ej. "1")
-
-def nearest_stop(gdf, lon, lat, max_dist=400):
-    """Devuelve la parada/estación más cercana a (lon,lat) dentro de max_dist metros."""
-    gdf["dist_temp"] = gdf.geometry.distance(Point(lon, lat))
-    sel = gdf.loc[gdf["dist_temp"] <= max_dist]
-    if sel.empty:
+# Las capas y sus índices se cargan la primera vez que se piden (no al
+# importar el módulo), una sola vez por proceso.
+_STOP_LAYERS: Dict[str, Tuple[StopIndex, LineIndex]] = {}
+
+
+def _stop_layer(modo: str) -> Tuple[StopIndex, LineIndex]:
+    layer = _STOP_LAYERS.get(modo)
+    if layer is None:
+        if modo == "bus":
+            index = StopIndex(load_buses())     # columnas: lon, lat, lineas (ej. "2,19,99")
+            layer = (index, LineIndex(index, "lineas"))
+        else:
+            index = StopIndex(load_metro())     # columnas: lon, lat, linea  (ej. "1")
+            layer = (index, LineIndex(index, "linea"))
+        _STOP_LAYERS[modo] = layer
+    return layer
+
+
+def bus_index() -> StopIndex:
+    """Índice espacial (BallTree haversine) de las paradas EMT."""
+    return _stop_layer("bus")[0]
+
+
+def metro_index() -> StopIndex:
+    """Índice espacial de las estaciones de Metro/FGV."""
+    return _stop_layer("metro")[0]
+
+
+def bus_lines() -> LineIndex:
+    """Índice invertido línea → paradas EMT, con un sub-índice espacial por línea."""
+    return _stop_layer("bus")[1]
+
+
+def metro_lines() -> LineIndex:
+    """Índice invertido línea → estaciones de Metro/FGV."""
+    return _stop_layer("metro")[1]
+
+
+_LAZY_GLOBALS = {
+    "GDF_BUS": lambda: bus_index().gdf,
+    "GDF_METRO": lambda: metro_index().gdf,
+    "BUS_INDEX": bus_index,
+    "METRO_INDEX": metro_index,
+    "BUS_LINES": bus_lines,
+    "METRO_LINES": metro_lines,
+}
+
+
+def __getattr__(name):
+    # Compatibilidad con los antiguos globales de módulo (GDF_BUS, BUS_INDEX, …)
+    if name in _LAZY_GLOBALS:
+        return _LAZY_GLOBALS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def nearest_stop(index: StopIndex, lon, lat, max_dist=400, mask=None):
+    """Devuelve la parada/estación más cercana a (lon,lat) dentro de max_dist metros.
+
+    La consulta se resuelve con el índice espacial de la capa, sin modificar el
+    GeoDataFrame compartido. ``mask`` limita la búsqueda a un subconjunto de paradas.
+    """
+    hit = index.nearest(lat, lon, max_dist=max_dist, mask=mask)
+    if hit is None:
         return None
-    return sel.sort_values("dist_temp").iloc[0]
+    return index.gdf.iloc[hit[0]]
+
 
-def get_public_transport_time(origen, destino, modo="ambos", return_line: bool = False):
-    best_time = None
-    best_line = None
-    best_mode = None
+_NETWORK = None
+
+
+def transit_network() -> TransitNetwork:
+    """Red compilada de paradas, líneas y transbordos de bus y metro (una por proceso).
+
+    Lleva enganchada la rejilla de accesibilidad, así que las paradas
+    candidatas del alojamiento se leen de una celda en lugar de buscarse.
+    """
+    global _NETWORK
+    if _NETWORK is None:
+        layers = {"bus": _stop_layer("bus"), "metro": _stop_layer("metro")}
+
+        def build():
+            net = TransitNetwork.build(layers, TP_SPEED_KMH, WALK_SPEED_KMH)
+            return ({name: getattr(net, name) for name in TransitNetwork.ARRAYS},
+                    {"line_names": list(net.line_names), "offsets": net.offsets})
+
+        # los arrays compilados se publican una vez y los demás procesos los abren sin copia
+        fp = fingerprint(params=(stops_fingerprint(), TP_SPEED_KMH, WALK_SPEED_KMH, TransitNetwork.ARRAYS,
+                                 tn.TRANSFER_RADIUS_M, tn.LINE_DETOUR_MAX))
+        compiled = get_shared("transit_network", fp, build)
+        network = TransitNetwork(compiled.arrays, compiled.meta["line_names"], compiled.meta["offsets"],
+                                 {mode: layer[0] for mode, layer in layers.items()}, WALK_SPEED_KMH)
+        network.grid = get_access_grid(network, _grid_fingerprint())
+        _NETWORK = network
+    return _NETWORK
+
+
+def access_grid() -> AccessGrid:
+    """Rejilla de accesibilidad (paradas candidatas y nodo peatonal por celda de 50 m)."""
+    return transit_network().grid
+
+
+def _grid_fingerprint() -> str:
+    from src.walk_graph import CSR_DIR
+
+    try:
+        graph_meta = (CSR_DIR / "meta.json").read_text()
+    except OSError:
+        graph_meta = ""
+    return fingerprint(params=(stops_fingerprint(), WALK_SPEED_KMH, tn.ACCESS_RADIUS_M, tn.ACCESS_K,
+                               ag.CELL_M, ag.FORMAT_VERSION, graph_meta))
+
+
+def _walk_fn(walk_metric: WalkMetric):
+    """Metros a pie de un punto a muchos según la métrica (None: línea recta)."""
+    if walk_metric == "network":
+        return get_network_table().from_point
+    return None
+
+
+@timed("transporte.bus_metro")
+def get_public_transport_time(origen, destino, modo="ambos", return_line: bool = False,
+                              walk_metric: WalkMetric = "haversine",
+                              salida: Optional[dt.datetime] = None):
     """
     Estima el tiempo total (m) usando bus/metro entre dos coordenadas:
       * origen, destino = (lat, lon)
-      * modo = "bus", "metro" o "ambos"
-    Devuelve None si no hay ruta directa con una sola línea.
+      * modo = "bus", "metro" o "ambos" (este último permite combinar ambos)
+    El trayecto puede usar hasta ``transit_network.MAX_TRANSFERS`` transbordos y
+    varias paradas candidatas en cada extremo. Devuelve None si no hay ruta.
+    Si se da la hora de ``salida`` y hay horarios GTFS (``src.gtfs``), el
+    tiempo es el de las siguientes salidas reales, esperas incluidas, y None
+    si alguna línea del trayecto ya no pasa a esa hora.
     """
-    lat_o, lon_o = origen
-    lat_d, lon_d = destino
-
-    # --- METRO -------------------------------------------------
-    if modo in {"metro", "ambos"}:
-        o_est = nearest_stop(GDF_METRO, lon_o, lat_o)
-        d_est = nearest_stop(GDF_METRO, lon_d, lat_d)
-        if o_est is not None and d_est is not None:
-            if o_est["linea"] == d_est["linea"]:   # misma línea sin transbordo
-                walk_in  = haversine_distance(lat_o, lon_o, o_est.geometry.y, o_est.geometry.x)
-                walk_in_time = walking_time_minutes(walk_in)
-                ride     = haversine_distance(o_est.geometry.y, o_est.geometry.x,
-                                              d_est.geometry.y, d_est.geometry.x)
-                ride_time=tp_time_minutes(ride)
-                walk_out = haversine_distance(lat_d, lon_d, d_est.geometry.y, d_est.geometry.x)
-                walk_out_time = walking_time_minutes(walk_out)
-                time_metro = walk_in_time + ride_time + walk_out_time
-                if best_time is None or time_metro < best_time:
-                    best_time = time_metro
-                    best_line = o_est["linea"]
-                    best_mode = "Metro"
-
-
-    # --- BUS ---------------------------------------------------
-    if modo in {"bus", "ambos"}:
-        o_par = nearest_stop(GDF_BUS, lon_o, lat_o)
-        if o_par is not None:
-            lineas_o = {l.strip() for l in str(o_par["lineas"]).split(",")}
-            cand_dest = GDF_BUS[GDF_BUS["lineas"].apply(
-                lambda txt: bool(set(str(txt).split(",")).intersection(lineas_o)))]
-            d_par = nearest_stop(cand_dest, lon_d, lat_d)
-            if d_par is not None:
-                common = set(str(d_par["lineas"]).split(",")).intersection(lineas_o)
-                if common:
-                    walk_in  = haversine_distance(lat_o, lon_o, o_par.geometry.y, o_par.geometry.x)
-                    walk_in_time = walking_time_minutes(walk_in)
-                    ride     = haversine_distance(o_par.geometry.y, o_par.geometry.x,
-                                                  d_par.geometry.y, d_par.geometry.x)
-                    ride_time=tp_time_minutes(ride)
-                    walk_out = haversine_distance(lat_d, lon_d, d_par.geometry.y, d_par.geometry.x)
-                    walk_out_time = walking_time_minutes(walk_out)
-                    time_bus = walk_in_time + ride_time + walk_out_time
-                    if best_time is None or time_bus < best_time:
-                        best_time = time_bus
-                        best_line = list(common)[0]
-                        best_mode = "Bus"
-
+    modes = ("bus", "metro") if modo == "ambos" else (modo,) if modo in ("bus", "metro") else ()
+    journey = transit_network().journey(origen, destino, modes, walk_m=_walk_fn(walk_metric)) if modes else None
+    if journey is None:
+        return (None, None, None) if return_line else None
+    minutes = journey.minutes
+    if salida is not None:
+        horarios = get_timetables()
+        if horarios:
+            minutes = horarios.refine(transit_network(), journey, salida)
+            if minutes is None:  # alguna línea ya no pasa a esa hora: mejor a pie
+                return (None, None, None) if return_line else None
+    best_time = int(minutes)
     if return_line:
-        return best_time, best_line, best_mode
-    else:
-        return best_time
+        return best_time, journey.line, journey.mode.capitalize()
+    return best_time
+
+
+_TRANSIT_MATRICES: Dict[str, TransitMatrix] = {}
+_STOPS_FINGERPRINT = None
+
+
+def stops_fingerprint() -> str:
+    """Huella de coordenadas y líneas de todas las paradas (una vez por proceso)."""
+    global _STOPS_FINGERPRINT
+    if _STOPS_FINGERPRINT is None:
+        _STOPS_FINGERPRINT = fingerprint(
+            bus_index().lat, bus_index().lon, metro_index().lat, metro_index().lon,
+            params=(bus_lines().lines_per_stop, metro_lines().lines_per_stop),
+        )
+    return _STOPS_FINGERPRINT
+
+
+def get_transit_matrix(gdf_monumentos: gpd.GeoDataFrame, transporte: TransportOption,
+                       walk_metric: WalkMetric = "haversine") -> TransitMatrix:
+    """Tabla de tramos monumento→monumento para ``transporte``, una por proceso.
+
+    Se reutiliza la copia persistida en ``data/processed`` si coincide la huella
+    de monumentos, paradas, velocidades y métrica a pie (incluida la versión de
+    la tabla de red); si no, se rellena bajo demanda.
+    """
+    lat = gdf_monumentos.geometry.y.to_numpy(dtype=np.float64)
+    lon = gdf_monumentos.geometry.x.to_numpy(dtype=np.float64)
+    params = (transporte, WALK_SPEED_KMH, TP_SPEED_KMH, stops_fingerprint(),
+              tn.MAX_TRANSFERS, tn.ACCESS_RADIUS_M, tn.ACCESS_K, tn.TRANSFER_RADIUS_M,
+              tn.TRANSFER_PENALTY_MIN, tn.LINE_DETOUR_MAX)
+    if walk_metric == "network":
+        table = get_network_table()
+        params += (walk_metric, table.version, table.detour)
+    fp = fingerprint(lat, lon, params=params)
+    tabla = _TRANSIT_MATRICES.get(fp)
+    if tabla is None:
+        tabla = transit_matrix(lat, lon, transporte, fp,
+                               partial(should_use_public_transport, walk_metric=walk_metric))
+        tabla.load()
+        _TRANSIT_MATRICES[fp] = tabla
+    return tabla
+
+
+def candidatos_por_barrios(store: POIStore, cand: np.ndarray, start_coord: Tuple[float, float],
+                           inicio_hora: dt.time, fin_hora: dt.time, imprescindibles: List[str]) -> np.ndarray:
+    """``cand`` limitado a los barrios alrededor del alojamiento si el catálogo es grande (``poi_clusters``)."""
+    from src import poi_clusters
+
+    if len(store) < poi_clusters.CLUSTERED_MIN_POIS:
+        return cand
+    minutos = (dt.datetime.combine(dt.date.today(), fin_hora)
+               - dt.datetime.combine(dt.date.today(), inicio_hora)).total_seconds() / 60
+    return poi_clusters.restringir(store, cand, start_coord, minutos, imprescindibles)
+
+
+def _orden_optimizado(
+    store: POIStore,
+    cand: np.ndarray,
+    dist_start: np.ndarray,
+    walk_m: np.ndarray,
+    tabla_tp: TransitMatrix,
+    imprescindibles: List[str],
+    start: Tuple[float, float],
+    transporte: TransportOption,
+    inicio: dt.datetime,
+    fin: dt.datetime,
+    incluir_pausa_comida: bool,
+    time_limit_s: float,
+    walk_metric: WalkMetric,
+) -> List[int]:
+    """Orden de visita (filas de ``store``) calculado por ``route_engine``.
+
+    Los costes son minutos a pie, o en transporte si el tramo ya está en la
+    tabla; como el transporte solo se elige cuando ahorra tiempo, los tramos
+    reales nunca son más largos que los estimados. Solo se consulta la red
+    para los tramos entre imprescindibles y desde el alojamiento hasta ellos:
+    los tramos a un opcional que no estén ya en la tabla se costean a pie, así
+    que con transporte el motor no aprovecha del todo los saltos largos y el
+    resultado puede quedar por debajo del voraz (``benchmarks/run.py``
+    compara ambos en cada escenario).
+    """
+    cand_pos = store.pos[cand]
+    walk = (walk_m[np.ix_(cand, cand)] / 1000 / WALK_SPEED_KMH * 60).astype(np.int64)
+    known = tabla_tp.known_minutes(cand_pos)
+    legs = np.where(np.isnan(known), walk, np.minimum(walk, np.nan_to_num(known))).astype(np.int64)
+    from_start = (dist_start / 1000 / WALK_SPEED_KMH * 60).astype(np.int64)
+
+    n = len(cand)
+    cost = np.zeros((n + 1, n + 1), dtype=np.int64)
+    cost[1:, 1:] = legs
+    cost[0, 1:] = from_start
+    cost[1:, 0] = from_start
+
+    # Tramos exactos (con transporte) para los imprescindibles: son pocos y
+    # deciden si caben todos en el horario
+    mandatory = store.name_mask(imprescindibles)[cand]
+    for m in np.flatnonzero(mandatory):
+        destino = (store.lat[cand[m]], store.lon[cand[m]])
+        cost[0, m + 1] = min(cost[0, m + 1], should_use_public_transport(start, destino, transporte, walk_metric)[2])
+        for k in np.flatnonzero(mandatory):
+            if k != m:
+                cost[m + 1, k + 1] = min(cost[m + 1, k + 1], tabla_tp.leg(cand_pos[m], cand_pos[k])[2])
+
+    problem = route_engine.OrienteeringProblem(
+        cost,
+        mandatory=mandatory,
+        start_min=inicio.hour * 60 + inicio.minute,
+        end_min=fin.hour * 60 + fin.minute,
+        visit_min=VISIT_DURATION_MIN,
+        lunch=route_engine.LUNCH_WINDOW if incluir_pausa_comida else None,
+        return_to_start=False,  # como el voraz: la vuelta se añade solo si cabe
+    )
+    return [int(cand[node - 1]) for node in route_engine.solve(problem, time_limit_s=time_limit_s)]
 
 
 def generar_ruta(
@@ -180,166 +410,259 @@ def generar_ruta(
     preferencias_tipo: List[str],
     transporte: TransportOption = "ambos",
     incluir_pausa_comida: bool = True,
+    engine: RouteEngine = "greedy",
+    time_limit_s: float = OPTIMIZED_TIME_LIMIT_S,
+    walk_metric: WalkMetric = "haversine",
+    filas: Optional[Sequence[int]] = None,
 ) -> List[Dict]:
-    """Devuelve una lista ordenada de pasos de la ruta."""
+    """Devuelve una lista ordenada de pasos de la ruta.
+
+    ``engine="greedy"`` elige en cada paso el monumento más cercano que cabe;
+    ``engine="optimized"`` resuelve antes el orden completo con
+    ``route_engine`` (como mucho ``time_limit_s`` segundos) y lo recorre.
+    ``walk_metric="network"`` mide los tramos a pie por la red de calles
+    (``python -m src.network_distances``) en lugar de en línea recta.
+
+    ``filas`` limita los candidatos a esas filas del almacén (``poi_store``);
+    sin ellas, los catálogos de ``poi_clusters.CLUSTERED_MIN_POIS`` monumentos
+    o más se limitan a los barrios que rodean el alojamiento.
+    """
+    return list(iter_ruta(
+        gdf_monumentos, start_coord, inicio_hora, fin_hora, imprescindibles, preferencias_tipo,
+        transporte, incluir_pausa_comida, engine, time_limit_s, walk_metric, filas=filas,
+    ))
 
-    # ---------- prefiltrado ----------
-    candidatos = (
-        gdf_monumentos[gdf_monumentos["tipo"].isin(preferencias_tipo)]
-        if preferencias_tipo else gdf_monumentos.copy()
+
+def iter_ruta(
+    gdf_monumentos: gpd.GeoDataFrame,
+    start_coord: Tuple[float, float],
+    inicio_hora: dt.time,
+    fin_hora: dt.time,
+    imprescindibles: List[str],
+    preferencias_tipo: List[str],
+    transporte: TransportOption = "ambos",
+    incluir_pausa_comida: bool = True,
+    engine: RouteEngine = "greedy",
+    time_limit_s: float = OPTIMIZED_TIME_LIMIT_S,
+    walk_metric: WalkMetric = "haversine",
+    prefijo: Sequence[DecisionPaso] = (),
+    registro: Optional[List[DecisionPaso]] = None,
+    filas: Optional[Sequence[int]] = None,
+) -> Iterator[Dict]:
+    """Como ``generar_ruta``, pero entrega cada paso en cuanto queda fijado.
+
+    Cada tramo, pausa o visita se produce al final de su paso de
+    planificación, de modo que quien lo consume (la app) puede pintarlo sin
+    esperar al día completo. Los argumentos se validan al llamar, no al iterar.
+
+    ``prefijo`` son decisiones ya tomadas que se repiten sin evaluar ningún
+    candidato (la replanificación incremental garantiza que siguen siendo
+    válidas); a partir de ahí se planifica normalmente. Si se da ``registro``,
+    se le añade la decisión de cada paso.
+    """
+    if engine not in ("greedy", "optimized"):
+        raise ValueError(f"Motor de rutas desconocido: {engine!r}")
+    if walk_metric not in ("haversine", "network"):
+        raise ValueError(f"Métrica a pie desconocida: {walk_metric!r}")
+    return _pasos_ruta(
+        gdf_monumentos, start_coord, inicio_hora, fin_hora, imprescindibles, preferencias_tipo,
+        transporte, incluir_pausa_comida, engine, time_limit_s, walk_metric, prefijo, registro, filas,
     )
-    imp_df = gdf_monumentos[gdf_monumentos["nombre"].isin(imprescindibles)]
-    candidatos = gpd.GeoDataFrame(pd.concat([imp_df, candidatos])).drop_duplicates("nombre")
 
-    # ---------- orden por cercanía al alojamiento ----------
-    start_lat, start_lon = start_coord
-    inicio_point = Point(start_lon, start_lat)
-    candidatos["dist_start"] = candidatos.geometry.distance(inicio_point)
-    candidatos = candidatos.sort_values("dist_start").reset_index(drop=True)
+
+def _pasos_ruta(
+    gdf_monumentos: gpd.GeoDataFrame,
+    start_coord: Tuple[float, float],
+    inicio_hora: dt.time,
+    fin_hora: dt.time,
+    imprescindibles: List[str],
+    preferencias_tipo: List[str],
+    transporte: TransportOption = "ambos",
+    incluir_pausa_comida: bool = True,
+    engine: RouteEngine = "greedy",
+    time_limit_s: float = OPTIMIZED_TIME_LIMIT_S,
+    walk_metric: WalkMetric = "haversine",
+    prefijo: Sequence[DecisionPaso] = (),
+    registro: Optional[List[DecisionPaso]] = None,
+    filas: Optional[Sequence[int]] = None,
+) -> Iterator[Dict]:
+    with stage("ruta.preparacion"):
+        # ---------- almacén columnar y tabla de tramos ----------
+        store = get_poi_store(gdf_monumentos)
+        tabla_tp = get_transit_matrix(gdf_monumentos, transporte, walk_metric)
+        horarios = get_timetables() if transporte != "ninguno" else None
+        if walk_metric == "network":
+            red = get_network_table()
+            walk_m = red.matrix_for(store.lat, store.lon)
+        else:
+            walk_m = store.dist
+
+        # ---------- prefiltrado ----------
+        cand = store.candidates(preferencias_tipo, imprescindibles)
+        if filas is not None:
+            cand = cand[np.isin(cand, filas)]
+        else:
+            cand = candidatos_por_barrios(store, cand, start_coord, inicio_hora, fin_hora, imprescindibles)
+
+        # ---------- orden por cercanía al alojamiento ----------
+        start_lat, start_lon = start_coord
+        if walk_metric == "network":
+            dist_start = red.from_point(start_lat, start_lon, store.lat[cand], store.lon[cand])
+        else:
+            dist_start = haversine_many(start_lat, start_lon, store.lat[cand], store.lon[cand])
+        order = np.argsort(dist_start, kind="stable")
+        cand, dist_start = cand[order], dist_start[order]
+        cand_names = store.name_code[cand]
 
     # ---------- estado inicial ----------
-    itinerary = []
     current_lat, current_lon = start_coord
     current_time = dt.datetime.combine(dt.date.today(), inicio_hora)
     end_time = dt.datetime.combine(dt.date.today(), fin_hora)
     time_budget = (end_time - current_time).total_seconds() / 60
 
-    visitados: set[str] = set()
+    current = None  # fila del almacén; None mientras estemos en el alojamiento
+    visitados = store.new_visited()
+    n_visitados = 0
     faltan_imp: list[str] = [n for n in imprescindibles if n]  # copia editable
 
-    # ---------- bucle principal ----------
-    while time_budget > 0 and len(visitados) < len(candidatos):
-        # Distancia actual a cada POI
-        candidatos["dist_now"] = candidatos.apply(
-            lambda row: haversine_distance(current_lat, current_lon,
-                                           row.geometry.y, row.geometry.x),
-            axis=1
-        )
+    orden = None
+    if engine == "optimized":
+        with stage("ruta.orden_optimizado"):
+            orden = _orden_optimizado(store, cand, dist_start, walk_m, tabla_tp, imprescindibles,
+                                      start_coord, transporte, current_time, end_time,
+                                      incluir_pausa_comida, time_limit_s, walk_metric)
+
+    def _seleccionar() -> Optional[DecisionPaso]:
+        """Primer candidato que cabe en el tiempo restante desde la posición actual."""
+        with stage("ruta.seleccion"):
+            if orden is not None:
+                # Sigue el orden optimizado, saltando lo ya visitado o lo que no quepa
+                propuestas = [r for r in orden if not visitados[store.name_code[r]]]
+            else:
+                pendientes = ~visitados[cand_names]
+                if not pendientes.any():
+                    return None
+                rows = cand[pendientes]
+                # Distancia actual a cada POI (una fila de la matriz tras la primera visita)
+                dist_now = dist_start[pendientes] if current is None else walk_m[current, rows]
+
+                # Si quedan imprescindibles, prioriza acercarse al primero pendiente
+                if faltan_imp:
+                    proximo_imp = store.row_of(faltan_imp[0])
+                    propuestas = rows[np.lexsort((dist_now, walk_m[proximo_imp, rows]))]
+                else:
+                    propuestas = rows[np.argsort(dist_now, kind="stable")]
+
+            # Elige el primer POI que cabe en el tiempo
+            rechazo = math.inf
+            for row in propuestas:
+                origen = (current_lat, current_lon)
+                destino = (store.lat[row], store.lon[row])
+
+                # evaluamos transporte público (tabla precalculada entre monumentos)
+                if current is None:
+                    usar_tp, modo_tp, tramo_min = should_use_public_transport(
+                        origen, destino, transporte, walk_metric, salida=current_time
+                    )
+                else:
+                    usar_tp, modo_tp, tramo_min = tabla_tp.leg(store.pos[current], store.pos[row])
+                    if usar_tp and horarios:
+                        # la tabla es estática: con horarios se recalcula a la hora real, pero
+                        # solo si con la estimación aún podría caber (el cálculo vivo es caro)
+                        if tramo_min + VISIT_DURATION_MIN > time_budget + TIMETABLE_SLACK_MIN:
+                            rechazo = min(rechazo, tramo_min + VISIT_DURATION_MIN - TIMETABLE_SLACK_MIN)
+                            continue
+                        usar_tp, modo_tp, tramo_min = should_use_public_transport(
+                            origen, destino, transporte, walk_metric, salida=current_time
+                        )
+
+                necesita = tramo_min + VISIT_DURATION_MIN
+                if time_budget >= necesita:
+                    return DecisionPaso(int(row), tramo_min, modo_tp if usar_tp else "A pie",
+                                        necesita, rechazo, time_budget)
+                rechazo = min(rechazo, necesita)
+            return None
 
-        # Si quedan imprescindibles, prioriza acercarse al primero pendiente
-        if faltan_imp:
-            proximo_imp = gdf_monumentos[gdf_monumentos["nombre"] == faltan_imp[0]].iloc[0]
-            candidatos["dist_to_next_imp"] = candidatos.apply(
-                lambda r: haversine_distance(r.geometry.y, r.geometry.x,
-                                             proximo_imp.geometry.y, proximo_imp.geometry.x),
-                axis=1
-            )
-            ordenados = (candidatos[~candidatos["nombre"].isin(visitados)]
-                         .sort_values(["dist_to_next_imp", "dist_now"]))
+    # ---------- bucle principal ----------
+    while time_budget > 0 and n_visitados < len(cand):
+        if n_visitados < len(prefijo):
+            # paso del plan anterior que sigue siendo válido
+            decision = prefijo[n_visitados]._replace(restante=time_budget)
         else:
-            ordenados = candidatos[~candidatos["nombre"].isin(visitados)].sort_values("dist_now")
-
-        if ordenados.empty:
-            break
-
-        # Elige el primer POI que cabe en el tiempo
-        elegido = None
-        tramo_usar = 0
-        modo_usar = "A pie"
-        for _, poi in ordenados.iterrows():
-            origen = (current_lat, current_lon)
-            destino = (poi.geometry.y, poi.geometry.x)
-
-            # evaluamos transporte público
-            usar_tp, modo_tp, tramo_min = should_use_public_transport(
-                origen, destino, transporte
-            )
+            decision = _seleccionar()
+            if decision is None:
+                break  # no cabe ningún candidato
+        if registro is not None:
+            registro.append(decision)
+        elegido, tramo_usar, modo_usar = decision.elegido, decision.tramo, decision.modo
 
-            if time_budget >= tramo_min + VISIT_DURATION_MIN:
-                elegido = poi
-                tramo_usar = tramo_min
-                modo_usar = modo_tp if usar_tp else "A pie"
-                break
-
-        if elegido is None:
-            break  # no cabe ningún candidato
+        nombre = store.nombres[elegido]
+        poi_lat, poi_lon = float(store.lat[elegido]), float(store.lon[elegido])
 
         # ---------- añadir tramo ----------
-        itinerary.append({
-            "nombre": f"Tramo hacia {elegido['nombre']}",
+        yield {
+            "nombre": f"Tramo hacia {nombre}",
             "tipo": modo_usar,
             "llegada": current_time.strftime("%H:%M"),
             "salida": (current_time + dt.timedelta(minutes=tramo_usar)).strftime("%H:%M"),
             "lat": current_lat,
             "lon": current_lon,
-        })
+        }
         current_time += dt.timedelta(minutes=tramo_usar)
         time_budget -= tramo_usar
 
         # ---------- pausa comida ----------
         if incluir_pausa_comida and dt.time(13, 30) <= current_time.time() <= dt.time(14, 30):
-            itinerary.append({
+            yield {
                 "nombre": "Pausa comida",
                 "tipo": "Pausa",
                 "llegada": current_time.strftime("%H:%M"),
                 "salida": (current_time + dt.timedelta(hours=1)).strftime("%H:%M"),
                 "lat": current_lat,
                 "lon": current_lon,
-            })
+            }
             current_time += dt.timedelta(hours=1)
             time_budget -= 60
             incluir_pausa_comida = False
 
         # ---------- visita POI ----------
-        itinerary.append({
-            "nombre": elegido["nombre"],
-            "tipo": elegido["tipo"],
+        yield {
+            "nombre": nombre,
+            "tipo": store.tipos[store.tipo[elegido]],
             "llegada": current_time.strftime("%H:%M"),
             "salida": (current_time + dt.timedelta(minutes=VISIT_DURATION_MIN)).strftime("%H:%M"),
-            "lat": elegido.geometry.y,
-            "lon": elegido.geometry.x,
-        })
+            "lat": poi_lat,
+            "lon": poi_lon,
+        }
         current_time += dt.timedelta(minutes=VISIT_DURATION_MIN)
         time_budget -= VISIT_DURATION_MIN
-        current_lat, current_lon = elegido.geometry.y, elegido.geometry.x
-        visitados.add(elegido["nombre"])
-        if elegido["nombre"] in faltan_imp:
-            faltan_imp.remove(elegido["nombre"])
-
-    # ---------- retorno al alojamiento ----------
-    dist_back_walk = haversine_distance(current_lat, current_lon, start_lat, start_lon)
-    modo_vuelta = "A pie"
-    dist_back = dist_back_walk
+        current_lat, current_lon = poi_lat, poi_lon
+        current = elegido
+        visitados[store.name_code[elegido]] = True
+        n_visitados += 1
+        if nombre in faltan_imp:
+            faltan_imp.remove(nombre)
 
-    if transporte != "ninguno":
-        time_tp_back, linea_back, modo_back = get_public_transport_time(
-            (current_lat, current_lon), (start_lat, start_lon), transporte, return_line=True
-        )
-        if time_tp_back is not None and (dist_back_walk - time_tp_back) >= 900:
-            dist_back = time_tp_back + 200  # sumamos accesos estimados
-            modo_vuelta = f"{modo_back} línea {linea_back}"
+    tabla_tp.flush()  # si el consumidor corta antes, las celdas nuevas se guardan en la siguiente ruta
 
-    time_back = walking_time_minutes(dist_back)
+    # ---------- retorno al alojamiento ----------
+    with stage("ruta.retorno"):
+        if transporte != "ninguno":
+            # en minutos, con el mismo criterio (ahorro > 5 min) que los tramos de ida
+            _, modo_vuelta, time_back = should_use_public_transport(
+                (current_lat, current_lon), (start_lat, start_lon), transporte, walk_metric,
+                salida=current_time,
+            )
+        else:
+            modo_vuelta = "A pie"
+            time_back = walking_time_minutes(
+                walk_distance((current_lat, current_lon), (start_lat, start_lon), walk_metric))
     if time_budget >= time_back:
-        itinerary.append({
+        yield {
             "nombre": "Retorno al alojamiento",
             "tipo": modo_vuelta,
             "llegada": current_time.strftime("%H:%M"),
             "salida": (current_time + dt.timedelta(minutes=time_back)).strftime("%H:%M"),
             "lat": start_lat,
             "lon": start_lon,
-        })
-
-    return itinerary
-
-    
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        }
@@ -0,0 +1,314 @@
+# src/service.py
+"""Servicio local de rutas: planificación y caminos a pie fuera de Streamlit.
+
+Dentro de la app cada sesión vuelve a ejecutar el script y planifica en el
+hilo de Streamlit, compitiendo por el GIL de un único intérprete. Este
+servicio HTTP (solo biblioteca estándar) atiende las peticiones con un pool
+de procesos que cargan una sola vez los monumentos, índices, tablas de
+tramos y la red peatonal, así que la capacidad de planificación se escala
+aparte de la interfaz (``-w``) y ninguna sesión paga la carga de datos.
+
+Rutas (JSON en el cuerpo y en la respuesta):
+
+* ``POST /ruta``     una petición con el formato de ``src.batch``; devuelve
+  ``{"id", "itinerario", "ms"}`` o ``{"id", "error"}``
+* ``POST /caminos``  ``{"coords": [[lon, lat], …]}`` → ``{"caminos": [[[lon, lat], …], …]}``,
+  el camino por la calle de cada par de puntos consecutivos
+* ``GET /estado``    procesos, peticiones en curso y capacidad
+
+Las peticiones admitidas a la vez están acotadas (procesos + ``--cola``):
+por encima se responde ``503`` con ``Retry-After`` en lugar de acumularlas,
+y una petición que tarda más de ``--timeout`` segundos responde ``504``.
+
+Uso::
+
+    python -m src.service -w 4                       # http://127.0.0.1:8765
+    VALENCIA_ROUTING_URL=http://127.0.0.1:8765 streamlit run app/streamlit_app.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_QUEUE = 32          # peticiones en espera además de las que ya se ejecutan
+SERVICE_TIMEOUT_S = 30.0    # tope por petición
+MAX_BODY_BYTES = 1 << 20
+
+_ROUTER = None  # enrutador peatonal del trabajador
+
+
+class ServiceError(RuntimeError):
+    """Respuesta de error del servicio (o servicio inaccesible); ``status`` es el código HTTP."""
+
+    def __init__(self, message: str, status: int = 0):
+        super().__init__(message)
+        self.status = status
+
+
+# ------------------------
+# Trabajadores
+# ------------------------
+def _init_worker(walk_metric: str = "haversine") -> None:
+    """Como el de ``src.batch``, más la red peatonal si ya está compilada."""
+    from src import batch
+
+    batch._init_worker(walk_metric)
+    _walk_router()
+
+
+def _walk_router():
+    global _ROUTER
+    if _ROUTER is None:
+        from src.route_generator import access_grid
+        from src.walk_graph import CSR_DIR, GRAPHML_PATH, is_fresh, load_walk_csr
+        from src.walk_routing import WalkRouter
+
+        if not GRAPHML_PATH.exists() and not is_fresh(CSR_DIR, GRAPHML_PATH):
+            return None  # sin red descargada: los caminos se piden en línea recta
+        _ROUTER = WalkRouter(load_walk_csr())
+        _ROUTER.grid = access_grid()
+    return _ROUTER
+
+
+def _caminos(coords: List[List[float]]) -> List[List[List[float]]]:
+    router = _walk_router()
+    coords = [(float(lon), float(lat)) for lon, lat in coords]
+    if router is None:
+        return [[list(a), list(b)] for a, b in zip(coords[:-1], coords[1:])]
+    return router.route_legs(coords)
+
+
+def _es_par(punto) -> bool:
+    return (isinstance(punto, (list, tuple)) and len(punto) == 2
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in punto))
+
+
+def _ruta(request: Dict) -> Dict:
+    from src.batch import run_request
+
+    return run_request(request)
+
+
+# ------------------------
+# Servidor
+# ------------------------
+class RoutingService:
+    """Pool de procesos con admisión acotada y tiempo máximo por petición."""
+
+    def __init__(self, workers: Optional[int] = None, queue: int = SERVICE_QUEUE,
+                 timeout_s: float = SERVICE_TIMEOUT_S, walk_metric: str = "haversine"):
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + queue
+        self.timeout_s = timeout_s
+        self.walk_metric = walk_metric
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.walk_metric,))
+
+    def submit(self, fn, *args):
+        """Resultado de ``fn(*args)`` en el pool; ``ServiceError`` 503 si está lleno, 504 si no acaba."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceError("Servicio ocupado: demasiadas peticiones en curso", 503)
+        with self._lock:
+            self.in_flight += 1
+            pool = self._pool
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._release()
+            self._restart(pool)
+            raise ServiceError("Se ha reiniciado el pool de trabajadores", 503)
+        # el hueco se libera cuando el trabajo termina de verdad, no cuando se deja de esperar
+        future.add_done_callback(lambda _: self._release())
+        try:
+            result = future.result(timeout=self.timeout_s)
+        except FutureTimeout:
+            future.cancel()  # si aún no había empezado, ya no ocupará un proceso
+            with self._lock:
+                self.timeouts += 1
+            raise ServiceError(f"La petición superó {self.timeout_s:g} s", 504)
+        except BrokenProcessPool:
+            self._restart(pool)
+            raise ServiceError("Un trabajador terminó de forma inesperada", 500)
+        with self._lock:
+            self.served += 1
+        return result
+
+    def _release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is broken:
+                self._pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {"workers": self.workers, "capacidad": self.capacity, "en_curso": self.in_flight,
+                    "atendidas": self.served, "rechazadas": self.rejected, "timeouts": self.timeouts}
+
+    def warm_up(self) -> None:
+        """Arranca todos los procesos (y su precarga) antes de aceptar peticiones."""
+        for future in [self._pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _handler(service: RoutingService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):  # una línea por petición, sin el ruido por defecto
+            sys.stderr.write(f"{self.command} {self.path} {args[1] if len(args) > 1 else ''}\n")
+
+        def _send(self, status: int, payload: Dict, headers: Optional[Dict] = None) -> None:
+            body = json.dumps(payload, ensure_ascii=False, default=float).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/estado":
+                self._send(200, service.status())
+            else:
+                self._send(404, {"error": f"Ruta desconocida: {self.path}"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self.close_connection = True  # el cuerpo no se lee
+                self._send(413, {"error": "Petición demasiado grande"})
+                return
+            try:
+                data = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as e:
+                self._send(400, {"error": f"JSON no válido: {e}"})
+                return
+            if not isinstance(data, dict):
+                self._send(400, {"error": "El cuerpo debe ser un objeto JSON"})
+                return
+            try:
+                if self.path == "/ruta":
+                    result = service.submit(_ruta, data)
+                    self._send(422 if "error" in result else 200, result)
+                elif self.path == "/caminos":
+                    coords = data.get("coords") or []
+                    if not isinstance(coords, list) or not all(_es_par(p) for p in coords):
+                        self._send(400, {"error": "'coords' debe ser una lista de pares [lon, lat]"})
+                        return
+                    self._send(200, {"caminos": service.submit(_caminos, coords) if len(coords) > 1 else []})
+                else:
+                    self._send(404, {"error": f"Ruta desconocida: {self.path}"})
+            except ServiceError as e:
+                headers = {"Retry-After": "1"} if e.status == 503 else None
+                self._send(e.status or 500, {"error": str(e)}, headers)
+            except Exception as e:  # el hilo siempre responde
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    return Handler
+
+
+def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT, **kwargs) -> None:
+    service = RoutingService(**kwargs)
+    t0 = time.perf_counter()
+    service.warm_up()
+    server = ThreadingHTTPServer((host, port), _handler(service))
+    server.daemon_threads = True
+    print(f"Servicio de rutas en http://{host}:{port} con {service.workers} procesos "
+          f"(capacidad {service.capacity}, listo en {time.perf_counter() - t0:.1f} s)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+# ------------------------
+# Cliente
+# ------------------------
+class RoutingClient:
+    """Cliente mínimo (``urllib``) del servicio, para la app o para scripts."""
+
+    def __init__(self, url: str, timeout_s: float = SERVICE_TIMEOUT_S + 5):
+        self.url = url.rstrip("/")
+        self.timeout_s = timeout_s
+
+    def _call(self, path: str, payload: Optional[Dict] = None) -> Dict:
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False, default=str).encode()
+        req = urllib.request.Request(self.url + path, data=data,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout_s) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise ServiceError(str(message), e.code) from None
+        except (urllib.error.URLError, OSError) as e:
+            raise ServiceError(f"Servicio de rutas inaccesible en {self.url}: {e}") from None
+
+    def ruta(self, request: Dict) -> List[Dict]:
+        """Itinerario de una petición con el formato de ``src.batch``."""
+        return self._call("/ruta", request)["itinerario"]
+
+    def caminos(self, coords: Sequence[Sequence[float]]) -> List[List[List[float]]]:
+        """Camino por la calle entre cada par de (lon, lat) consecutivos."""
+        if len(coords) < 2:
+            return []
+        return self._call("/caminos", {"coords": [list(c) for c in coords]})["caminos"]
+
+    def estado(self) -> Dict:
+        return self._call("/estado")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.service", description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("-w", "--workers", type=int, default=None, help="procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--cola", type=int, default=SERVICE_QUEUE, help="peticiones en espera antes de responder 503")
+    parser.add_argument("--timeout", type=float, default=SERVICE_TIMEOUT_S, help="segundos máximos por petición")
+    parser.add_argument("--walk-metric", default="haversine", choices=("haversine", "network"))
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, workers=args.workers, queue=args.cola, timeout_s=args.timeout,
+          walk_metric=args.walk_metric)
+
+
+if __name__ == "__main__":
+    main()
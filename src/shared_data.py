@@ -0,0 +1,222 @@
+# src/shared_data.py
+"""Arrays derivados publicados una vez y compartidos entre procesos sin copia.
+
+Con varios trabajadores (``src.batch``, ``src.service``, varias réplicas de
+Streamlit) cada proceso calculaba o copiaba su propia matriz de distancias
+entre monumentos, tabla de distancias por la red, tablas de tramos y red de
+transporte compilada, así que la memoria crecía con el número de procesos.
+
+El primer proceso que necesita un conjunto de arrays lo calcula y lo publica
+en ``data/processed/shared/<nombre>/<huella>/`` como ``.npy`` más un
+``meta.json``; el resto (y los arranques siguientes) lo abren con
+``mmap_mode="r"``. Las páginas son las de la caché del sistema operativo, de
+modo que todos los procesos leen la misma memoria física: es el mismo
+mecanismo que ya usan el grafo CSR, los horarios GTFS y la rejilla de
+accesibilidad, y a diferencia de ``multiprocessing.shared_memory`` no hace
+falta un proceso dueño que libere los segmentos ni sobrevive nada en
+``/dev/shm`` si un trabajador muere.
+
+Mientras un proceso calcula un nombre, los demás esperan a un cerrojo
+(``flock``) y adjuntan el resultado. La publicación es atómica: se escribe
+en un directorio temporal y se renombra. Se conservan las
+``KEEP_VERSIONS`` huellas más recientes de cada nombre. Los conjuntos de
+menos de ``MIN_SHARED_BYTES`` no se publican (no compensa un fichero) y se
+quedan en memoria del proceso.
+
+Los artefactos con directorio fijo (horarios GTFS, grafo CSR, rejilla de
+accesibilidad) usan el mismo cerrojo (``build_lock``) y la misma escritura
+atómica (``save_arrays``).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from src.data_loader import PROCESSED_DIR
+
+SHARED_DIR = PROCESSED_DIR / "shared"
+FORMAT_VERSION = 1
+MIN_SHARED_BYTES = 1 << 20
+KEEP_VERSIONS = 4
+
+Build = Callable[[], Tuple[Dict[str, np.ndarray], Dict]]
+
+
+def _read_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _read_umask()  # se lee al importar: os.umask solo se consulta cambiándola
+
+
+def share_permissions(path) -> None:
+    """Permisos de un fichero o directorio nuevo según la umask (``0o666``/``0o777`` sin ella).
+
+    ``mkstemp`` y ``mkdtemp`` crean 0600/0700, así que lo renombrado después
+    a su sitio solo lo leería la cuenta que lo generó (y no el usuario del
+    servicio o de Streamlit).
+    """
+    mode = 0o777 if os.path.isdir(path) else 0o666
+    os.chmod(path, mode & ~_UMASK)
+
+
+class SharedArrays(NamedTuple):
+    """Arrays de solo lectura (proyectados en memoria si están publicados) y sus metadatos JSON."""
+
+    arrays: Dict[str, np.ndarray]
+    meta: Dict
+    shared: bool
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+
+def _dir(name: str, fingerprint: str, directory: Path) -> Path:
+    return Path(directory) / name / fingerprint[:24]
+
+
+def attach(name: str, fingerprint: str, directory=SHARED_DIR) -> Optional[SharedArrays]:
+    """Arrays publicados con esa huella, sin copiarlos; None si no existen o no coinciden."""
+    path = _dir(name, fingerprint, directory)
+    try:
+        with open(path / "meta.json") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != FORMAT_VERSION or meta.get("fingerprint") != fingerprint:
+        return None
+    try:
+        arrays = {key: np.load(path / f"{key}.npy", mmap_mode="r") for key in meta["arrays"]}
+    except (OSError, ValueError):
+        return None
+    return SharedArrays(arrays, meta.get("extra", {}), True)
+
+
+def publish(name: str, fingerprint: str, arrays: Dict[str, np.ndarray], extra: Optional[Dict] = None,
+            directory=SHARED_DIR) -> SharedArrays:
+    """Publica ``arrays`` con esa huella y devuelve la copia proyectada (la propia o la de otro proceso)."""
+    final = _dir(name, fingerprint, directory)
+    final.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=".tmp-", dir=final.parent))
+    try:
+        for key, arr in arrays.items():
+            np.save(tmp / f"{key}.npy", np.ascontiguousarray(arr))
+        meta = {"version": FORMAT_VERSION, "fingerprint": fingerprint, "arrays": list(arrays),
+                "extra": extra or {}}
+        with open(tmp / "meta.json", "w") as fh:
+            json.dump(meta, fh)
+        share_permissions(tmp)
+        try:
+            os.rename(tmp, final)
+        except OSError:
+            # otro proceso lo publicó antes (se usa el suyo), salvo que lo que hay esté incompleto
+            if attach(name, fingerprint, directory) is None:
+                shutil.rmtree(final, ignore_errors=True)
+                os.rename(tmp, final)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    _prune(final.parent)
+    bundle = attach(name, fingerprint, directory)
+    if bundle is None:
+        raise OSError(f"No se pudo publicar {name!r} en {final}")
+    return bundle
+
+
+def get_shared(name: str, fingerprint: str, build: Build, directory=SHARED_DIR) -> SharedArrays:
+    """Arrays ``name`` con esa huella: los publicados, o ``build()`` publicado para los demás.
+
+    ``build`` devuelve ``(arrays, extra)``, con ``extra`` serializable a JSON.
+    Si no se puede escribir en ``directory`` se usan en memoria (solo lectura).
+    """
+    bundle = attach(name, fingerprint, directory)
+    if bundle is not None:
+        return bundle
+    with build_lock(Path(directory) / name):
+        # quien esperaba el cerrojo encuentra ya publicado lo que calculó el otro proceso
+        bundle = attach(name, fingerprint, directory)
+        if bundle is not None:
+            return bundle
+        arrays, extra = build()
+        if sum(np.asarray(a).nbytes for a in arrays.values()) >= MIN_SHARED_BYTES:
+            try:
+                return publish(name, fingerprint, arrays, extra, directory)
+            except OSError:
+                pass  # sin permisos de escritura: copia privada
+    for arr in arrays.values():
+        if isinstance(arr, np.ndarray):
+            arr.setflags(write=False)
+    return SharedArrays(arrays, extra or {}, False)
+
+
+def save_arrays(directory, arrays: Dict[str, np.ndarray], meta: Dict) -> None:
+    """Escribe ``arrays`` (un ``.npy`` cada uno) y ``meta.json`` en ``directory`` de forma atómica.
+
+    Todo se escribe en un directorio temporal hermano que sustituye al
+    anterior con dos renombrados, así que nadie ve metadatos nuevos junto a
+    arrays a medio escribir. Los procesos que ya tenían proyectados los
+    ficheros antiguos los conservan hasta cerrarlos.
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{directory.name}.tmp-", dir=directory.parent))
+    old = directory.parent / f".{directory.name}.old-{os.getpid()}"
+    try:
+        for key, arr in arrays.items():
+            np.save(tmp / f"{key}.npy", np.ascontiguousarray(arr))
+        with open(tmp / "meta.json", "w") as fh:
+            json.dump(meta, fh)
+        share_permissions(tmp)
+        if directory.exists():
+            os.rename(directory, old)
+        os.rename(tmp, directory)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def build_lock(path: Path):
+    """Cerrojo entre procesos (``flock``) para que solo uno calcule ``path`` a la vez.
+
+    El fichero del cerrojo es ``.<nombre>.lock`` junto a ``path``, no dentro:
+    ``save_arrays`` sustituye el directorio entero.
+    """
+    path = Path(path)
+    try:
+        import fcntl
+    except ImportError:  # Windows: como mucho se calcula dos veces y gana una publicación
+        yield
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fh = open(path.parent / f".{path.name}.lock", "a")
+    except OSError:
+        yield
+        return
+    with fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _prune(parent: Path) -> None:
+    """Borra las huellas antiguas de un nombre (los procesos que aún las usan conservan su proyección)."""
+    try:
+        versions = sorted((p for p in parent.iterdir() if p.is_dir() and not p.name.startswith(".tmp-")),
+                          key=lambda p: p.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    for stale in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(stale, ignore_errors=True)
@@ -0,0 +1,156 @@
+# src/spatial_index.py
+"""Índices espaciales métricos sobre las capas de paradas (bus y metro).
+
+Cada capa se indexa una sola vez con un ``BallTree`` de scikit-learn usando la
+métrica haversine, de modo que las consultas de k vecinos y de radio trabajan
+en metros reales y cuestan O(log n) en vez de recorrer toda la tabla.
+
+Los índices son de solo lectura: no se añaden columnas al GeoDataFrame de
+origen y los arrays internos se marcan como no escribibles, así que pueden
+compartirse entre hilos sin bloqueos.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    arr.setflags(write=False)
+    return arr
+
+
+class StopIndex:
+    """Índice haversine inmutable sobre una capa de puntos (paradas o estaciones)."""
+
+    def __init__(self, gdf: gpd.GeoDataFrame):
+        self.gdf = gdf
+        self.lat = _readonly(gdf.geometry.y.to_numpy(dtype=np.float64, copy=True))
+        self.lon = _readonly(gdf.geometry.x.to_numpy(dtype=np.float64, copy=True))
+        coords = np.radians(np.column_stack([self.lat, self.lon]))
+        from sklearn.neighbors import BallTree  # diferido: importar sklearn cuesta ~1 s
+
+        self._tree = BallTree(coords, metric="haversine")
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    @staticmethod
+    def _query_point(lat: float, lon: float) -> np.ndarray:
+        return np.radians([[lat, lon]])
+
+    def query_nearest(self, lat: float, lon: float, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Devuelve (posiciones, distancias en metros) de las k paradas más cercanas."""
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        dist, idx = self._tree.query(self._query_point(lat, lon), k=k)
+        return idx[0], dist[0] * EARTH_RADIUS_M
+
+    def query_nearest_many(self, lats, lons, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Como ``query_nearest`` para muchos puntos a la vez: arrays (n, k)."""
+        k = min(k, len(self))
+        pts = np.radians(np.column_stack([np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)]))
+        if k <= 0:
+            return np.empty((len(pts), 0), dtype=np.intp), np.empty((len(pts), 0))
+        dist, idx = self._tree.query(pts, k=k)
+        return idx, dist * EARTH_RADIUS_M
+
+    def query_radius(self, lat: float, lon: float, radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Devuelve (posiciones, distancias en metros) dentro de ``radius_m``, de menor a mayor."""
+        idx, dist = self._tree.query_radius(
+            self._query_point(lat, lon), r=radius_m / EARTH_RADIUS_M,
+            return_distance=True, sort_results=True,
+        )
+        return idx[0], dist[0] * EARTH_RADIUS_M
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        max_dist: float = 400,
+        mask: Optional[np.ndarray] = None,
+    ) -> Optional[Tuple[int, float]]:
+        """Posición y distancia de la parada más cercana a menos de ``max_dist`` metros.
+
+        ``mask`` (booleano, alineado con la capa) restringe la búsqueda a un
+        subconjunto de paradas sin tener que reconstruir el índice.
+        """
+        if mask is None:
+            idx, dist = self.query_nearest(lat, lon, k=1)
+            if len(idx) and dist[0] <= max_dist:
+                return int(idx[0]), float(dist[0])
+            return None
+        idx, dist = self.query_radius(lat, lon, max_dist)
+        ok = mask[idx]
+        if not ok.any():
+            return None
+        first = int(np.argmax(ok))
+        return int(idx[first]), float(dist[first])
+
+
+def parse_lines(txt) -> frozenset:
+    """Convierte un texto de líneas ("10, 9,N6") en un conjunto de identificadores limpios."""
+    if txt is None or (isinstance(txt, float) and np.isnan(txt)):
+        return frozenset()
+    return frozenset(l.strip() for l in str(txt).split(",") if l.strip())
+
+
+class LineIndex:
+    """Índice invertido línea → paradas con un sub-índice espacial por línea.
+
+    Se construye una vez a partir de un ``StopIndex`` y de la columna con las
+    líneas separadas por comas (``lineas`` en EMT, ``linea`` en metro). Las
+    paradas se identifican por su posición en la capa original.
+    """
+
+    def __init__(self, stops: StopIndex, column: str):
+        self.stops = stops
+        self.lines_per_stop = tuple(parse_lines(txt) for txt in stops.gdf[column])
+        members: dict = {}
+        for pos, lines in enumerate(self.lines_per_stop):
+            for line in lines:
+                members.setdefault(line, []).append(pos)
+        self.line_stops = {line: _readonly(np.asarray(pos, dtype=np.intp))
+                           for line, pos in members.items()}
+        from sklearn.neighbors import BallTree
+
+        self._trees = {
+            line: BallTree(np.radians(np.column_stack([stops.lat[pos], stops.lon[pos]])),
+                           metric="haversine")
+            for line, pos in self.line_stops.items()
+        }
+
+    def lines_at(self, pos: int) -> frozenset:
+        """Líneas que paran en la parada ``pos``."""
+        return self.lines_per_stop[pos]
+
+    def nearest_on_line(self, lat: float, lon: float, line: str) -> Optional[Tuple[int, float]]:
+        """Parada de ``line`` más cercana a (lat, lon): (posición en la capa, metros)."""
+        tree = self._trees.get(line)
+        if tree is None:
+            return None
+        dist, idx = tree.query(np.radians([[lat, lon]]), k=1)
+        return int(self.line_stops[line][idx[0, 0]]), float(dist[0, 0] * EARTH_RADIUS_M)
+
+    def nearest_on_lines(
+        self,
+        lat: float,
+        lon: float,
+        lines,
+        max_dist: float = 400,
+    ) -> Optional[Tuple[int, float]]:
+        """Parada más cercana servida por alguna de ``lines`` a menos de ``max_dist`` metros."""
+        best = None
+        for line in lines:
+            hit = self.nearest_on_line(lat, lon, line)
+            if hit is not None and hit[1] <= max_dist and (best is None or hit[1] < best[1]):
+                best = hit
+        return best
@@ -0,0 +1,327 @@
+# src/transit_matrix.py
+"""Tabla precalculada de tramos entre monumentos para cada opción de transporte.
+
+Para una opción (``ninguno``/``bus``/``metro``/``ambos``) guarda, por cada par
+de monumentos, el modo elegido (a pie, bus o metro), la línea y los minutos
+del tramo. Las celdas se rellenan bajo demanda (o todas de golpe con el
+comando offline) y se persisten en ``data/processed`` junto a ``data/raw``,
+de modo que el planificador solo calcula en vivo los tramos que salen o
+llegan al alojamiento.
+
+Uso offline::
+
+    python -m src.transit_matrix            # las cuatro opciones
+    python -m src.transit_matrix bus metro  # solo algunas
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from src.data_loader import MAX_DENSE_POIS, PROCESSED_DIR
+
+TRANSPORT_OPTIONS = ("ninguno", "bus", "metro", "ambos")
+MODES = ("A pie", "bus", "metro")  # códigos 0, 1, 2
+
+LegFn = Callable[[Tuple[float, float], Tuple[float, float], str], Tuple[bool, str, float]]
+
+
+class TransitMatrix:
+    """Matriz POI×POI de (modo, línea, minutos) para una opción de transporte.
+
+    Las filas corresponden a coordenadas únicas de monumentos: las filas
+    repetidas del GeoJSON comparten celda a través de ``pos_to_row``.
+    """
+
+    def __init__(self, lat, lon, option: str, fingerprint: str, compute: LegFn):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        coords, first, inverse = np.unique(
+            np.column_stack([lat, lon]), axis=0, return_index=True, return_inverse=True)
+        order = np.argsort(first)  # filas en el orden de aparición original
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.pos_to_row = rank[inverse.ravel()]
+        self.lat = coords[order, 0]
+        self.lon = coords[order, 1]
+        self.option = option
+        self.fingerprint = fingerprint
+        self._compute = compute
+
+        self.lines: list = []
+        self._line_codes: Dict[str, int] = {}
+        self.dirty = False
+        self._allocate(len(self.lat))
+
+    def _allocate(self, n: int) -> None:
+        self.minutes = np.full((n, n), np.nan, dtype=np.float32)
+        self.mode = np.zeros((n, n), dtype=np.int8)
+        self.line = np.full((n, n), -1, dtype=np.int16)
+
+    @property
+    def path(self) -> Path:
+        return PROCESSED_DIR / f"transit_{self.option}_{self.fingerprint[:16]}.npz"
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def leg(self, pos_o: int, pos_d: int) -> Tuple[bool, str, float]:
+        """(usar_tp, modo_str, minutos) entre dos posiciones del GeoDataFrame de monumentos.
+
+        Devuelve lo mismo que ``should_use_public_transport``; si la celda aún no
+        existe se calcula una vez y queda guardada.
+        """
+        i, j = self.pos_to_row[pos_o], self.pos_to_row[pos_d]
+        cell = self._cell(i, j)
+        if cell is None:
+            return self._fill(i, j)
+        mode, line, minutes = cell
+        if mode == 0:
+            return False, MODES[0], float(minutes)
+        return True, f"{MODES[mode]} línea {self.lines[line]}", float(minutes)
+
+    def _cell(self, i: int, j: int) -> Optional[Tuple[int, int, float]]:
+        """(modo, código de línea, minutos) de la celda, o None si aún no se calculó."""
+        minutes = self.minutes[i, j]
+        if np.isnan(minutes):
+            return None
+        return int(self.mode[i, j]), int(self.line[i, j]), float(minutes)
+
+    def _set(self, i: int, j: int, mode: int, line: int, minutes: float) -> None:
+        self.mode[i, j] = mode
+        self.line[i, j] = line
+        self.minutes[i, j] = minutes
+
+    def known_minutes(self, pos) -> np.ndarray:
+        """Submatriz de minutos entre posiciones del GeoDataFrame (NaN si aún no se calculó)."""
+        rows = self.pos_to_row[np.asarray(pos)]
+        return self.minutes[np.ix_(rows, rows)]
+
+    def _fill(self, i: int, j: int) -> Tuple[bool, str, float]:
+        result = self._compute((self.lat[i], self.lon[i]), (self.lat[j], self.lon[j]), self.option)
+        usar_tp, modo_str, minutes = result
+        if usar_tp:
+            mode_name, line = modo_str.split(" línea ", 1)
+            self._set(i, j, MODES.index(mode_name), self._line_code(line), minutes)
+        else:
+            self._set(i, j, 0, -1, minutes)
+        self.dirty = True
+        return result
+
+    def _line_code(self, line: str) -> int:
+        code = self._line_codes.get(line)
+        if code is None:
+            code = self._line_codes[line] = len(self.lines)
+            self.lines.append(line)
+        return code
+
+    def fill_all(self) -> None:
+        """Calcula todas las celdas pendientes (uso offline)."""
+        for i, j in zip(*np.nonzero(np.isnan(self.minutes))):
+            if i != j:
+                self._fill(i, j)
+            else:
+                self.minutes[i, j] = 0.0
+        self.dirty = True
+
+    def load(self) -> bool:
+        """Carga la tabla persistida si existe y corresponde a la misma huella.
+
+        Una tabla completa (``fill_all``) ya no se modifica: se publica en
+        ``shared_data`` y todos los procesos la leen sin copia. Una incompleta
+        se copia, porque cada proceso rellena sus celdas bajo demanda.
+        """
+        from src.shared_data import get_shared
+
+        if not self.path.exists():
+            return False
+        with np.load(self.path, allow_pickle=False) as data:
+            if data["minutes"].shape != self.minutes.shape:
+                return False
+            complete = not np.isnan(data["minutes"]).any()
+            if complete:
+                stat = self.path.stat()
+                table = get_shared(f"transit_{self.option}", f"{self.fingerprint}:{stat.st_size}-{stat.st_mtime_ns}",
+                                   lambda: ({k: data[k] for k in ("minutes", "mode", "line")}, {}))
+                self.minutes, self.mode, self.line = table["minutes"], table["mode"], table["line"]
+            else:
+                self.minutes = data["minutes"].copy()
+                self.mode = data["mode"].copy()
+                self.line = data["line"].copy()
+            self.lines = [str(l) for l in data["lines"]]
+        self._line_codes = {l: k for k, l in enumerate(self.lines)}
+        self.dirty = False
+        return True
+
+    def _merge_disk(self) -> None:
+        """Incorpora las celdas que otro proceso haya guardado y aquí falten."""
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if data["minutes"].shape != self.minutes.shape:
+                    return
+                take = np.isnan(self.minutes) & ~np.isnan(data["minutes"])
+                if not take.any():
+                    return
+                # códigos de línea del fichero → códigos locales (-1 se queda en -1)
+                remap = np.asarray([self._line_code(str(l)) for l in data["lines"]] + [-1], dtype=np.int16)
+                self.minutes[take] = data["minutes"][take]
+                self.mode[take] = data["mode"][take]
+                self.line[take] = remap[data["line"][take]]
+        except (OSError, ValueError, KeyError):
+            return
+
+    def flush(self) -> None:
+        """Guarda la tabla en disco si hay celdas nuevas (escritura atómica).
+
+        Antes de escribir se fusiona con la copia en disco, de modo que varios
+        procesos (``src.batch``) que rellenan la misma tabla no se pisan.
+        """
+        if not self.dirty:
+            return
+        from src.shared_data import share_permissions
+
+        self._merge_disk()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".npz")
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, minutes=self.minutes, mode=self.mode, line=self.line,
+                     lines=np.asarray(self.lines, dtype=str))
+        share_permissions(tmp)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+class SparseTransitMatrix(TransitMatrix):
+    """Variante para catálogos de más de ``MAX_DENSE_POIS`` puntos: solo guarda las celdas calculadas.
+
+    La planificación por barrios (``poi_clusters``) consulta unos pocos miles
+    de pares por ruta, muy lejos de los n² de la tabla completa. Las celdas
+    se persisten igual, como listas de (origen, destino, modo, línea, minutos).
+    """
+
+    def _allocate(self, n: int) -> None:
+        self._cells: Dict[Tuple[int, int], Tuple[int, int, float]] = {}
+        self._disk_stamp = None  # (tamaño, mtime) del fichero la última vez que se leyó o escribió
+
+    def _stamp(self):
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _cell(self, i: int, j: int) -> Optional[Tuple[int, int, float]]:
+        return self._cells.get((int(i), int(j)))
+
+    def _set(self, i: int, j: int, mode: int, line: int, minutes: float) -> None:
+        self._cells[int(i), int(j)] = (int(mode), int(line), float(minutes))
+
+    def known_minutes(self, pos) -> np.ndarray:
+        rows = self.pos_to_row[np.asarray(pos)].tolist()
+        out = np.full((len(rows), len(rows)), np.nan, dtype=np.float32)
+        for a, i in enumerate(rows):
+            for b, j in enumerate(rows):
+                cell = self._cells.get((i, j))
+                if cell is not None:
+                    out[a, b] = cell[2]
+        return out
+
+    def fill_all(self) -> None:
+        raise ValueError(f"{len(self)} puntos: la tabla completa no cabe, se rellena bajo demanda")
+
+    def load(self) -> bool:
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if int(data["n"]) != len(self):
+                    return False
+                self.lines = [str(l) for l in data["lines"]]
+                self._cells = self._read(data, np.append(np.arange(len(self.lines)), -1).astype(np.int16))
+        except (OSError, ValueError, KeyError):
+            return False
+        self._line_codes = {l: k for k, l in enumerate(self.lines)}
+        self._disk_stamp = self._stamp()
+        self.dirty = False
+        return True
+
+    @staticmethod
+    def _read(data, remap) -> Dict[Tuple[int, int], Tuple[int, int, float]]:
+        """Celdas del fichero con los códigos de línea traducidos (``remap[-1]`` es -1: sin línea)."""
+        return {(i, j): (m, l, t) for i, j, m, l, t in zip(
+            data["i"].tolist(), data["j"].tolist(), data["mode"].tolist(),
+            remap[data["line"]].tolist(), data["minutes"].tolist())}
+
+    def _merge_disk(self) -> None:
+        if self._stamp() == self._disk_stamp:
+            return  # nadie más ha escrito desde la última vez
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if int(data["n"]) != len(self):
+                    return
+                remap = np.asarray([self._line_code(str(l)) for l in data["lines"]] + [-1], dtype=np.int16)
+                for key, cell in self._read(data, remap).items():
+                    self._cells.setdefault(key, cell)
+        except (OSError, ValueError, KeyError):
+            return
+
+    def flush(self) -> None:
+        if not self.dirty:
+            return
+        from src.shared_data import share_permissions
+
+        self._merge_disk()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        keys = np.asarray(list(self._cells), dtype=np.int32).reshape(-1, 2)
+        cells = list(self._cells.values())
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".npz")
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, n=len(self), i=keys[:, 0], j=keys[:, 1],
+                     mode=np.asarray([c[0] for c in cells], dtype=np.int8),
+                     line=np.asarray([c[1] for c in cells], dtype=np.int16),
+                     minutes=np.asarray([c[2] for c in cells], dtype=np.float32),
+                     lines=np.asarray(self.lines, dtype=str))
+        share_permissions(tmp)
+        os.replace(tmp, self.path)
+        self._disk_stamp = self._stamp()
+        self.dirty = False
+
+
+def transit_matrix(lat, lon, option: str, fingerprint: str, compute: LegFn) -> TransitMatrix:
+    """Tabla densa o, por encima de ``MAX_DENSE_POIS`` puntos, dispersa."""
+    cls = SparseTransitMatrix if len(lat) > MAX_DENSE_POIS else TransitMatrix
+    return cls(lat, lon, option, fingerprint, compute)
+
+
+def fingerprint(*arrays, params=()) -> str:
+    """Huella SHA-1 de los arrays de entrada y de los parámetros del modelo de tiempos."""
+    h = hashlib.sha1()
+    for arr in arrays:
+        h.update(np.ascontiguousarray(arr).tobytes())
+    h.update(repr(tuple(params)).encode())
+    return h.hexdigest()
+
+
+def main(argv=None) -> None:
+    from src.data_loader import load_monuments
+    from src.route_generator import get_transit_matrix
+
+    options = (argv if argv is not None else sys.argv[1:]) or TRANSPORT_OPTIONS
+    gdf = load_monuments()
+    for option in options:
+        tabla = get_transit_matrix(gdf, option)
+        if isinstance(tabla, SparseTransitMatrix):
+            print(f"{option}: {len(tabla)} puntos, la tabla se rellena bajo demanda")
+            continue
+        tabla.fill_all()
+        tabla.flush()
+        print(f"{option}: {len(tabla)}×{len(tabla)} tramos → {tabla.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+# src/transit_network.py
+"""Motor de transporte público con transbordos sobre un grafo de paradas precompilado.
+
+Las capas de bus y metro (``StopIndex`` + ``LineIndex``) se compilan una vez
+en arrays planos:
+
+* ``lat``, ``lon``       float64[n]  paradas de todas las capas (bus primero, luego metro)
+* ``stop_mode``          int8[n]     código de modo de cada parada (índice en ``MODES``)
+* ``line_ptr``           int32[L+1]  paradas de la línea l en ``line_stops[line_ptr[l]:line_ptr[l+1]]``
+* ``line_stops``         int32[·]    paradas de cada línea, en orden de recorrido
+* ``entry_line``         int32[·]    línea de cada entrada de ``line_stops``
+* ``ride_ptr``           int64[L+1]  matriz (n_l, n_l) de la línea l en ``ride_min[ride_ptr[l]:ride_ptr[l+1]]``
+* ``ride_min``           float32[·]  minutos a bordo entre cada par de paradas de la línea
+* ``transfer_from``, ``transfer_to``  int32[·]  transbordos a pie a menos de ``TRANSFER_RADIUS_M``
+* ``transfer_min``       float32[·]  minutos andando de cada transbordo
+
+Los GeoJSON no traen el orden de paso, así que cada línea se ordena como una
+cadena de vecinos más próximos desde su parada más extrema; el trayecto entre
+dos paradas de una línea es la distancia a lo largo de esa cadena, acotada
+entre la línea recta y ``LINE_DETOUR_MAX`` veces la línea recta.
+
+Las consultas siguen el esquema por rondas de RAPTOR: la ronda k mejora las
+llegadas con k viajes (k-1 transbordos), recorriendo solo las líneas que paran
+en paradas mejoradas en la ronda anterior y relajando después los
+transbordos a pie. El origen y el destino se conectan a varias paradas
+candidatas de cada capa, no solo a la más cercana.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.geo import haversine_many, haversine_matrix, haversine_pairwise
+
+MODES = ("bus", "metro")      # códigos de ``stop_mode`` y ``line_mode``
+MAX_TRANSFERS = 2             # hasta tres vehículos por trayecto
+ACCESS_RADIUS_M = 400.0       # a pie hasta/desde una parada
+ACCESS_K = 6                  # paradas candidatas por capa en el origen y el destino
+TRANSFER_RADIUS_M = 250.0     # transbordo a pie entre paradas cercanas
+TRANSFER_PENALTY_MIN = 5.0    # espera media por cada vehículo tras el primero
+LINE_DETOUR_MAX = 1.6         # tope del trayecto sobre la línea frente a la línea recta
+
+WalkFn = Callable[[float, float, np.ndarray, np.ndarray], np.ndarray]  # (lat, lon, lats, lons) → metros
+
+
+class Leg(NamedTuple):
+    mode: str
+    line: str
+    board: int      # parada de subida (índice en la red)
+    alight: int     # parada de bajada
+    minutes: float  # minutos a bordo (estimación estática)
+
+
+class Journey(NamedTuple):
+    minutes: float
+    legs: Tuple[Leg, ...]
+    access_min: float
+    egress_min: float
+
+    @property
+    def mode(self) -> str:
+        """Modo del primer vehículo ("bus" o "metro")."""
+        return self.legs[0].mode
+
+    @property
+    def line(self) -> str:
+        """Líneas del trayecto: "19", "19 → 70" o "19 → metro 3" si se cambia de modo."""
+        parts = [self.legs[0].line]
+        for leg in self.legs[1:]:
+            parts.append(leg.line if leg.mode == self.mode else f"{leg.mode} {leg.line}")
+        return " → ".join(parts)
+
+
+def _csr(groups: Sequence[Sequence[int]], dtype=np.int32) -> Tuple[np.ndarray, np.ndarray]:
+    ptr = np.zeros(len(groups) + 1, dtype=np.int32)
+    np.cumsum([len(g) for g in groups], out=ptr[1:])
+    flat = np.fromiter((v for g in groups for v in g), dtype=dtype, count=int(ptr[-1]))
+    return ptr, flat
+
+
+def _line_ride_minutes(lat: np.ndarray, lon: np.ndarray, tp_speed_kmh: float) -> np.ndarray:
+    """Matriz de minutos a bordo entre las paradas de una línea ya ordenada."""
+    step = haversine_pairwise(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    cum = np.concatenate([[0.0], np.cumsum(step)])
+    straight = haversine_matrix(lat, lon)
+    meters = np.clip(np.abs(cum[None, :] - cum[:, None]), straight, straight * LINE_DETOUR_MAX)
+    return meters / 1000 / tp_speed_kmh * 60
+
+
+def _chain_order(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Orden de vecino más próximo desde la parada más alejada del centroide."""
+    n = len(lat)
+    if n <= 2:
+        return np.arange(n)
+    dist = haversine_matrix(lat, lon)
+    current = int(np.argmax(haversine_many(lat.mean(), lon.mean(), lat, lon)))
+    order = [current]
+    free = np.ones(n, dtype=bool)
+    free[current] = False
+    for _ in range(n - 1):
+        row = np.where(free, dist[current], np.inf)
+        current = int(np.argmin(row))
+        order.append(current)
+        free[current] = False
+    return np.asarray(order)
+
+
+class TransitNetwork:
+    """Red de paradas y líneas de solo lectura con consultas por rondas."""
+
+    ARRAYS = ("lat", "lon", "stop_mode", "line_mode", "line_ptr", "line_stops", "entry_line",
+              "ride_ptr", "ride_min", "transfer_from", "transfer_to", "transfer_min")
+
+    def __init__(self, arrays: Dict[str, np.ndarray], line_names: Sequence[str],
+                 offsets: Dict[str, int], indexes: Dict[str, object], walk_speed_kmh: float):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.line_names = tuple(line_names)
+        self.offsets = offsets      # primera parada de cada capa en la red
+        self.indexes = indexes      # StopIndex por capa, para las paradas candidatas
+        self.walk_speed_kmh = float(walk_speed_kmh)
+        self.grid = None            # AccessGrid opcional con las paradas candidatas precalculadas
+
+    @property
+    def n_stops(self) -> int:
+        return len(self.lat)
+
+    @property
+    def n_lines(self) -> int:
+        return len(self.line_names)
+
+    # ------------------------
+    # Compilación
+    # ------------------------
+    @classmethod
+    def build(cls, layers: Dict[str, Tuple[object, object]], tp_speed_kmh: float,
+              walk_speed_kmh: float) -> "TransitNetwork":
+        """Compila las capas ``{modo: (StopIndex, LineIndex)}`` en arrays planos."""
+        from sklearn.neighbors import BallTree
+
+        from src.spatial_index import EARTH_RADIUS_M
+
+        lat_parts, lon_parts, mode_parts = [], [], []
+        line_names: List[str] = []
+        line_mode: List[int] = []
+        sequences: List[np.ndarray] = []
+        rides: List[np.ndarray] = []
+        offsets: Dict[str, int] = {}
+        indexes: Dict[str, object] = {}
+        offset = 0
+        for mode in MODES:
+            if mode not in layers:
+                continue
+            stops, lines = layers[mode]
+            offsets[mode], indexes[mode] = offset, stops
+            lat_parts.append(np.asarray(stops.lat, dtype=np.float64))
+            lon_parts.append(np.asarray(stops.lon, dtype=np.float64))
+            mode_parts.append(np.full(len(stops), MODES.index(mode), dtype=np.int8))
+            for name in sorted(lines.line_stops):
+                members = np.asarray(lines.line_stops[name])
+                order = members[_chain_order(stops.lat[members], stops.lon[members])]
+                line_names.append(name)
+                line_mode.append(MODES.index(mode))
+                sequences.append(order + offset)
+                rides.append(_line_ride_minutes(stops.lat[order], stops.lon[order], tp_speed_kmh).ravel())
+            offset += len(stops)
+
+        lat = np.concatenate(lat_parts) if lat_parts else np.empty(0)
+        lon = np.concatenate(lon_parts) if lon_parts else np.empty(0)
+        line_ptr, line_stops = _csr(sequences)
+        ride_ptr = np.zeros(len(rides) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in rides], out=ride_ptr[1:])
+
+        src, dst, minutes = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0)
+        if len(lat):
+            coords = np.radians(np.column_stack([lat, lon]))
+            idx, dist = BallTree(coords, metric="haversine").query_radius(
+                coords, r=TRANSFER_RADIUS_M / EARTH_RADIUS_M, return_distance=True)
+            src = np.repeat(np.arange(len(lat), dtype=np.int32), [len(i) for i in idx])
+            dst = np.concatenate(idx).astype(np.int32)
+            minutes = np.concatenate(dist) * EARTH_RADIUS_M / 1000 / walk_speed_kmh * 60
+            other = src != dst
+            src, dst, minutes = src[other], dst[other], minutes[other]
+
+        arrays = {
+            "lat": lat,
+            "lon": lon,
+            "stop_mode": np.concatenate(mode_parts) if mode_parts else np.empty(0, dtype=np.int8),
+            "line_mode": np.asarray(line_mode, dtype=np.int8),
+            "line_ptr": line_ptr,
+            "line_stops": line_stops,
+            "entry_line": np.repeat(np.arange(len(sequences), dtype=np.int32), np.diff(line_ptr)),
+            "ride_ptr": ride_ptr,
+            "ride_min": np.concatenate(rides).astype(np.float32) if rides else np.empty(0, dtype=np.float32),
+            "transfer_from": src,
+            "transfer_to": dst,
+            "transfer_min": minutes.astype(np.float32),
+        }
+        for arr in arrays.values():
+            arr.setflags(write=False)
+        return cls(arrays, line_names, offsets, indexes, walk_speed_kmh)
+
+    # ------------------------
+    # Consultas
+    # ------------------------
+    def candidate_stops(self, lat: float, lon: float, modes: Sequence[str], walk_m: Optional[WalkFn] = None,
+                        radius_m: float = ACCESS_RADIUS_M, k: int = ACCESS_K) -> Tuple[np.ndarray, np.ndarray]:
+        """(paradas, minutos a pie) de las ``k`` paradas más cercanas de cada capa en ``modes``.
+
+        Con la rejilla de accesibilidad (``self.grid``) y los parámetros por
+        defecto basta con leer la celda del punto; ``walk_m`` solo recalcula los
+        minutos de esas paradas. Sin ella, o fuera de la rejilla, se consulta el
+        índice de cada capa.
+        """
+        hit = None
+        if self.grid is not None and radius_m == ACCESS_RADIUS_M and k == ACCESS_K:
+            hit = self.grid.candidates(lat, lon, modes)
+        if hit is not None:
+            stops, mins = hit
+            if walk_m is not None and len(stops):
+                mins = np.asarray(walk_m(lat, lon, self.lat[stops], self.lon[stops]),
+                                  dtype=np.float64) / 1000 / self.walk_speed_kmh * 60
+            return stops, mins
+        walk_m = walk_m or haversine_many
+        stops, mins = [], []
+        for mode in modes:
+            index = self.indexes.get(mode)
+            if index is None:
+                continue
+            idx, _ = index.query_radius(lat, lon, radius_m)
+            idx = idx[:k]
+            if not len(idx):
+                continue
+            meters = walk_m(lat, lon, index.lat[idx], index.lon[idx])
+            stops.append(idx + self.offsets[mode])
+            mins.append(np.asarray(meters, dtype=np.float64) / 1000 / self.walk_speed_kmh * 60)
+        if not stops:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        return np.concatenate(stops), np.concatenate(mins)
+
+    def journey(self, origen: Tuple[float, float], destino: Tuple[float, float], modes: Sequence[str],
+                walk_m: Optional[WalkFn] = None, max_transfers: int = MAX_TRANSFERS) -> Optional[Journey]:
+        """Trayecto más rápido entre dos (lat, lon) con hasta ``max_transfers`` transbordos.
+
+        ``walk_m`` da los metros a pie desde un punto a muchas paradas (por
+        defecto, línea recta: los minutos de la rejilla de accesibilidad si la
+        hay; o la tabla de red). Devuelve None si no hay paradas
+        a mano en el origen o el destino, o si ninguna combinación llega.
+        """
+        acc_s, acc_t = self.candidate_stops(origen[0], origen[1], modes, walk_m)
+        egr_s, egr_t = self.candidate_stops(destino[0], destino[1], modes, walk_m)
+        if not len(acc_s) or not len(egr_s):
+            return None
+
+        n = self.n_stops
+        allowed_line = np.isin(self.line_mode, [MODES.index(m) for m in modes])
+        egress = np.full(n, np.inf)
+        np.minimum.at(egress, egr_s, egr_t)
+
+        best = np.full(n, np.inf)
+        np.minimum.at(best, acc_s, acc_t)
+        tau = best.copy()
+        marked = np.zeros(n, dtype=bool)
+        marked[acc_s] = True
+        ride_from: List[np.ndarray] = [None]   # ronda → parada de subida (−1 si no cambió)
+        ride_line: List[np.ndarray] = [None]
+        walk_from: List[np.ndarray] = [None]
+        target, target_round, target_stop = np.inf, -1, -1
+
+        for k in range(1, max_transfers + 2):
+            penalty = 0.0 if k == 1 else TRANSFER_PENALTY_MIN
+            r_from = np.full(n, -1, dtype=np.int32)
+            r_line = np.full(n, -1, dtype=np.int32)
+            w_from = np.full(n, -1, dtype=np.int32)
+            prev = tau.copy()
+            improved = np.zeros(n, dtype=bool)
+
+            # --- líneas que paran en alguna parada mejorada en la ronda anterior ---
+            for l in np.unique(self.entry_line[marked[self.line_stops]]):
+                if not allowed_line[l]:
+                    continue
+                seg = self.line_stops[self.line_ptr[l]:self.line_ptr[l + 1]]
+                board = np.flatnonzero(marked[seg])
+                ride = self.ride_min[self.ride_ptr[l]:self.ride_ptr[l + 1]].reshape(len(seg), len(seg))
+                arr = prev[seg[board]][:, None] + penalty + ride[board]
+                pick = arr.argmin(axis=0)
+                arrival = arr[pick, np.arange(len(seg))]
+                better = arrival < np.minimum(best[seg], target)
+                if better.any():
+                    hit = seg[better]
+                    tau[hit] = best[hit] = arrival[better]
+                    r_from[hit] = seg[board[pick[better]]]
+                    r_line[hit] = l
+                    improved[hit] = True
+
+            # --- transbordos a pie desde las paradas alcanzadas en vehículo ---
+            edges = np.flatnonzero(improved[self.transfer_from])
+            if len(edges):
+                src, dst = self.transfer_from[edges], self.transfer_to[edges]
+                t = tau[src] + self.transfer_min[edges]
+                ok = t < np.minimum(best[dst], target)
+                src, dst, t = src[ok], dst[ok], t[ok]
+                order = np.lexsort((t, dst))
+                first = order[np.r_[True, dst[order][1:] != dst[order][:-1]]] if len(order) else order
+                hit = dst[first]
+                tau[hit] = best[hit] = t[first]
+                w_from[hit] = src[first]
+                improved[hit] = True
+
+            ride_from.append(r_from)
+            ride_line.append(r_line)
+            walk_from.append(w_from)
+            total = np.where(improved, tau + egress, np.inf)
+            s_best = int(np.argmin(total))
+            if total[s_best] < target:
+                target, target_round, target_stop = float(total[s_best]), k, s_best
+            marked = improved
+            if not marked.any():
+                break
+
+        if target_round < 0:
+            return None
+        legs = self._legs(target_stop, target_round, ride_from, ride_line, walk_from)
+        start = legs[0].board
+        return Journey(target, tuple(legs), float(acc_t[acc_s == start].min()), float(egress[target_stop]))
+
+    def _legs(self, stop: int, k: int, ride_from, ride_line, walk_from) -> List[Leg]:
+        """Reconstruye los vehículos del trayecto que termina en ``stop`` en la ronda ``k``."""
+        legs: List[Leg] = []
+        while k > 0:
+            if walk_from[k][stop] >= 0:
+                stop = int(walk_from[k][stop])
+            board, line = int(ride_from[k][stop]), int(ride_line[k][stop])
+            seg = self.line_stops[self.line_ptr[line]:self.line_ptr[line + 1]]
+            i, j = int(np.flatnonzero(seg == board)[0]), int(np.flatnonzero(seg == stop)[0])
+            minutes = float(self.ride_min[self.ride_ptr[line] + i * len(seg) + j])
+            legs.append(Leg(MODES[self.line_mode[line]], self.line_names[line], board, stop, minutes))
+            stop = board
+            k -= 1
+            # la etiqueta de la parada de subida puede venir de una ronda anterior
+            while k > 0 and ride_from[k][stop] < 0 and walk_from[k][stop] < 0:
+                k -= 1
+        return legs[::-1]
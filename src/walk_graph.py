@@ -0,0 +1,166 @@
+# src/walk_graph.py
+"""Red peatonal en formato CSR binario para arranques rápidos.
+
+``data/walk_graph.graphml`` se convierte una sola vez en un directorio de
+arrays NumPy (``.npy``) que se abren con ``mmap_mode="r"``: la carga es
+prácticamente instantánea, no crea objetos Python por nodo o arista y varios
+procesos comparten las mismas páginas de memoria del sistema operativo.
+
+Arrays (n nodos, m aristas dirigidas):
+
+* ``node_ids``  int64[n]   identificador OSM de cada nodo
+* ``x``, ``y``  float64[n] lon/lat
+* ``indptr``    int64[n+1] aristas del nodo i en ``indices[indptr[i]:indptr[i+1]]``
+* ``indices``   int32[m]   nodo destino
+* ``lengths``   float32[m] longitud en metros (la menor si hay aristas paralelas)
+
+Uso offline::
+
+    python -m src.walk_graph                       # data/walk_graph.graphml → data/walk_graph_csr/
+    python -m src.walk_graph ruta.graphml destino/
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).parent.parent
+GRAPHML_PATH = ROOT_DIR / "data" / "walk_graph.graphml"
+CSR_DIR = ROOT_DIR / "data" / "walk_graph_csr"
+
+ARRAYS = ("node_ids", "x", "y", "indptr", "indices", "lengths")
+FORMAT_VERSION = 1
+
+
+class CSRGraph:
+    """Grafo peatonal dirigido de solo lectura en arrays CSR."""
+
+    def __init__(self, node_ids, x, y, indptr, indices, lengths):
+        self.node_ids = node_ids
+        self.x = x
+        self.y = y
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+        self._node_pos = None
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    def node_pos(self, node_id: int) -> int:
+        """Posición interna de un identificador OSM."""
+        if self._node_pos is None:
+            self._node_pos = {int(n): k for k, n in enumerate(self.node_ids)}
+        return self._node_pos[int(node_id)]
+
+    def neighbors(self, pos: int):
+        """(destinos, longitudes) de las aristas que salen de ``pos``."""
+        a, b = self.indptr[pos], self.indptr[pos + 1]
+        return self.indices[a:b], self.lengths[a:b]
+
+    def to_scipy(self):
+        """Matriz dispersa (n, n) de longitudes para ``scipy.sparse.csgraph``."""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.lengths, self.indices, self.indptr), shape=(self.n_nodes, self.n_nodes))
+
+    @classmethod
+    def from_networkx(cls, G) -> "CSRGraph":
+        """Convierte un ``MultiDiGraph`` de osmnx (atributos x, y y length)."""
+        node_ids = np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes())
+        pos = {n: k for k, n in enumerate(node_ids.tolist())}
+        x = np.fromiter((G.nodes[n]["x"] for n in node_ids.tolist()), dtype=np.float64, count=len(node_ids))
+        y = np.fromiter((G.nodes[n]["y"] for n in node_ids.tolist()), dtype=np.float64, count=len(node_ids))
+
+        best: dict = {}
+        for u, v, data in G.edges(data=True):
+            key = (pos[u], pos[v])
+            length = float(data.get("length", 0.0))
+            if key not in best or length < best[key]:
+                best[key] = length
+        if best:
+            src, dst = np.asarray(list(best.keys()), dtype=np.int64).T
+            lengths = np.fromiter(best.values(), dtype=np.float32, count=len(best))
+        else:
+            src = dst = np.empty(0, dtype=np.int64)
+            lengths = np.empty(0, dtype=np.float32)
+        order = np.lexsort((dst, src))
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(node_ids)), out=indptr[1:])
+        return cls(node_ids, x, y, indptr, dst[order].astype(np.int32), lengths[order])
+
+    def save(self, directory, source: Optional[Path] = None) -> None:
+        """Escribe los arrays y un ``meta.json`` con la huella del GraphML de origen."""
+        from src.shared_data import save_arrays
+
+        meta = {"version": FORMAT_VERSION, "n_nodes": self.n_nodes, "n_edges": self.n_edges}
+        if source is not None:
+            stat = Path(source).stat()
+            meta["source"] = {"path": str(source), "size": stat.st_size, "mtime": stat.st_mtime}
+        save_arrays(directory, {name: getattr(self, name) for name in ARRAYS}, meta)
+
+    @classmethod
+    def load(cls, directory=CSR_DIR, mmap: bool = True) -> "CSRGraph":
+        """Abre el grafo; con ``mmap`` los arrays se proyectan en memoria sin copiarse."""
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        return cls(*(np.load(directory / f"{name}.npy", mmap_mode=mode) for name in ARRAYS))
+
+
+def is_fresh(directory=CSR_DIR, source=GRAPHML_PATH) -> bool:
+    """True si existe el CSR y corresponde al GraphML actual (o no hay GraphML)."""
+    directory, source = Path(directory), Path(source)
+    try:
+        with open(directory / "meta.json") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return False
+    if meta.get("version") != FORMAT_VERSION:
+        return False
+    if not source.exists():
+        return True
+    stat = source.stat()
+    src = meta.get("source", {})
+    return src.get("size") == stat.st_size and src.get("mtime") == stat.st_mtime
+
+
+def convert_graphml(source=GRAPHML_PATH, directory=CSR_DIR) -> CSRGraph:
+    """Lee el GraphML con osmnx (lento, solo aquí) y guarda la versión CSR."""
+    import osmnx as ox
+
+    graph = CSRGraph.from_networkx(ox.load_graphml(source))
+    graph.save(directory, source=Path(source))
+    return graph
+
+
+def load_walk_csr(directory=CSR_DIR, source=GRAPHML_PATH) -> CSRGraph:
+    """Grafo CSR listo para usar: lo regenera desde el GraphML si falta o está obsoleto."""
+    if not is_fresh(directory, source):
+        from src.shared_data import build_lock
+
+        with build_lock(Path(directory)):  # un solo proceso convierte el GraphML
+            if not is_fresh(directory, source):
+                convert_graphml(source, directory)
+    return CSRGraph.load(directory)
+
+
+def main(argv=None) -> None:
+    argv = argv if argv is not None else sys.argv[1:]
+    source = Path(argv[0]) if argv else GRAPHML_PATH
+    directory = Path(argv[1]) if len(argv) > 1 else CSR_DIR
+    graph = convert_graphml(source, directory)
+    print(f"{graph.n_nodes} nodos, {graph.n_edges} aristas → {directory}")
+
+
+if __name__ == "__main__":
+    main()
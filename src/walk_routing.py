@@ -0,0 +1,221 @@
+# src/walk_routing.py
+"""Caminos a pie por la red de calles sobre el grafo CSR.
+
+``WalkRouter`` ajusta cada punto a su nodo más cercano (por la celda de la
+rejilla de accesibilidad o con un KD-tree, una sola vez por coordenada), guarda los caminos y longitudes ya calculados entre
+nodos y resuelve todos los tramos de un itinerario agrupándolos por origen:
+cada origen distinto lanza un único Dijkstra uno-a-muchos (acotado por
+distancia cuando es posible), así que el tramo desde el alojamiento y los
+tramos repetidos entre monumentos no vuelven a calcularse. Los monumentos se
+pueden ajustar todos de antemano con ``snap_many``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from src.geo import EARTH_RADIUS_M, haversine_many
+from src.profiling import timed
+from src.shared_data import get_shared
+from src.walk_graph import CSRGraph
+
+PATH_CACHE_SIZE = 20000      # caminos nodo→nodo guardados en memoria
+SEARCH_DETOUR = 2.0          # el Dijkstra acotado explora hasta 2× la distancia en línea recta
+SEARCH_MARGIN_M = 1000.0
+
+Coord = Tuple[float, float]  # (lon, lat), como los segmentos de pydeck
+
+
+def _graph_fingerprint(graph: CSRGraph) -> str:
+    h = hashlib.sha1()
+    for arr in (graph.indptr, graph.indices, graph.lengths):
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+
+class WalkRouter:
+    """Enrutador peatonal de solo lectura sobre un ``CSRGraph``."""
+
+    def __init__(self, graph: CSRGraph):
+        self.graph = graph
+        self._lat0 = float(np.radians(np.mean(graph.y))) if graph.n_nodes else 0.0
+        self._tree = cKDTree(self._project(np.asarray(graph.x), np.asarray(graph.y)))
+        self._matrix = graph.to_scipy()
+        reverse = get_shared("walk_reverse", _graph_fingerprint(graph), self._reverse)
+        self._matrix_t = csr_matrix((reverse["lengths"], reverse["indices"], reverse["indptr"]),
+                                    shape=self._matrix.shape)  # para Dijkstra "hacia" un nodo
+        # osmnx genera las redes peatonales en doble sentido: si es así, el camino
+        # de vuelta es el de ida invertido
+        self.symmetric = bool(reverse.meta["symmetric"])
+        self._paths: "OrderedDict[Tuple[int, int], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._snaps: Dict[Coord, int] = {}
+        self._lock = threading.Lock()
+        self.grid = None  # AccessGrid opcional: ajuste de puntos nuevos por celda, sin KD-tree
+
+    def _reverse(self):
+        """Grafo traspuesto en CSR (compartido entre procesos) y si coincide con el original."""
+        t = self._matrix.T.tocsr()
+        symmetric = (abs(self._matrix - t)).nnz == 0
+        return {"indptr": t.indptr, "indices": t.indices, "lengths": t.data}, {"symmetric": bool(symmetric)}
+
+    def _project(self, lon, lat) -> np.ndarray:
+        """Proyección equirectangular local en metros (suficiente a escala de ciudad)."""
+        lon, lat = np.radians(lon), np.radians(lat)
+        return np.column_stack([lon * np.cos(self._lat0), lat]) * EARTH_RADIUS_M
+
+    # ------------------------
+    # Ajuste a nodos
+    # ------------------------
+    def snap(self, coord: Coord) -> int:
+        """Nodo (posición interna) más cercano a (lon, lat); ver ``snap_many``."""
+        return int(self.snap_many([coord])[0])
+
+    def snap_many(self, coords: Sequence[Coord]) -> np.ndarray:
+        """Nodos de muchas coordenadas, memorizados; la única regla de ajuste del enrutador.
+
+        ``path``, ``length`` y ``route_legs`` pasan todos por aquí, así que un
+        mismo punto sale siempre del mismo nodo. Con ``grid`` cada punto toma
+        el nodo precalculado de su celda de la rejilla de accesibilidad; los que
+        caen fuera (o sin rejilla) se resuelven en una sola consulta al KD-tree.
+        """
+        coords = [(float(c[0]), float(c[1])) for c in coords]
+        nodes = np.empty(len(coords), dtype=np.intp)
+        missing = []
+        for i, key in enumerate(coords):
+            node = self._snaps.get(key)
+            if node is None and self.grid is not None:
+                node = self.grid.node_at(key[1], key[0])
+                if not 0 <= node < self.graph.n_nodes:
+                    node = None
+            if node is None:
+                missing.append(i)
+            else:
+                nodes[i] = self._snaps[key] = node
+        if missing:
+            lon, lat = np.asarray([coords[i] for i in missing]).T
+            _, found = self._tree.query(self._project(lon, lat))
+            for i, node in zip(missing, found.tolist()):
+                nodes[i] = self._snaps[coords[i]] = node
+        return nodes
+
+    # ------------------------
+    # Caminos
+    # ------------------------
+    def _cache_get(self, key):
+        with self._lock:
+            hit = self._paths.get(key)
+            if hit is not None:
+                self._paths.move_to_end(key)
+            return hit
+
+    def _cache_put(self, key, value) -> None:
+        with self._lock:
+            self._paths[key] = value
+            self._paths.move_to_end(key)
+            while len(self._paths) > PATH_CACHE_SIZE:
+                self._paths.popitem(last=False)
+
+    def _solve_from(self, source: int, targets: Sequence[int]) -> None:
+        """Un Dijkstra desde ``source`` que deja en caché el camino a cada destino."""
+        g = self.graph
+        straight = haversine_many(g.y[source], g.x[source], g.y[list(targets)], g.x[list(targets)])
+        limit = float(straight.max()) * SEARCH_DETOUR + SEARCH_MARGIN_M
+        dist, pred = dijkstra(self._matrix, indices=source, limit=limit, return_predecessors=True)
+        if any(np.isinf(dist[t]) for t in targets):
+            dist, pred = dijkstra(self._matrix, indices=source, return_predecessors=True)
+        for t in targets:
+            if np.isinf(dist[t]):
+                self._cache_put((source, t), (float("inf"), np.asarray([source, t], dtype=np.int32)))
+                continue
+            nodes = [t]
+            while nodes[-1] != source:
+                nodes.append(int(pred[nodes[-1]]))
+            self._cache_put((source, t), (float(dist[t]), np.asarray(nodes[::-1], dtype=np.int32)))
+
+    def _solve_to(self, target: int, sources: Sequence[int]) -> None:
+        """Un Dijkstra sobre el grafo traspuesto que deja en caché los caminos hacia ``target``."""
+        dist, pred = dijkstra(self._matrix_t, indices=target, return_predecessors=True)
+        for s in sources:
+            if np.isinf(dist[s]):
+                self._cache_put((s, target), (float("inf"), np.asarray([s, target], dtype=np.int32)))
+                continue
+            nodes = [s]
+            while nodes[-1] != target:
+                nodes.append(int(pred[nodes[-1]]))
+            self._cache_put((s, target), (float(dist[s]), np.asarray(nodes, dtype=np.int32)))
+
+    def node_path(self, source: int, target: int) -> Tuple[float, np.ndarray]:
+        """(longitud en metros, nodos) del camino más corto entre dos nodos."""
+        if source == target:
+            return 0.0, np.asarray([source], dtype=np.int32)
+        hit = self._cache_get((source, target))
+        if hit is None:
+            self._solve_from(source, [target])
+            hit = self._cache_get((source, target))
+        return hit
+
+    def _as_coords(self, nodes: np.ndarray) -> List[List[float]]:
+        g = self.graph
+        return np.column_stack([g.x[nodes], g.y[nodes]]).tolist()
+
+    @timed("caminos.tramo")
+    def path(self, coord1: Coord, coord2: Coord) -> List[List[float]]:
+        """Lista [[lon, lat], …] que sigue la calle a pie entre dos puntos."""
+        length, nodes = self.node_path(self.snap(coord1), self.snap(coord2))
+        if np.isinf(length):
+            return [list(coord1), list(coord2)]  # sin conexión en la red: línea recta
+        return self._as_coords(nodes)
+
+    def length(self, coord1: Coord, coord2: Coord) -> float:
+        """Metros por la red entre dos puntos (inf si no hay camino)."""
+        return self.node_path(self.snap(coord1), self.snap(coord2))[0]
+
+    @timed("caminos.itinerario")
+    def route_legs(self, coords: Sequence[Coord]) -> List[List[List[float]]]:
+        """Caminos de todos los tramos consecutivos de ``coords``.
+
+        Ajusta todas las coordenadas de una vez y lanza un único Dijkstra por
+        cada origen que tenga tramos aún no calculados. Un nodo que aparece
+        varias veces (el alojamiento, al salir y al volver) resuelve con su
+        propio árbol tanto los tramos que salen como los que llegan a él.
+        """
+        if len(coords) < 2:
+            return []
+        nodes = self.snap_many(coords).tolist()
+        hubs = {n for n, c in Counter(nodes).items() if c > 1}
+        forward: Dict[int, set] = {}
+        inbound: Dict[int, set] = {}
+        for s, t in zip(nodes[:-1], nodes[1:]):
+            if s == t or self._cache_get((s, t)) is not None:
+                continue
+            if t in hubs and s not in hubs:
+                inbound.setdefault(t, set()).add(s)
+            else:
+                forward.setdefault(s, set()).add(t)
+
+        for s, targets in forward.items():
+            if self.symmetric and s in inbound:
+                # red de doble sentido: el mismo árbol sirve para ir y para volver
+                back = inbound.pop(s)
+                self._solve_from(s, sorted(targets | back))
+                for u in back:
+                    length, path = self._cache_get((s, u))
+                    self._cache_put((u, s), (length, path[::-1].copy()))
+            else:
+                self._solve_from(s, sorted(targets))
+        for t, sources in inbound.items():
+            self._solve_to(t, sorted(sources))
+
+        legs = []
+        for (c1, c2), s, t in zip(zip(coords[:-1], coords[1:]), nodes[:-1], nodes[1:]):
+            length, path = self.node_path(s, t)
+            legs.append([list(c1), list(c2)] if np.isinf(length) else self._as_coords(path))
+        return legs
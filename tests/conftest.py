@@ -0,0 +1,87 @@
+# tests/conftest.py
+"""Entorno común de las pruebas: datos sintéticos y ninguna red.
+
+Las rutas de ``src`` (``data/processed``, horarios GTFS, callejero) se fijan
+al importar los módulos, así que las variables de entorno se definen aquí,
+antes de que ninguna prueba importe ``src``. Los datos son los de
+``benchmarks.synthetic`` a escala pequeña y todo lo derivado se escribe en
+un directorio temporal de la sesión.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+_SESSION_DIR = Path(tempfile.mkdtemp(prefix="valencia-tests-"))
+os.environ["VALENCIA_DATA_DIR"] = str(_SESSION_DIR / "raw")
+os.environ["VALENCIA_GTFS_DIR"] = str(_SESSION_DIR / "gtfs")        # vacío: sin horarios
+os.environ["VALENCIA_GAZETTEER"] = str(_SESSION_DIR / "gazetteer.csv")
+os.environ["VALENCIA_GEOCODE_OFFLINE"] = "1"
+os.environ.pop("VALENCIA_ROUTE_CACHE_DIR", None)
+os.environ.pop("VALENCIA_ROUTING_URL", None)
+
+from benchmarks import synthetic  # noqa: E402
+
+N_MONUMENTS = 40
+N_STOPS = 400
+synthetic.generate(_SESSION_DIR / "raw", N_MONUMENTS, N_STOPS, seed=0)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_SESSION_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def monumentos():
+    """Los monumentos sintéticos de la sesión (GeoDataFrame)."""
+    from src.data_loader import load_monuments
+
+    return load_monuments()
+
+
+@pytest.fixture
+def make_points():
+    """Construye un GeoDataFrame de puntos EPSG:4326 a partir de listas."""
+    import geopandas as gpd
+
+    def make(lats, lons, **columns):
+        return gpd.GeoDataFrame(columns, geometry=gpd.points_from_xy(lons, lats), crs="EPSG:4326")
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def grid_graph():
+    """Red peatonal de juguete: cuadrícula de 6×6 calles cada ~110 m, en ambos sentidos.
+
+    Como en osmnx, es un ``MultiDiGraph`` con ``x``/``y`` en los nodos y
+    ``length`` en las aristas; hay una arista paralela más larga para
+    comprobar que se queda la más corta.
+    """
+    import networkx as nx
+
+    from src.geo import haversine_many
+
+    G = nx.MultiDiGraph(crs="EPSG:4326")
+    lat0, lon0, step = 39.4700, -0.3800, 0.001
+    for r in range(6):
+        for c in range(6):
+            G.add_node(1000 + r * 6 + c, x=lon0 + c * step * 1.3, y=lat0 + r * step)
+    for r in range(6):
+        for c in range(6):
+            u = 1000 + r * 6 + c
+            for v in ((u + 1) if c < 5 else None, (u + 6) if r < 5 else None):
+                if v is None:
+                    continue
+                d = float(haversine_many(G.nodes[u]["y"], G.nodes[u]["x"], [G.nodes[v]["y"]], [G.nodes[v]["x"]])[0])
+                G.add_edge(u, v, length=d)
+                G.add_edge(v, u, length=d)
+    G.add_edge(1000, 1001, length=999.0)
+    return G
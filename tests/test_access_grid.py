@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from src import access_grid as ag
+from src.access_grid import AccessGrid, get_access_grid
+from src.spatial_index import LineIndex, StopIndex
+from src.transit_network import TransitNetwork
+from src.walk_graph import CSRGraph
+from src.walk_routing import WalkRouter
+
+# una línea de bus que cruza la cuadrícula peatonal y un metro en su extremo
+BUS = [(39.4705, -0.3795, "1"), (39.4720, -0.3780, "1"), (39.4735, -0.3765, "1"), (39.4748, -0.3740, "1")]
+METRO = [(39.4702, -0.3798, "9"), (39.4760, -0.3700, "9")]
+PUNTOS = [(39.4701, -0.3799), (39.4726, -0.3771), (39.4744, -0.3752), (39.4712, -0.3760)]
+
+
+@pytest.fixture
+def red(make_points):
+    def layer(rows, column):
+        gdf = make_points([r[0] for r in rows], [r[1] for r in rows], **{column: [r[2] for r in rows]})
+        stops = StopIndex(gdf)
+        return stops, LineIndex(stops, column)
+
+    return TransitNetwork.build({"bus": layer(BUS, "lineas"), "metro": layer(METRO, "linea")},
+                                tp_speed_kmh=30.0, walk_speed_kmh=4.0)
+
+
+@pytest.fixture
+def graph(grid_graph):
+    return CSRGraph.from_networkx(grid_graph)
+
+
+def test_candidates_match_the_spatial_index(red, graph):
+    grid = AccessGrid.build(red, graph)
+    # medir desde el centro de la celda cambia como mucho ~35 m, medio minuto a 4 km/h
+    tolerance = 40 / 1000 / 4.0 * 60
+    for lat, lon in PUNTOS:
+        stops, minutes = grid.candidates(lat, lon, ("bus", "metro"))
+        ref_stops, ref_minutes = red.candidate_stops(lat, lon, ("bus", "metro"))
+        assert sorted(stops) == sorted(ref_stops)
+        ref = dict(zip(ref_stops, ref_minutes))
+        for stop, mins in zip(stops, minutes):
+            assert mins == pytest.approx(ref[stop], abs=tolerance)
+
+
+def test_candidates_per_mode(red, graph):
+    grid = AccessGrid.build(red, graph)
+    stops, _ = grid.candidates(*PUNTOS[0], ("metro",))
+    assert len(stops) and (red.stop_mode[stops] == 1).all()
+    assert len(grid.candidates(*PUNTOS[0], ())[0]) == 0
+
+
+def test_node_is_the_router_snap_of_the_cell_centre(red, graph):
+    grid = AccessGrid.build(red, graph)
+    router = WalkRouter(graph)
+    for lat, lon in PUNTOS:
+        r, c = grid.cell(lat, lon)
+        centre = (grid.lon0 + (c + 0.5) * grid.dlon, grid.lat0 + (r + 0.5) * grid.dlat)
+        assert grid.node_at(lat, lon) == router.snap(centre)
+
+
+def test_outside_the_grid(red):
+    grid = AccessGrid.build(red)  # sin grafo: nodo -1 en todas las celdas
+    assert grid.node_at(*PUNTOS[1]) == -1
+    assert grid.cell(40.5, -0.37) is None
+    assert grid.candidates(40.5, -0.37, ("bus",)) is None
+    assert grid.node_at(40.5, -0.37) == -1
+
+
+def test_network_uses_the_grid_with_the_same_result(red, graph):
+    origen, destino = PUNTOS[0], PUNTOS[2]
+    without = red.journey(origen, destino, ("bus", "metro"))
+    red.grid = AccessGrid.build(red, graph)
+    with_grid = red.journey(origen, destino, ("bus", "metro"))
+    assert [(leg.mode, leg.line, leg.board, leg.alight) for leg in with_grid.legs] == \
+        [(leg.mode, leg.line, leg.board, leg.alight) for leg in without.legs]
+    assert with_grid.minutes == pytest.approx(without.minutes, abs=1.0)
+
+
+def test_save_and_load_with_fingerprint(red, graph, tmp_path):
+    grid = AccessGrid.build(red, graph, fingerprint="v1")
+    grid.save(tmp_path / "grid")
+    loaded = AccessGrid.load(tmp_path / "grid", "v1")
+    assert isinstance(loaded.stops, np.memmap)
+    assert loaded.shape == grid.shape and loaded.k == grid.k
+    for name in ag.ARRAYS:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(grid, name))
+    assert loaded.candidates(*PUNTOS[1], ("bus",))[0].tolist() == grid.candidates(*PUNTOS[1], ("bus",))[0].tolist()
+    assert AccessGrid.load(tmp_path / "grid", "v2") is None
+    assert AccessGrid.load(tmp_path / "nada") is None
+
+
+def test_get_access_grid_builds_once(red, tmp_path, monkeypatch):
+    built = []
+    build = AccessGrid.build.__func__
+
+    def counting(cls, *args, **kwargs):
+        built.append(kwargs.get("fingerprint"))
+        return build(cls, *args, **kwargs)
+
+    monkeypatch.setattr(AccessGrid, "build", classmethod(counting))
+    first = get_access_grid(red, "fp", tmp_path / "grid")
+    second = get_access_grid(red, "fp", tmp_path / "grid")
+    assert built == ["fp"]
+    assert isinstance(second.stops, np.memmap)
+    np.testing.assert_array_equal(second.minutes, first.minutes)
+    get_access_grid(red, "otra", tmp_path / "grid")
+    assert built == ["fp", "otra"]
@@ -0,0 +1,38 @@
+import datetime as dt
+import itertools
+
+from src import batch
+from src.route_generator import generar_ruta
+
+
+def _peticion(k: int) -> dict:
+    return {"id": f"p{k}", "start": [39.4699 + k * 0.002, -0.3763], "inicio": "09:00", "fin": "12:00",
+            "transporte": "ninguno"}
+
+
+def test_results_in_order_with_errors_inline(monumentos):
+    peticiones = [_peticion(0), ["no", "es", "un", "objeto"], _peticion(1),
+                  {"id": "sin-direccion", "direccion": "Calle Inventada 1"},
+                  dict(_peticion(2), engine="ils")]
+    resultados = list(batch.generar_rutas_batch(peticiones, workers=1))
+
+    assert [r["id"] for r in resultados] == ["p0", None, "p1", "sin-direccion", "p2"]
+    assert [("error" in r) for r in resultados] == [False, True, False, True, True]
+    esperado = generar_ruta(monumentos, (39.4699, -0.3763), dt.time(9), dt.time(12), [], [], "ninguno")
+    assert resultados[0]["itinerario"] == esperado
+
+
+def test_pool_reads_input_in_bounded_windows():
+    leidas = []
+
+    def infinitas():
+        for k in itertools.count():
+            leidas.append(k)
+            yield _peticion(k % 5)
+
+    workers, chunksize = 2, 2
+    primeros = list(itertools.islice(batch.generar_rutas_batch(infinitas(), workers=workers, chunksize=chunksize), 3))
+    assert [r["id"] for r in primeros] == ["p0", "p1", "p2"]
+    assert all("itinerario" in r for r in primeros)
+    # como mucho la ventana llena más un envío (el que se repone tras entregar el primero)
+    assert len(leidas) <= (workers * batch.BATCH_PENDING + 1) * chunksize + 1
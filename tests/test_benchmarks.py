@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+
+from benchmarks import run, synthetic
+
+
+def test_synthetic_data_is_deterministic_and_inside_valencia(tmp_path):
+    a = synthetic.generate(tmp_path / "a", 60, 300, seed=3)
+    b = synthetic.generate(tmp_path / "b", 60, 300, seed=3)
+    c = synthetic.generate(tmp_path / "c", 60, 300, seed=4)
+    for name in ("monuments", "buses", "metro", "fonts"):
+        assert (a / f"{name}.geojson").read_bytes() == (b / f"{name}.geojson").read_bytes()
+    assert (a / "buses.geojson").read_bytes() != (c / "buses.geojson").read_bytes()
+
+    features = json.loads((a / "buses.geojson").read_text())["features"]
+    lon, lat = np.asarray([f["geometry"]["coordinates"] for f in features]).T
+    assert len(features) == 300
+    assert synthetic.BBOX["lat"][0] <= lat.min() and lat.max() <= synthetic.BBOX["lat"][1]
+    assert synthetic.BBOX["lon"][0] <= lon.min() and lon.max() <= synthetic.BBOX["lon"][1]
+    assert any("," in f["properties"]["lineas"] for f in features)  # hay paradas compartidas
+
+
+def test_compare_flags_only_regressions():
+    base = {"results": [{"scenario": "xs", "nearest_stop": {"p50_ms": 1.0, "p90_ms": 2.0},
+                         "generar_ruta": {"4h": {"first_ms": 100.0, "p50_ms": 10.0}}}]}
+    now = [{"scenario": "xs", "nearest_stop": {"p50_ms": 1.2, "p90_ms": 2.0},
+            "generar_ruta": {"4h": {"first_ms": 50.0, "p50_ms": 20.0}}},
+           {"scenario": "m", "error": "sin memoria"}]
+    assert run.compare(now, base) == ["xs: generar_ruta.4h.p50_ms 10.00 → 20.00 (×2.00)"]
+
+
+def test_percentiles_in_milliseconds():
+    p = run._percentiles([0.001, 0.002, 0.003, 0.004])
+    assert p["max_ms"] == 4.0
+    assert 2.0 <= p["p50_ms"] <= 3.0
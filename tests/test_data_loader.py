@@ -0,0 +1,63 @@
+import os
+import shutil
+
+import geopandas as gpd
+import pytest
+
+from src.data_loader import DatasetRegistry
+
+
+@pytest.fixture
+def raw_dir(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    shutil.copy(os.path.join(os.environ["VALENCIA_DATA_DIR"], "metro.geojson"), raw)
+    return raw
+
+
+def _no_geojson(*args, **kwargs):
+    raise AssertionError("debería leerse el Parquet")
+
+
+def test_second_process_reads_parquet(raw_dir, tmp_path, monkeypatch):
+    first = DatasetRegistry(raw_dir, tmp_path / "datasets").get("metro")
+    assert (tmp_path / "datasets" / "metro.parquet").exists()
+
+    monkeypatch.setattr(gpd, "read_file", _no_geojson)
+    second = DatasetRegistry(raw_dir, tmp_path / "datasets").get("metro")
+    assert list(second.columns) == list(first.columns)
+    assert second.geometry.equals(first.geometry)
+    assert {"lat", "lon"} <= set(second.columns)
+
+
+def test_touched_source_keeps_parquet_but_edited_source_does_not(raw_dir, tmp_path, monkeypatch):
+    DatasetRegistry(raw_dir, tmp_path / "datasets").get("metro")
+    source = raw_dir / "metro.geojson"
+    os.utime(source, (1, 1))  # mismo contenido, otra fecha (un checkout)
+    with monkeypatch.context() as m:
+        m.setattr(gpd, "read_file", _no_geojson)
+        DatasetRegistry(raw_dir, tmp_path / "datasets").get("metro")
+
+    text = source.read_text()
+    source.write_text(text.replace('"features": [', '"features": [ ', 1))
+    calls = []
+    read_file = gpd.read_file
+    monkeypatch.setattr(gpd, "read_file", lambda *a, **k: calls.append(a) or read_file(*a, **k))
+    DatasetRegistry(raw_dir, tmp_path / "datasets").get("metro")
+    assert calls
+
+
+def test_unwritable_cache_falls_back_to_geojson(raw_dir, tmp_path):
+    blocker = tmp_path / "datasets"
+    blocker.write_text("no es un directorio")
+    gdf = DatasetRegistry(raw_dir, blocker).get("metro")
+    assert len(gdf) > 0
+
+
+def test_get_returns_independent_copies(raw_dir, tmp_path):
+    registry = DatasetRegistry(raw_dir, tmp_path / "datasets")
+    gdf = registry.get("metro")
+    gdf["tooltip"] = "x"
+    assert "tooltip" not in registry.get("metro").columns
+    with pytest.raises(KeyError):
+        registry.get("tranvia")
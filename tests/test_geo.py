@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from src.geo import PairDistances, haversine_many, haversine_matrix, haversine_pairwise
+from src.route_generator import haversine_distance
+
+rng = np.random.default_rng(1)
+LATS = rng.uniform(39.42, 39.51, 25)
+LONS = rng.uniform(-0.43, -0.32, 25)
+
+
+def test_vector_kernels_match_scalar_haversine():
+    expected = np.array([[haversine_distance(a, b, c, d) for c, d in zip(LATS, LONS)]
+                         for a, b in zip(LATS, LONS)])
+    np.testing.assert_allclose(haversine_matrix(LATS, LONS), expected, rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(haversine_many(LATS[3], LONS[3], LATS, LONS), expected[3], rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(haversine_pairwise(LATS, LONS, LATS[::-1], LONS[::-1]),
+                               expected[np.arange(25), np.arange(25)[::-1]], rtol=1e-9, atol=1e-6)
+
+
+def test_pair_distances_matches_dense_matrix():
+    dense = haversine_matrix(LATS, LONS)
+    lazy = PairDistances(LATS, LONS)
+    rows = np.array([4, 0, 17])
+    assert lazy.shape == dense.shape
+    np.testing.assert_allclose(lazy[2, rows], dense[2, rows])
+    np.testing.assert_allclose(lazy[np.ix_(rows, rows)], dense[np.ix_(rows, rows)])
+    np.testing.assert_allclose(lazy.take(rows)[np.ix_([0, 1, 2], [2, 1])], dense[np.ix_(rows, rows[[2, 1]])])
+
+
+def test_monument_matrix_built_once_and_read_only(monumentos):
+    from src.data_loader import monument_distance_matrix
+
+    matrix = monument_distance_matrix(monumentos)
+    assert monument_distance_matrix(monumentos) is matrix
+    lat, lon = monumentos.geometry.y.to_numpy(), monumentos.geometry.x.to_numpy()
+    np.testing.assert_allclose(matrix[5], haversine_many(lat[5], lon[5], lat, lon))
+    with pytest.raises(ValueError):
+        matrix[0, 1] = 0.0
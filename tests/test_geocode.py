@@ -0,0 +1,97 @@
+import json
+import os
+import time
+
+import pytest
+
+from src import geocode
+from src.geocode import Gazetteer, GeocodeCache, normalize_address
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = GeocodeCache(tmp_path / "geocode", max_entries=10)
+    monkeypatch.setattr(geocode, "_disk_cache", cache)
+    monkeypatch.setattr(geocode, "_memo", type(geocode._memo)())
+    return cache
+
+
+@pytest.fixture
+def gazetteer(tmp_path, monkeypatch):
+    path = tmp_path / "gazetteer.csv"
+    path.write_text("calle,numero,lat,lon\n"
+                    "Carrer de Colón,1,39.4700,-0.3720\n"
+                    "Carrer de Colón,4,39.4702,-0.3722\n"
+                    "Carrer de Colón,7,39.4706,-0.3726\n",
+                    encoding="utf-8")
+    gaz = Gazetteer.from_csv(path)
+    monkeypatch.setattr(geocode, "_gazetteer", gaz)
+    monkeypatch.setattr(geocode, "_gazetteer_loaded", True)
+    return gaz
+
+
+def test_normalize_address():
+    assert normalize_address("  Calle  Colón,5 ,València ") == "calle colon, 5, valencia"
+
+
+def test_cache_ttl_and_negative_entries(cache):
+    cache.put("a", (39.47, -0.37))
+    cache.put("b", None)
+    assert cache.get("a") == (True, (39.47, -0.37))
+    assert cache.get("b") == (True, None)
+    # una entrada negativa caduca antes que una encontrada
+    for key in ("a", "b"):
+        path = cache._path(key)
+        entry = json.loads(path.read_text())
+        entry["ts"] = time.time() - 2 * 24 * 3600
+        path.write_text(json.dumps(entry))
+    assert cache.get("a") == (True, (39.47, -0.37))
+    assert cache.get("b") == (False, None)
+
+
+def test_cache_evicts_least_recently_used(cache):
+    for k in range(10):
+        cache.put(f"k{k}", (39.0, -0.3))
+        os.utime(cache._path(f"k{k}"), (k, k))
+    os.utime(cache._path("k0"))  # usada ahora: no se expulsa
+    cache.put("k10", (39.0, -0.3))
+    assert len(list(cache.directory.glob("*.json"))) == 9
+    assert cache.get("k0")[0]
+    assert not cache.get("k1")[0]
+
+
+def test_gazetteer_same_side_and_separate_number(gazetteer):
+    assert gazetteer.lookup("Calle Colón 5") == (39.4706, -0.3726)          # impar más cercano: 7
+    assert gazetteer.lookup("Calle Colón, 4, Valencia") == (39.4702, -0.3722)
+    assert gazetteer.lookup("Calle Colón, 46001") == (39.4702, -0.3722)     # sin número: la del medio
+    assert gazetteer.lookup("Avenida del Puerto 3") is None
+
+
+def test_offline_uses_cache_then_gazetteer(cache, gazetteer, monkeypatch):
+    def no_network(address):
+        raise AssertionError("no debe consultar Nominatim")
+
+    monkeypatch.setattr(geocode, "_nominatim", no_network)
+    cache.put(normalize_address("Plaza del Ayuntamiento"), (39.4699, -0.3763))
+    assert geocode.geocode_location("Plaza del Ayuntamiento", offline=True) == (39.4699, -0.3763)
+    assert geocode.geocode_location("Calle Colón, 4", offline=True) == (39.4702, -0.3722)
+    assert geocode.geocode_location("Calle Inventada 1", offline=True) is None
+
+
+def test_failed_cache_write_still_returns_result(cache, monkeypatch, caplog):
+    monkeypatch.setattr(geocode, "_nominatim", lambda address: (39.48, -0.38))
+
+    def read_only(key, result):
+        raise PermissionError("solo lectura")
+
+    monkeypatch.setattr(cache, "put", read_only)
+    assert geocode.geocode_location("Calle Nueva 1", offline=False) == (39.48, -0.38)
+    assert "No se pudo guardar" in caplog.text
+
+
+def test_network_error_falls_back_to_gazetteer(cache, gazetteer, monkeypatch):
+    def rate_limited(address):
+        raise geocode.RateLimited("HTTP 429")
+
+    monkeypatch.setattr(geocode, "_nominatim", rate_limited)
+    assert geocode.geocode_location("Calle Colón 1", offline=False) == (39.4700, -0.3720)
@@ -0,0 +1,107 @@
+import datetime as dt
+import multiprocessing as mp
+import zipfile
+
+import numpy as np
+import pytest
+
+from src import gtfs
+from src.gtfs import NO_SERVICE, Feed, Timetables, compile_feed
+from src.transit_network import Journey, Leg
+
+S1 = (39.4700, -0.4000)
+S2 = (39.4700, -0.3860)
+MARTES = dt.date(2026, 10, 13)
+DOMINGO = dt.date(2026, 10, 18)
+NAVIDAD = dt.date(2026, 12, 25)  # viernes sin servicio
+
+FEED = {
+    "stops.txt": "stop_id,stop_name,stop_lat,stop_lon\nS1,Uno,39.4700,-0.4000\nS2,Dos,39.4700,-0.3860\n",
+    "routes.txt": "route_id,route_short_name,route_type\nR5,L5,3\nR7,7,3\n",
+    "calendar.txt": "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+                    "LAB,1,1,1,1,1,0,0,20260101,20271231\n",
+    "calendar_dates.txt": "service_id,date,exception_type\nLAB,20261225,2\n",
+    "trips.txt": "route_id,service_id,trip_id\nR5,LAB,manana\nR5,LAB,noche\nR5,LAB,madrugada\nR5,LAB,temprano\n"
+                 "R7,LAB,cada10\n",
+    "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                      "manana,08:00:00,08:00:00,S1,1\nmanana,08:15:00,08:15:00,S2,2\n"
+                      "noche,23:50:00,23:50:00,S1,1\nnoche,24:05:00,24:05:00,S2,2\n"
+                      "madrugada,24:10:00,24:10:00,S1,1\nmadrugada,24:25:00,24:25:00,S2,2\n"
+                      "temprano,00:20:00,00:20:00,S1,1\ntemprano,00:35:00,00:35:00,S2,2\n"
+                      "cada10,10:00:00,10:00:00,S1,1\ncada10,10:08:00,10:08:00,S2,2\n",
+    "frequencies.txt": "trip_id,start_time,end_time,headway_secs\ncada10,10:00:00,12:00:00,600\n",
+}
+
+
+def _hms(h, m, s=0):
+    return h * 3600 + m * 60 + s
+
+
+@pytest.fixture
+def feed_zip(tmp_path):
+    path = tmp_path / "emt.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, text in FEED.items():
+            zf.writestr(name, text)
+    return path
+
+
+@pytest.fixture
+def feed(feed_zip, tmp_path):
+    compile_feed(feed_zip, tmp_path / "compiled")
+    return Feed.load("emt", tmp_path / "compiled")
+
+
+def _ride(feed, line, t, day):
+    return feed.next_ride(feed.routes("bus", line), feed.stops_near(*S1), feed.stops_near(*S2), t, day)
+
+
+def test_next_ride_late_evening_and_after_midnight(feed):
+    assert _ride(feed, "5", _hms(23, 45), MARTES) == (_hms(23, 50), _hms(24, 5))
+    assert _ride(feed, "5", _hms(23, 55), MARTES) == (_hms(24, 10), _hms(24, 25))
+    # el miércoles a las 00:02 aún pasa el viaje de las 24:10 del martes
+    assert _ride(feed, "5", _hms(0, 2), MARTES + dt.timedelta(days=1)) == (_hms(0, 10), _hms(0, 25))
+    # el domingo no hay servicio, pero a las 23:50 se espera al de las 00:20 del lunes
+    assert _ride(feed, "5", _hms(23, 50), DOMINGO) == (_hms(24, 20), _hms(24, 35))
+
+
+def test_calendar_exceptions_and_max_wait(feed):
+    assert _ride(feed, "5", _hms(7, 55), NAVIDAD) is None
+    assert _ride(feed, "5", _hms(2, 0), MARTES) is None  # la siguiente, a las 08:00: más de 2 h
+
+
+def test_frequency_based_trips(feed):
+    assert _ride(feed, "7", _hms(10, 5), MARTES) == (_hms(10, 10), _hms(10, 18))
+    assert _ride(feed, "7", _hms(11, 55), MARTES) is None  # el último sale a las 11:50
+
+
+class _Red:
+    lat = np.array([S1[0], S2[0]])
+    lon = np.array([S1[1], S2[1]])
+    walk_speed_kmh = 4.0
+
+
+def test_refine_waits_for_timetable_and_flags_no_service(feed):
+    horarios = Timetables([feed])
+    trayecto = Journey(17.0, (Leg("bus", "5", 0, 1, 12.0),), access_min=2.0, egress_min=3.0)
+    # sale 23:43, llega a la parada 23:45, bus de 23:50 a 00:05 y 3 min a pie
+    assert horarios.refine(_Red(), trayecto, dt.datetime.combine(MARTES, dt.time(23, 43))) == 25.0
+    assert horarios.ride("bus", "5", S1, S2, _hms(12, 0), DOMINGO) == NO_SERVICE
+    assert horarios.refine(_Red(), trayecto, dt.datetime.combine(DOMINGO, dt.time(12, 0))) is None
+    sin_horario = trayecto._replace(legs=(Leg("bus", "99", 0, 1, 12.0),))
+    assert horarios.refine(_Red(), sin_horario, dt.datetime.combine(DOMINGO, dt.time(12, 0))) == 17.0
+
+
+def _worker_timetables(_):
+    return [feed.stop_ids.tolist() for feed in gtfs.get_timetables().feeds]
+
+
+def test_pool_workers_compile_the_feed_once(feed_zip, tmp_path, monkeypatch):
+    monkeypatch.setattr(gtfs, "GTFS_DIR", tmp_path)
+    monkeypatch.setattr(gtfs, "COMPILED_DIR", tmp_path / "compiled")
+    monkeypatch.setattr(gtfs, "_TIMETABLES", None)
+    with mp.get_context("fork").Pool(4) as pool:
+        results = pool.map(_worker_timetables, range(8))
+    assert results == [[["S1", "S2"]]] * 8
+    assert gtfs.is_fresh(feed_zip, tmp_path / "compiled" / "emt")
+    assert not [p for p in (tmp_path / "compiled").iterdir() if ".tmp-" in p.name or ".old-" in p.name]
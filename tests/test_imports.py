@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+
+HEAVY = ("geopandas", "osmnx", "sklearn", "streamlit", "pydeck")
+
+
+def _modules_after_import(code: str) -> dict:
+    probe = code + (
+        "\nimport sys, json"
+        "\nfrom src.data_loader import REGISTRY"
+        f"\nprint(json.dumps({{'heavy': [m for m in {HEAVY!r} if m in sys.modules],"
+        " 'datasets': sorted(REGISTRY._frames)}))"
+    )
+    out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT_DIR, env=dict(os.environ),
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_planner_modules_import_without_heavy_dependencies_or_data():
+    result = _modules_after_import(
+        "import src.route_generator, src.route_cache, src.replanning, src.batch, src.service, src.map_layers")
+    assert result == {"heavy": [], "datasets": []}
+
+
+def test_lazy_stop_globals_still_resolve():
+    result = _modules_after_import(
+        "import src.route_generator as rg\nassert len(rg.BUS_INDEX) > 0 and 'lineas' in rg.GDF_BUS")
+    assert result["datasets"] == ["buses"]
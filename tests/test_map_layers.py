@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from src import map_layers
+from src.map_layers import layer_records, viewport_bounds
+
+VISTA = (39.47, -0.376, 15)
+
+
+@pytest.fixture(autouse=True)
+def limpio():
+    map_layers.clear()
+    yield
+    map_layers.clear()
+
+
+@pytest.fixture
+def monumentos(make_points):
+    rng = np.random.default_rng(3)
+    lats = 39.47 + rng.uniform(-0.1, 0.1, 500)
+    lons = -0.376 + rng.uniform(-0.1, 0.1, 500)
+    return make_points(lats, lons, lon=lons, lat=lats, nombre=[f"M{i}" for i in range(500)])
+
+
+def test_records_are_minimal_and_cached(monumentos):
+    records = layer_records("monuments", gdf=monumentos)
+    assert len(records) == 500
+    assert set(records[0]) == {"lon", "lat", "tooltip"}
+    assert records[0]["tooltip"] == "M0"
+    assert layer_records("monuments", gdf=monumentos) is records
+    # otra vista u otros datos, otra lista
+    assert layer_records("monuments", VISTA, gdf=monumentos) is not records
+    moved = monumentos.assign(lat=monumentos["lat"] + 0.01)
+    assert layer_records("monuments", gdf=moved)[0]["lat"] == pytest.approx(records[0]["lat"] + 0.01)
+
+
+def test_view_culls_points_outside(monumentos):
+    lat_min, lat_max, lon_min, lon_max = viewport_bounds(*VISTA)
+    inside = ((monumentos["lat"].round(5).between(lat_min, lat_max))
+              & (monumentos["lon"].round(5).between(lon_min, lon_max)))
+    records = layer_records("monuments", VISTA, gdf=monumentos)
+    assert 0 < len(records) < len(monumentos)
+    assert sorted(r["tooltip"] for r in records) == sorted(monumentos.loc[inside, "nombre"])
+
+
+def test_nearby_views_share_records(monumentos):
+    records = layer_records("monuments", VISTA, gdf=monumentos)
+    assert layer_records("monuments", (VISTA[0] + 1e-5, VISTA[1], VISTA[2]), gdf=monumentos) is records
+
+
+def test_clusters_above_max_points(monumentos, monkeypatch):
+    monkeypatch.setattr(map_layers, "MAX_POINTS", 50)
+    records = layer_records("monuments", gdf=monumentos)
+    assert len(records) <= 50
+    assert all("r" in r for r in records)
+    counts = [int(r["tooltip"].split()[0]) if r["tooltip"].endswith("monumentos") else 1 for r in records]
+    assert sum(counts) == len(monumentos)
+
+
+def test_fixed_tooltip_layer(make_points):
+    gdf = make_points([39.47, 39.48], [-0.37, -0.38], lon=[-0.37, -0.38], lat=[39.47, 39.48])
+    assert [r["tooltip"] for r in layer_records("buses", gdf=gdf)] == ["Parada EMT", "Parada EMT"]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from src import network_distances
+from src.geo import haversine_many
+from src.network_distances import NetworkDistanceTable
+from src.walk_graph import CSRGraph
+from src.walk_routing import WalkRouter
+
+
+@pytest.fixture
+def table(grid_graph):
+    router = WalkRouter(CSRGraph.from_networkx(grid_graph))
+    g = router.graph
+    pos = [g.node_pos(n) for n in (1000, 1005, 1030, 1035, 1014)]
+    return NetworkDistanceTable.build(router, g.y[pos], g.x[pos]), router
+
+
+def test_table_matches_router_lengths(table):
+    table, router = table
+    for i in range(len(table)):
+        for j in range(len(table)):
+            expected = router.length((table.lon[i], table.lat[i]), (table.lon[j], table.lat[j]))
+            assert table.meters[i, j] == pytest.approx(expected, rel=1e-5)
+    assert table.detour > 1.0  # por una cuadrícula se camina más que en diagonal
+
+
+def test_unknown_points_use_straight_line_times_detour(table):
+    table, _ = table
+    straight = haversine_many(39.47, -0.38, [39.48], [-0.37])[0]
+    assert table.distance(39.47, -0.38, 39.48, -0.37) == pytest.approx(straight * table.detour)
+    row = table.from_point(table.lat[0], table.lon[0], [table.lat[3], 39.48], [table.lon[3], -0.37])
+    assert row[0] == pytest.approx(table.meters[0, 3])
+
+
+def test_matrix_for_dense_and_lazy_agree(table, monkeypatch):
+    table, _ = table
+    lats = np.append(table.lat, 39.48)
+    lons = np.append(table.lon, -0.37)
+    dense = np.asarray(table.matrix_for(lats, lons))
+    assert dense[1, 2] == pytest.approx(table.meters[1, 2])
+    monkeypatch.setattr(network_distances, "MAX_DENSE_POIS", 3)
+    lazy = NetworkDistanceTable(table.lat, table.lon, table.meters, table.detour).matrix_for(lats, lons)
+    rows = np.arange(len(lats))
+    np.testing.assert_allclose(lazy[np.ix_(rows, rows)], dense, rtol=1e-6)
+
+
+def test_save_load_and_planner_lookup(table, tmp_path, monkeypatch):
+    from src.route_generator import walk_distance
+
+    table, _ = table
+    table.save(tmp_path / "network.npz")
+    loaded = NetworkDistanceTable.load(tmp_path / "network.npz")
+    np.testing.assert_array_equal(loaded.meters, table.meters)
+    assert loaded.detour == pytest.approx(table.detour)
+
+    monkeypatch.setattr(network_distances, "_TABLE", loaded)
+    a, b = (table.lat[0], table.lon[0]), (table.lat[3], table.lon[3])
+    assert walk_distance(a, b, "network") == pytest.approx(table.meters[0, 3])
+    assert walk_distance(a, b, "network") > walk_distance(a, b, "haversine")
@@ -0,0 +1,92 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from src import poi_clusters
+from src.poi_clusters import elegir_barrios, get_clusters, planificar_dias, repartir_dias, restringir
+from src.poi_store import get_poi_store
+from src.route_generator import generar_ruta
+
+START = (39.4745, -0.3768)
+N = 1500
+
+
+@pytest.fixture(scope="module")
+def catalogo():
+    import geopandas as gpd
+
+    features = synthetic.monuments(N, np.random.default_rng(7))
+    gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    gdf["lon"], gdf["lat"] = gdf.geometry.x, gdf.geometry.y
+    return gdf
+
+
+def _visitas(pasos):
+    return [p["nombre"] for p in pasos if p["nombre"].startswith("MONUMENTO")]
+
+
+def test_clusters_partition_the_catalog(catalogo):
+    store = get_poi_store(catalogo)
+    clusters = get_clusters(store)
+    assert get_clusters(store) is clusters
+    assert len(clusters) == pytest.approx(N / poi_clusters.CLUSTER_SIZE, rel=0.2)
+    filas = np.concatenate([clusters.members(c) for c in range(len(clusters))])
+    assert sorted(filas.tolist()) == list(range(N))
+    assert all((clusters.labels[clusters.members(c)] == c).all() for c in range(len(clusters)))
+
+
+def test_neighbourhoods_grow_from_the_start_and_keep_mandatory_ones(catalogo):
+    clusters = get_clusters(get_poi_store(catalogo))
+    cuenta = np.bincount(clusters.labels, minlength=len(clusters))
+    lejos = int(np.argmax(np.hypot(clusters.lat - START[0], clusters.lon - START[1])))
+    elegidos = elegir_barrios(clusters, cuenta, START, 200, [lejos])
+    assert elegidos[0] == lejos
+    assert cuenta[elegidos].sum() >= 200 > cuenta[elegidos[:-1]].sum()
+    assert len(set(elegidos.tolist())) == len(elegidos)
+    sin_obligatorios = elegir_barrios(clusters, cuenta, START, 1, [])
+    cerca = np.hypot(clusters.lat - START[0], clusters.lon - START[1])
+    assert sin_obligatorios.tolist() == [int(np.argmin(cerca))]
+
+
+def test_restringir_keeps_order_and_mandatory_rows(catalogo):
+    store = get_poi_store(catalogo)
+    cand = store.candidates([], [])
+    lejano = store.nombres[np.argmax(np.hypot(store.lat - START[0], store.lon - START[1]))]
+    filas = restringir(store, cand, START, 240, [lejano])
+    assert 0 < len(filas) < len(cand) / 2
+    assert filas.tolist() == cand[np.isin(cand, filas)].tolist()  # mismo orden que cand
+    assert store.row_of(lejano) in filas
+
+
+def test_large_catalogs_plan_inside_the_chosen_neighbourhoods(catalogo, monkeypatch):
+    args = (START, dt.time(9), dt.time(13), [], [], "ninguno")
+    completa = generar_ruta(catalogo, *args)
+    monkeypatch.setattr(poi_clusters, "CLUSTERED_MIN_POIS", 1000)
+    por_barrios = generar_ruta(catalogo, *args)
+    store = get_poi_store(catalogo)
+    permitidas = set(store.nombres[restringir(store, store.candidates([], []), START, 240, [])].tolist())
+    assert set(_visitas(por_barrios)) <= permitidas
+    assert len(_visitas(por_barrios)) >= len(_visitas(completa)) - 1
+
+
+def test_multi_day_plans_do_not_repeat(catalogo):
+    store = get_poi_store(catalogo)
+    lejano = store.nombres[np.argmax(np.hypot(store.lat - START[0], store.lon - START[1]))]
+    dias = planificar_dias(catalogo, START, 3, dt.time(9), dt.time(13), [lejano], [], "ninguno")
+    assert len(dias) == 3 and all(_visitas(d) for d in dias)
+    visitas = [n for d in dias for n in _visitas(d)]
+    assert len(visitas) == len(set(visitas))
+    assert lejano in visitas
+    with pytest.raises(ValueError):
+        planificar_dias(catalogo, START, 0, dt.time(9), dt.time(13), [], [])
+
+
+def test_days_split_the_rows_into_equal_sectors(catalogo):
+    store = get_poi_store(catalogo)
+    filas = np.arange(0, N, 3)
+    partes = repartir_dias(store, filas, START, 4)
+    assert sorted(np.concatenate(partes).tolist()) == filas.tolist()
+    assert max(map(len, partes)) - min(map(len, partes)) <= 1
+    assert [len(p) for p in repartir_dias(store, filas, START, 1)] == [len(filas)]
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from src.poi_store import POIStore, get_poi_store
+
+
+@pytest.fixture
+def catalogo(make_points):
+    return make_points(
+        [39.470, 39.470, 39.472, 39.474, 39.476],
+        [-0.376, -0.376, -0.372, -0.370, -0.368],
+        nombre=["Lonja", "Lonja", "Catedral", "Museo", "Catedral"],
+        tipo=["Edificios históricos", "Edificios históricos", "Iglesias", "Museos", "Museos"],
+    )
+
+
+def test_duplicate_rows_are_stored_once(catalogo):
+    store = POIStore(catalogo)
+    assert len(store) == 4
+    assert list(store.pos) == [0, 2, 3, 4]
+    assert store.row_of("Catedral") == 1
+    assert store.dist.shape == (4, 4)
+    np.testing.assert_allclose(store.dist[0, 1], store.dist[1, 0])
+
+
+def test_candidates_filter_types_and_keep_mandatory_first(catalogo):
+    store = POIStore(catalogo)
+    # un nombre con dos tipos: se queda la primera fila que pasa el filtro
+    assert list(store.candidates(["Museos"], [])) == [2, 3]
+    assert list(store.candidates(["Museos"], ["Lonja"])) == [0, 2, 3]
+    assert list(store.candidates([], [])) == [0, 1, 2]
+
+
+def test_store_is_cached_and_read_only(catalogo):
+    store = get_poi_store(catalogo)
+    assert get_poi_store(catalogo.copy()) is store
+    with pytest.raises(ValueError):
+        store.lat[0] = 0.0
+    visitados = store.new_visited()
+    assert visitados.shape == (3,) and not visitados.any()
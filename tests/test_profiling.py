@@ -0,0 +1,57 @@
+import datetime as dt
+import json
+import threading
+
+from src.profiling import Profiler, active, count, stage, timed
+
+
+@timed("doble")
+def doble(x):
+    return 2 * x
+
+
+def test_nothing_is_recorded_without_profiler():
+    assert active() is None
+    with stage("suelta"):
+        pass
+    assert doble(2) == 4
+
+
+def test_stages_calls_and_counts(tmp_path):
+    with Profiler() as perfil:
+        for k in range(3):
+            with stage("bloque"):
+                doble(k)
+        count("aciertos", 5)
+    assert active() is None
+    filas = {r["etapa"]: r for r in perfil.summary()}
+    assert filas["bloque"]["llamadas"] == 3
+    assert filas["doble"]["llamadas"] == 3
+    assert (filas["aciertos"]["llamadas"], filas["aciertos"]["total_ms"]) == (5, 0.0)
+    perfil.to_json(tmp_path / "perfil.json")
+    assert json.loads((tmp_path / "perfil.json").read_text())["etapas"]
+
+
+def test_profilers_are_per_thread():
+    otros = []
+
+    def trabajo():
+        otros.append(active())
+        doble(1)
+
+    with Profiler() as perfil:
+        hilo = threading.Thread(target=trabajo)
+        hilo.start()
+        hilo.join()
+    assert otros == [None]
+    assert "doble" not in perfil.stats
+
+
+def test_route_stages_are_reported(monumentos):
+    from src.route_generator import generar_ruta
+
+    with Profiler() as perfil:
+        generar_ruta(monumentos, (39.4745, -0.3768), dt.time(9), dt.time(12), [], [], "ambos")
+    etapas = set(perfil.stats)
+    assert {"ruta.preparacion", "ruta.seleccion", "ruta.retorno"} <= etapas
+    assert perfil.wall_s > 0
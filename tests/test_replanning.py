@@ -0,0 +1,77 @@
+import datetime as dt
+
+import pytest
+
+from src.replanning import PlanRuta, planificar, replanificar
+
+PETICION = dict(start_coord=(39.4745, -0.3768), inicio_hora=dt.time(9), fin_hora=dt.time(13),
+                transporte="ninguno")
+
+
+def _nombres(plan):
+    return [p["nombre"] for p in plan.pasos]
+
+
+class RouterDeJuguete:
+    """Caminos rectos entre pasos; anota cuántos tramos le piden."""
+
+    def __init__(self):
+        self.tramos = 0
+
+    def route_legs(self, coords):
+        self.tramos += len(coords) - 1
+        return [[list(a), list(b)] for a, b in zip(coords[:-1], coords[1:])]
+
+
+def test_same_request_reuses_every_decision(monumentos):
+    plan = planificar(monumentos, **PETICION)
+    otro = replanificar(plan)
+    assert otro.reutilizados == len(plan.decisiones) > 0
+    assert otro.pasos == plan.pasos
+
+
+@pytest.mark.parametrize("fin", [dt.time(12), dt.time(13, 30), dt.time(15)])
+def test_new_end_time_matches_a_fresh_plan(monumentos, fin):
+    plan = planificar(monumentos, **PETICION)
+    otro = replanificar(plan, fin_hora=fin)
+    assert otro.pasos == planificar(monumentos, **dict(PETICION, fin_hora=fin)).pasos
+    assert 0 < otro.reutilizados <= len(plan.decisiones)
+
+
+def test_new_mandatory_stop_matches_a_fresh_plan(monumentos):
+    primero = _nombres(planificar(monumentos, **PETICION))[5]  # el tercer monumento visitado
+    plan = planificar(monumentos, **dict(PETICION, imprescindibles=[primero]))
+    lejano = monumentos["nombre"].iloc[-1]
+    otro = replanificar(plan, imprescindibles=[primero, lejano])
+    # el camino hacia el primer imprescindible no cambia
+    assert otro.reutilizados >= 1
+    assert otro.pasos == planificar(monumentos, **dict(PETICION, imprescindibles=[primero, lejano])).pasos
+    assert lejano in _nombres(otro)
+    # con uno nuevo delante, el voraz se orienta distinto desde el principio
+    assert replanificar(plan, imprescindibles=[lejano, primero]).reutilizados == 0
+
+
+def test_other_changes_start_over(monumentos):
+    plan = planificar(monumentos, **PETICION)
+    assert replanificar(plan, start_coord=(39.47, -0.38)).reutilizados == 0
+    assert replanificar(plan, transporte="bus").reutilizados == 0
+
+
+def test_unknown_fields_are_rejected(monumentos):
+    with pytest.raises(TypeError):
+        PlanRuta(monumentos, dict(PETICION, hora_fin=dt.time(14)))
+
+
+def test_geometry_only_routes_new_legs(monumentos):
+    router = RouterDeJuguete()
+    plan = planificar(monumentos, **PETICION)
+    caminos = plan.geometria(router)
+    assert router.tramos == len(plan.coords) - 1 == len(caminos)
+    assert plan.geometria(router) == caminos and router.tramos == len(caminos)
+
+    otro = replanificar(plan, fin_hora=dt.time(12))
+    router.tramos = 0
+    nuevos = otro.geometria(router)
+    pares = list(zip(otro.coords[:-1], otro.coords[1:]))
+    assert router.tramos == sum(par not in plan.caminos for par in pares)
+    assert nuevos == [[list(a), list(b)] for a, b in pares]
@@ -0,0 +1,63 @@
+import datetime as dt
+import itertools
+
+from src.route_cache import RouteCache, generar_ruta_cached, iter_ruta_cached
+
+START = (39.4745, -0.3768)
+ARGS = (dt.time(9, 0), dt.time(11, 0), [], [], "ninguno")
+
+
+def test_key_is_canonical():
+    cache = RouteCache()
+    base = dict(incluir_pausa_comida=True, engine="greedy", time_limit_s=0.2, walk_metric="haversine",
+                datasets="d")
+    k1 = cache.key((1, 2), "09:00", dt.time(18), [" Lonja ", "Lonja", ""], ["Museos", "Iglesias", "Museos"],
+                   "Ambos", **base)
+    k2 = cache.key((1, 2), dt.time(9), "18:00", ["Lonja"], ["Iglesias", "Museos"], "ambos", **base)
+    assert k1 == k2
+    # el orden de los imprescindibles sí cuenta: el voraz persigue primero al primero
+    assert cache.key((1, 2), "09:00", "18:00", ["A", "B"], [], "ambos", **base) != \
+        cache.key((1, 2), "09:00", "18:00", ["B", "A"], [], "ambos", **base)
+    assert cache.key((1, 3), "09:00", "18:00", ["Lonja"], [], "ambos", **base) != k2
+
+
+def test_nearby_starts_share_an_entry_and_keep_their_coordinates(monumentos):
+    cache = RouteCache()
+    a = (START[0] + 0.00001, START[1])
+    b = (START[0] + 0.00003, START[1] + 0.00002)
+    assert cache.quantize(a)[0] == cache.quantize(b)[0]
+
+    ruta_a = generar_ruta_cached(monumentos, a, *ARGS, cache=cache)
+    ruta_b = generar_ruta_cached(monumentos, b, *ARGS, cache=cache)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert [p["nombre"] for p in ruta_a] == [p["nombre"] for p in ruta_b]
+    # el primer tramo sale del alojamiento y el último vuelve a él
+    assert ruta_b[-1]["nombre"] == "Retorno al alojamiento"
+    assert (ruta_b[0]["lat"], ruta_b[0]["lon"]) == b
+    assert (ruta_b[-1]["lat"], ruta_b[-1]["lon"]) == b
+
+
+def test_hits_return_fresh_copies(monumentos):
+    cache = RouteCache()
+    ruta = generar_ruta_cached(monumentos, START, *ARGS, cache=cache)
+    ruta[0]["nombre"] = "cambiado"
+    assert generar_ruta_cached(monumentos, START, *ARGS, cache=cache)[0]["nombre"] != "cambiado"
+
+
+def test_partial_iteration_is_not_stored(monumentos):
+    cache = RouteCache()
+    list(itertools.islice(iter_ruta_cached(monumentos, START, *ARGS, cache=cache), 1))
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_hit_replays_decisions(monumentos, tmp_path):
+    registro = []
+    ruta = generar_ruta_cached(monumentos, START, *ARGS, cache=RouteCache(directory=tmp_path))
+    list(iter_ruta_cached(monumentos, START, *ARGS, cache=RouteCache(directory=tmp_path / "otro"),
+                          registro=registro))
+
+    otro_proceso = RouteCache(directory=tmp_path)
+    replay = []
+    assert list(iter_ruta_cached(monumentos, START, *ARGS, cache=otro_proceso, registro=replay)) == ruta
+    assert otro_proceso.stats()["disk_hits"] == 1
+    assert replay == registro and replay
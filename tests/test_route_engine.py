@@ -0,0 +1,86 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from src import route_engine
+from src.route_engine import OrienteeringProblem
+
+
+def _instance(seed: int, n: int = 20) -> np.ndarray:
+    """Minutos enteros entre n+1 puntos al azar de un cuadrado de 60 min de lado."""
+    pts = np.random.default_rng(seed).uniform(0, 60, (n + 1, 2))
+    return np.ceil(np.hypot(*(pts[:, None, :] - pts[None, :, :]).transpose(2, 0, 1))).astype(np.int64)
+
+
+def _greedy(problem: OrienteeringProblem) -> list:
+    """El voraz de ``route_generator``: siempre al más cercano, mientras quepa."""
+    route, pending = [], set(range(1, problem.n + 1))
+    while pending:
+        prev = route[-1] if route else 0
+        node = min(pending, key=lambda k: (problem.cost[prev, k], k))
+        if not problem.feasible(route + [node]):
+            break
+        route.append(node)
+        pending.remove(node)
+    return route
+
+
+def test_lunch_only_when_arriving_inside_window():
+    cost = np.array([[0, 10, 10], [10, 0, 10], [10, 10, 0]])
+    lunch = (13 * 60 + 30, 14 * 60 + 30, 60)
+    dentro = OrienteeringProblem(cost, np.zeros(2, bool), 13 * 60 + 20, 20 * 60, 25, lunch=lunch)
+    assert dentro.finish_time([1]) == 13 * 60 + 30 + 60 + 25 + 10  # llega 13:30, come y vuelve
+    tarde = OrienteeringProblem(cost, np.zeros(2, bool), 14 * 60 + 30, 20 * 60, 25, lunch=lunch)
+    assert tarde.finish_time([1]) == 14 * 60 + 40 + 25 + 10  # llega 14:40: ya no hay pausa
+
+
+def test_mandatory_stops_come_first():
+    cost = _instance(3, n=12)
+    mandatory = np.zeros(12, bool)
+    mandatory[[7, 10]] = True  # nodos 8 y 11
+    problem = OrienteeringProblem(cost, mandatory, 540, 660, 10, lunch=None, return_to_start=False)
+    route = route_engine.solve(problem, time_limit_s=0.3)
+    assert {8, 11} <= set(route)
+    assert problem.feasible(route)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_never_fewer_visits_than_greedy(seed):
+    problem = OrienteeringProblem(_instance(seed), np.zeros(20, bool), 540, 780, 10,
+                                  lunch=None, return_to_start=False)
+    route = route_engine.solve(problem, time_limit_s=1.0)
+    assert problem.feasible(route)
+    assert len(set(route)) == len(route)
+    assert len(route) >= len(_greedy(problem))
+
+
+def test_stops_early_when_everything_fits():
+    problem = OrienteeringProblem(_instance(0, n=5), np.zeros(5, bool), 540, 1200, 10, lunch=None)
+    t0 = dt.datetime.now()
+    route = route_engine.solve(problem, time_limit_s=5.0)
+    assert sorted(route) == [1, 2, 3, 4, 5]
+    assert (dt.datetime.now() - t0).total_seconds() < 1.0
+
+
+def _visits(itin) -> int:
+    return sum(1 for p in itin if not p["nombre"].startswith(("Tramo hacia", "Retorno", "Pausa")))
+
+
+def test_generar_ruta_optimized_visits_at_least_greedy(monumentos):
+    from benchmarks.synthetic import CENTER
+    from src.route_generator import generar_ruta
+
+    for d_lat, d_lon in ((0, 0), (0.01, -0.01), (-0.01, 0.015)):
+        start = (CENTER[0] + d_lat, CENTER[1] + d_lon)
+        args = (monumentos, start, dt.time(9, 0), dt.time(14, 0), [], [], "ninguno")
+        greedy = generar_ruta(*args, engine="greedy")
+        optimized = generar_ruta(*args, engine="optimized", time_limit_s=1.0)
+        assert _visits(optimized) >= _visits(greedy)
+
+
+def test_unknown_engine_is_rejected(monumentos):
+    from src.route_generator import generar_ruta
+
+    with pytest.raises(ValueError):
+        generar_ruta(monumentos, (39.47, -0.376), dt.time(9), dt.time(12), [], [], "ninguno", engine="ils")
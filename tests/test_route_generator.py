@@ -0,0 +1,22 @@
+import datetime as dt
+
+import pytest
+
+from src.route_generator import generar_ruta, iter_ruta
+
+START = (39.4745, -0.3768)
+
+
+def test_iter_ruta_yields_the_same_steps_progressively(monumentos):
+    registro = []
+    pasos = iter_ruta(monumentos, START, dt.time(9), dt.time(14), [], [], "ninguno", registro=registro)
+    primero = next(pasos)
+    decididas = len(registro)
+    resto = list(pasos)
+    assert [primero] + resto == generar_ruta(monumentos, START, dt.time(9), dt.time(14), [], [], "ninguno")
+    assert decididas == 1 < len(registro)  # el primer paso sale antes de decidir los demás
+
+
+def test_iter_ruta_validates_when_called():
+    with pytest.raises(ValueError):
+        iter_ruta(None, START, dt.time(9), dt.time(14), [], [], "ninguno", walk_metric="manhattan")
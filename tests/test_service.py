@@ -0,0 +1,93 @@
+import http.client
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from src.batch import run_request
+from src.service import RoutingClient, RoutingService, ServiceError, _handler
+
+PETICION = {"id": "h1", "start": [39.4745, -0.3768], "inicio": "09:00", "fin": "12:00", "transporte": "ninguno"}
+
+
+@pytest.fixture(scope="module")
+def servidor():
+    service = RoutingService(workers=1, queue=1)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(service))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+def _post(address, path, body: bytes):
+    conn = http.client.HTTPConnection(*address, timeout=30)
+    try:
+        conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read())
+    finally:
+        conn.close()
+
+
+def test_route_matches_the_batch_worker(servidor):
+    client = RoutingClient("http://%s:%d" % servidor)
+    itinerario = client.ruta(PETICION)
+    assert [p["nombre"] for p in itinerario] == [p["nombre"] for p in run_request(PETICION)["itinerario"]]
+    estado = client.estado()
+    assert estado["workers"] == 1 and estado["capacidad"] == 2
+    assert estado["atendidas"] >= 1 and estado["en_curso"] == 0
+
+
+def test_walk_paths_without_a_street_graph_are_straight(servidor):
+    client = RoutingClient("http://%s:%d" % servidor)
+    coords = [[-0.37, 39.47], [-0.38, 39.48], [-0.39, 39.47]]
+    assert client.caminos(coords) == [[coords[0], coords[1]], [coords[1], coords[2]]]
+    assert client.caminos(coords[:1]) == []
+
+
+@pytest.mark.parametrize("path, body, status", [
+    ("/ruta", b"{no es json", 400),
+    ("/ruta", b"[1, 2]", 400),
+    ("/caminos", b'{"coords": [[1, 2], [3]]}', 400),
+    ("/caminos", b'{"coords": [[true, 2], [3, 4]]}', 400),
+    ("/otra", b"{}", 404),
+    ("/ruta", json.dumps(dict(PETICION, fin="no")).encode(), 422),
+])
+def test_bad_requests_get_an_error_response(servidor, path, body, status):
+    code, payload = _post(servidor, path, body)
+    assert code == status and "error" in payload
+
+
+def test_client_raises_service_errors(servidor):
+    client = RoutingClient("http://%s:%d" % servidor)
+    with pytest.raises(ServiceError) as e:
+        client.ruta(dict(PETICION, engine="otro"))
+    assert e.value.status == 422
+    with pytest.raises(ServiceError) as e:
+        RoutingClient("http://127.0.0.1:1", timeout_s=2).estado()
+    assert e.value.status == 0
+
+
+def test_admission_is_bounded_and_slow_work_times_out():
+    service = RoutingService(workers=1, queue=0, timeout_s=0.3)
+    try:
+        service.warm_up()
+        with pytest.raises(ServiceError) as e:
+            service.submit(time.sleep, 1.0)
+        assert e.value.status == 504
+        # el trabajo sigue ocupando el único hueco hasta que acaba de verdad
+        with pytest.raises(ServiceError) as e:
+            service.submit(time.sleep, 0)
+        assert e.value.status == 503
+        time.sleep(1.0)
+        assert service.submit(abs, -3) == 3
+        assert service.status() == {"workers": 1, "capacidad": 1, "en_curso": 0, "atendidas": 1,
+                                    "rechazadas": 1, "timeouts": 1}
+    finally:
+        service.shutdown()
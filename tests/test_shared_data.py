@@ -0,0 +1,116 @@
+import multiprocessing as mp
+import stat
+import time
+
+import numpy as np
+
+from src import shared_data
+from src.shared_data import attach, build_lock, get_shared, publish, save_arrays
+
+GRANDE = np.arange(shared_data.MIN_SHARED_BYTES // 8 + 1, dtype=np.float64)
+
+
+def _build(calls):
+    def build():
+        calls.append(1)
+        return {"a": GRANDE, "b": np.array([1, 2, 3])}, {"n": 3}
+
+    return build
+
+
+def test_get_shared_publishes_once_and_maps_it(tmp_path):
+    calls = []
+    first = get_shared("tabla", "f" * 40, _build(calls), tmp_path)
+    second = get_shared("tabla", "f" * 40, _build(calls), tmp_path)
+    assert calls == [1]
+    assert first.shared and second.shared and second.meta == {"n": 3}
+    assert isinstance(second["a"], np.memmap) and not second["a"].flags.writeable
+    np.testing.assert_array_equal(second["a"], GRANDE)
+    assert attach("tabla", "e" * 40, tmp_path) is None
+
+
+def test_small_bundles_stay_in_memory(tmp_path):
+    bundle = get_shared("chica", "f" * 40, lambda: ({"a": np.ones(4)}, {}), tmp_path)
+    assert not bundle.shared and not bundle["a"].flags.writeable
+    assert not (tmp_path / "chica" / ("f" * 24)).exists()
+
+
+def test_unwritable_directory_falls_back_to_a_private_copy(tmp_path):
+    blocked = tmp_path / "fichero"
+    blocked.write_text("")  # no se puede crear nada debajo (ni siendo root)
+    bundle = get_shared("tabla", "f" * 40, _build([]), blocked)
+    assert not bundle.shared
+    np.testing.assert_array_equal(bundle["a"], GRANDE)
+
+
+def test_old_versions_are_pruned(tmp_path):
+    for i in range(shared_data.KEEP_VERSIONS + 2):
+        publish("tabla", str(i) * 40, {"a": np.arange(3)}, directory=tmp_path)
+        time.sleep(0.01)  # fechas de modificación distintas
+    kept = sorted(p.name for p in (tmp_path / "tabla").iterdir() if p.is_dir())
+    assert len(kept) == shared_data.KEEP_VERSIONS
+    assert attach("tabla", "0" * 40, tmp_path) is None
+    assert attach("tabla", str(shared_data.KEEP_VERSIONS + 1) * 40, tmp_path) is not None
+
+
+def test_published_files_follow_the_umask(tmp_path):
+    bundle = publish("tabla", "f" * 40, {"a": np.arange(3)}, directory=tmp_path)
+    assert bundle.shared
+    path = tmp_path / "tabla" / ("f" * 24)
+    assert stat.S_IMODE(path.stat().st_mode) == 0o777 & ~shared_data._UMASK
+
+
+def test_save_arrays_replaces_the_directory(tmp_path):
+    target = tmp_path / "grafo"
+    save_arrays(target, {"x": np.arange(3), "y": np.ones(2)}, {"v": 1})
+    save_arrays(target, {"x": np.arange(5)}, {"v": 2})
+    assert sorted(p.name for p in target.iterdir()) == ["meta.json", "x.npy"]
+    np.testing.assert_array_equal(np.load(target / "x.npy"), np.arange(5))
+    assert [p.name for p in tmp_path.iterdir()] == ["grafo"]  # sin temporales ni restos
+
+
+def _critical_section(directory, log):
+    with build_lock(directory / "obra"):
+        with open(log, "a") as fh:
+            fh.write("entra\n")
+        time.sleep(0.05)
+        with open(log, "a") as fh:
+            fh.write("sale\n")
+
+
+def test_build_lock_serializes_processes(tmp_path):
+    log = tmp_path / "log.txt"
+    ctx = mp.get_context("fork")
+    procs = [ctx.Process(target=_critical_section, args=(tmp_path, log)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert [p.exitcode for p in procs] == [0] * 4
+    assert log.read_text().split() == ["entra", "sale"] * 4
+
+
+def _get_shared_in_child(directory, queue):
+    marks = directory / "builds"
+
+    def build():
+        with open(marks, "a") as fh:
+            fh.write("x")
+        time.sleep(0.05)
+        return {"a": GRANDE}, {}
+
+    bundle = get_shared("tabla", "c" * 40, build, directory)
+    queue.put((bundle.shared, float(bundle["a"][-1])))
+
+
+def test_concurrent_get_shared_builds_once(tmp_path):
+    ctx = mp.get_context("fork")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_get_shared_in_child, args=(tmp_path, queue)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    results = [queue.get(timeout=30) for _ in procs]
+    for p in procs:
+        p.join()
+    assert (tmp_path / "builds").read_text() == "x"
+    assert results == [(True, float(GRANDE[-1]))] * 4
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from src.geo import haversine_many
+from src.spatial_index import StopIndex
+
+# Tres paradas en un eje norte-sur junto a la plaza del Ayuntamiento
+LATS = [39.4699, 39.4720, 39.4760]
+LONS = [-0.3763, -0.3763, -0.3763]
+
+
+@pytest.fixture
+def paradas(make_points):
+    return make_points(LATS, LONS, lineas=["1, 2", "2,3", "4"])
+
+
+def test_nearest_within_max_dist_in_metres(paradas):
+    index = StopIndex(paradas)
+    pos, dist = index.nearest(39.4701, -0.3763, max_dist=400)
+    assert pos == 0
+    assert dist == pytest.approx(haversine_many(39.4701, -0.3763, [LATS[0]], [LONS[0]])[0], rel=1e-6)
+    # ~0.002° son ~220 m: fuera de 100 m, aunque en grados la distancia sea diminuta
+    assert index.nearest(39.4741, -0.3763, max_dist=100) is None
+
+
+def test_mask_restricts_candidates(paradas):
+    index = StopIndex(paradas)
+    pos, _ = index.nearest(39.4701, -0.3763, max_dist=1000, mask=np.array([False, True, True]))
+    assert pos == 1
+
+
+def test_queries_match_brute_force(make_points):
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(39.44, 39.50, 300), rng.uniform(-0.41, -0.34, 300)
+    index = StopIndex(make_points(lats, lons))
+    for lat, lon in zip(rng.uniform(39.44, 39.50, 20), rng.uniform(-0.41, -0.34, 20)):
+        brute = haversine_many(lat, lon, lats, lons)
+        idx, dist = index.query_nearest(lat, lon, k=3)
+        assert list(idx) == list(np.argsort(brute)[:3])
+        np.testing.assert_allclose(dist, np.sort(brute)[:3], rtol=1e-6)
+        idx, dist = index.query_radius(lat, lon, 500)
+        assert set(idx) == set(np.flatnonzero(brute <= 500))
+        assert np.all(np.diff(dist) >= 0)
+
+
+def test_index_does_not_touch_the_layer(paradas):
+    columns = list(paradas.columns)
+    index = StopIndex(paradas)
+    index.nearest(39.47, -0.3763)
+    assert list(paradas.columns) == columns
+    with pytest.raises(ValueError):
+        index.lat[0] = 0.0
+
+
+def test_nearest_stop_returns_layer_row(paradas):
+    from src.route_generator import nearest_stop
+
+    row = nearest_stop(StopIndex(paradas), -0.3763, 39.4758)
+    assert row["lineas"] == "4"
+    assert nearest_stop(StopIndex(paradas), -0.3763, 39.50) is None
+
+
+def test_parse_lines_strips_whitespace():
+    from src.spatial_index import parse_lines
+
+    assert parse_lines(" 10, 9,N6 ,") == {"10", "9", "N6"}
+    assert parse_lines(None) == frozenset()
+    assert parse_lines(float("nan")) == frozenset()
+
+
+def test_line_index_nearest_on_lines(paradas):
+    from src.spatial_index import LineIndex
+
+    lines = LineIndex(StopIndex(paradas), "lineas")
+    assert list(lines.line_stops["2"]) == [0, 1]
+    assert lines.lines_at(1) == {"2", "3"}
+    # desde el norte, la parada más cercana de la línea 2 es la central, no la 4
+    pos, dist = lines.nearest_on_lines(39.4765, -0.3763, {"2"}, max_dist=1000)
+    assert pos == 1
+    assert lines.nearest_on_lines(39.4765, -0.3763, {"2"}, max_dist=100) is None
+    assert lines.nearest_on_lines(39.4765, -0.3763, {"99"}) is None
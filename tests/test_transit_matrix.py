@@ -0,0 +1,65 @@
+import os
+import stat
+import uuid
+
+import numpy as np
+import pytest
+
+from src.transit_matrix import SparseTransitMatrix, TransitMatrix
+
+LAT = [39.470, 39.475, 39.480, 39.475]  # la última repite la segunda
+LON = [-0.376, -0.370, -0.380, -0.370]
+
+
+class Legs:
+    """Tramos falsos: en bus si la línea tiene nombre, contando las llamadas."""
+
+    def __init__(self, line=None):
+        self.line = line
+        self.calls = 0
+
+    def __call__(self, origen, destino, option):
+        self.calls += 1
+        if self.line:
+            return True, f"bus línea {self.line}", 7.0
+        return False, "A pie", 20.0
+
+
+@pytest.fixture(params=[TransitMatrix, SparseTransitMatrix])
+def cls(request):
+    return request.param
+
+
+def test_leg_is_computed_once_and_shared_by_duplicates(cls):
+    compute = Legs("19")
+    tabla = cls(LAT, LON, "bus", uuid.uuid4().hex, compute)
+    assert len(tabla) == 3
+    assert tabla.leg(0, 1) == (True, "bus línea 19", 7.0)
+    assert tabla.leg(0, 3) == (True, "bus línea 19", 7.0)  # misma coordenada que la 1
+    assert compute.calls == 1
+    known = tabla.known_minutes([0, 1, 2])
+    assert known[0, 1] == 7.0 and np.isnan(known[1, 0])
+
+
+def test_flush_merges_cells_from_other_processes(cls):
+    huella = uuid.uuid4().hex
+    a = cls(LAT, LON, "bus", huella, Legs("19"))
+    b = cls(LAT, LON, "bus", huella, Legs("C1"))
+    a.leg(0, 1)
+    b.leg(1, 2)
+    a.flush()
+    b.flush()  # no debe borrar la celda que guardó a
+
+    c = cls(LAT, LON, "bus", huella, Legs())
+    assert c.load()
+    assert c.leg(0, 1) == (True, "bus línea 19", 7.0)
+    assert c.leg(1, 2) == (True, "bus línea C1", 7.0)
+
+
+def test_flush_uses_umask_permissions(cls):
+    tabla = cls(LAT, LON, "ninguno", uuid.uuid4().hex, Legs())
+    tabla.leg(0, 2)
+    tabla.flush()
+    mask = os.umask(0)
+    os.umask(mask)
+    assert stat.S_IMODE(tabla.path.stat().st_mode) == 0o666 & ~mask
@@ -0,0 +1,53 @@
+import pytest
+
+from src.geo import haversine_many
+from src.spatial_index import LineIndex, StopIndex
+from src.transit_network import TRANSFER_PENALTY_MIN, TransitNetwork
+
+# Bus A hacia el este y bus B hacia el norte, con una parada común en la esquina;
+# el metro 3 va en diagonal del principio de A al final de B.
+BUS = [
+    (39.4700, -0.4000, "A"), (39.4700, -0.3965, "A"), (39.4700, -0.3930, "A"), (39.4700, -0.3895, "A"),
+    (39.4700, -0.3860, "A,B"),
+    (39.4727, -0.3860, "B"), (39.4754, -0.3860, "B"), (39.4781, -0.3860, "B"), (39.4808, -0.3860, "B"),
+]
+METRO = [(39.4705, -0.3995, "3"), (39.4757, -0.3930, "3"), (39.4806, -0.3865, "3")]
+ORIGEN = (39.4702, -0.4002)
+DESTINO = (39.4810, -0.3858)
+
+
+@pytest.fixture
+def red(make_points):
+    def layer(rows, column):
+        gdf = make_points([r[0] for r in rows], [r[1] for r in rows], **{column: [r[2] for r in rows]})
+        stops = StopIndex(gdf)
+        return stops, LineIndex(stops, column)
+
+    return TransitNetwork.build({"bus": layer(BUS, "lineas"), "metro": layer(METRO, "linea")},
+                                tp_speed_kmh=30.0, walk_speed_kmh=4.0)
+
+
+def test_bus_journey_transfers_at_the_shared_stop(red):
+    journey = red.journey(ORIGEN, DESTINO, ("bus",))
+    assert [(leg.mode, leg.line) for leg in journey.legs] == [("bus", "A"), ("bus", "B")]
+    assert journey.line == "A → B"
+    assert journey.legs[0].alight == journey.legs[1].board == 4  # la esquina
+    ride = sum(leg.minutes for leg in journey.legs)
+    assert journey.minutes == pytest.approx(journey.access_min + ride + TRANSFER_PENALTY_MIN + journey.egress_min,
+                                            rel=1e-5)
+    walk = haversine_many(*ORIGEN, [DESTINO[0]], [DESTINO[1]])[0] / 1000 / 4.0 * 60
+    assert journey.minutes < walk
+
+
+def test_no_transfers_means_no_bus_journey(red):
+    assert red.journey(ORIGEN, DESTINO, ("bus",), max_transfers=0) is None
+
+
+def test_direct_metro_wins_when_allowed(red):
+    journey = red.journey(ORIGEN, DESTINO, ("bus", "metro"))
+    assert [(leg.mode, leg.line) for leg in journey.legs] == [("metro", "3")]
+    assert journey.minutes < red.journey(ORIGEN, DESTINO, ("bus",)).minutes
+
+
+def test_no_stops_nearby(red):
+    assert red.journey((39.50, -0.35), DESTINO, ("bus", "metro")) is None
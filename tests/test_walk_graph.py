@@ -0,0 +1,41 @@
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.sparse.csgraph import dijkstra
+
+from src.walk_graph import CSRGraph, is_fresh, load_walk_csr
+
+
+def test_from_networkx_keeps_shortest_parallel_edge(grid_graph):
+    graph = CSRGraph.from_networkx(grid_graph)
+    assert graph.n_nodes == 36
+    assert graph.n_edges == 2 * 2 * 5 * 6
+    dest, lengths = graph.neighbors(graph.node_pos(1000))
+    assert sorted(graph.node_ids[dest].tolist()) == [1001, 1006]
+    assert lengths.max() < 200
+
+
+def test_shortest_paths_match_networkx(grid_graph):
+    graph = CSRGraph.from_networkx(grid_graph)
+    dist = dijkstra(graph.to_scipy(), indices=graph.node_pos(1000))
+    expected = nx.single_source_dijkstra_path_length(nx.DiGraph(
+        (u, v, {"length": min(d["length"] for d in grid_graph[u][v].values())}) for u, v in grid_graph.edges()
+    ), 1000, weight="length")
+    for node, metres in expected.items():
+        assert dist[graph.node_pos(node)] == pytest.approx(metres, rel=1e-5)
+
+
+def test_save_and_mmap_load_round_trip(grid_graph, tmp_path):
+    graph = CSRGraph.from_networkx(grid_graph)
+    source = tmp_path / "walk.graphml"
+    source.write_text("<graphml/>")
+    graph.save(tmp_path / "csr", source=source)
+    assert is_fresh(tmp_path / "csr", source)
+
+    loaded = load_walk_csr(tmp_path / "csr", source)
+    assert isinstance(loaded.indices, np.memmap)
+    for name in ("node_ids", "x", "y", "indptr", "indices", "lengths"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(graph, name))
+
+    source.write_text("<graphml>cambiado</graphml>")
+    assert not is_fresh(tmp_path / "csr", source)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from src.walk_graph import CSRGraph
+from src.walk_routing import WalkRouter
+
+
+@pytest.fixture
+def router(grid_graph):
+    return WalkRouter(CSRGraph.from_networkx(grid_graph))
+
+
+def _coord(router, node_id, d=0.00005):
+    """(lon, lat) un poco desplazado del nodo OSM ``node_id``."""
+    g = router.graph
+    pos = g.node_pos(node_id)
+    return float(g.x[pos]) + d, float(g.y[pos]) + d
+
+
+def test_route_legs_match_single_paths(router, grid_graph):
+    alojamiento = _coord(router, 1000)
+    coords = [alojamiento, _coord(router, 1035), _coord(router, 1005), _coord(router, 1030), alojamiento]
+    legs = router.route_legs(coords)
+
+    fresh = WalkRouter(router.graph)
+    assert legs == [fresh.path(a, b) for a, b in zip(coords[:-1], coords[1:])]
+    assert legs[0][0] == [float(router.graph.x[0]), float(router.graph.y[0])]
+    assert router.length(coords[0], coords[1]) == pytest.approx(10 * 111.2, rel=0.05)
+
+
+def test_path_and_route_legs_snap_the_same_way(router):
+    """Con rejilla, ``path`` y ``route_legs`` usan el mismo nodo para un mismo punto."""
+
+    class Grid:  # rejilla que manda todos los puntos a un nodo fijo
+        def node_at(self, lat, lon):
+            return router.graph.node_pos(1014)
+
+    router.grid = Grid()
+    a, b = _coord(router, 1000), _coord(router, 1035)
+    assert router.snap(a) == router.graph.node_pos(1014)
+    assert router.route_legs([a, b]) == [router.path(a, b)]
+    assert list(router.snap_many([a, b])) == [router.snap(a), router.snap(b)]
+
+
+def test_disconnected_points_fall_back_to_straight_line(grid_graph):
+    G = grid_graph.copy()
+    G.add_node(1, x=-0.30, y=39.50)  # nodo aislado
+    router = WalkRouter(CSRGraph.from_networkx(G))
+    a, b = (-0.3799, 39.4701), (-0.30, 39.50)
+    assert router.path(a, b) == [list(a), list(b)]
+    assert np.isinf(router.length(a, b))